@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Constants
+TELNET_PORT = 23
+TELNET_TIMEOUT = 20
+ASYNC_TELNET_CONCURRENCY = 200  # Number of Telnet sessions kept open at once on the event loop
+READ_CHUNK_SIZE = 65536
+PROMPT_TAIL = 512  # Trailing characters checked for the device prompt and login messages
+
+logger = logging.getLogger(__name__)
+
+# Telnet protocol bytes (RFC 854)
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+
+# Regex
+USERNAME_PROMPT_RE = re.compile(r"(?:username|login)\s*:\s*$", re.IGNORECASE)
+PASSWORD_PROMPT_RE = re.compile(r"password\s*:\s*$", re.IGNORECASE)
+DEVICE_PROMPT_RE = re.compile(r"(?:^|\n)(?P<prompt>[\w.\-@()/:]{1,63}[>#])\s*$")
+AUTH_FAILED_RE = re.compile(r"%\s*(?:authentication failed|login invalid|bad passwords?|access denied)", re.IGNORECASE)
+
+class AsyncTelnetError(Exception):
+    pass
+
+class AsyncTelnetAuthError(AsyncTelnetError):
+    pass
+
+class AsyncTelnetSession:
+    # Telnet client tối giản chạy trên event loop: chỉ đủ để đăng nhập IOS và chạy lệnh show
+    def __init__(self, host: str, username: str, password: str, port: int = TELNET_PORT, timeout: float = TELNET_TIMEOUT):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.port = port
+        self.timeout = timeout
+        self.prompt: Optional[str] = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        # Đầu ra của lệnh đang chạy giữ dạng danh sách đoạn, chỉ ghép một lần khi thấy prompt;
+        # _tail là phần cuối đầu ra dùng để nhận dạng prompt mà không quét lại toàn bộ bảng
+        self._chunks: List[str] = []
+        self._tail = ""
+        self._iac_pending = b""
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout=self.timeout
+        )
+        await self._login()
+        await self.send_command("terminal length 0")
+
+    async def close(self):
+        if self._writer is None:
+            return
+        try:
+            self._writer.close()
+            await self._writer.wait_closed()
+        except Exception as e:
+            logger.debug(f"Lỗi khi đóng phiên Telnet bất đồng bộ đến {self.host}: {e}")
+        finally:
+            self._writer = None
+            self._reader = None
+
+    async def send_command(self, command: str) -> str:
+        if not self.prompt:
+            raise AsyncTelnetError(f"Phiên Telnet đến {self.host} chưa đăng nhập")
+        self._reset_output()
+        self._write(command + "\r\n")
+        output = await self._read_until_prompt()
+        return self._strip_command_and_prompt(output, command)
+
+    async def _login(self):
+        sent_username = False
+        sent_password = False
+        while True:
+            await self._read_some()
+            text = self._tail
+            if AUTH_FAILED_RE.search(text):
+                raise AsyncTelnetAuthError(f"Xác thực Telnet thất bại cho {self.host}")
+            if USERNAME_PROMPT_RE.search(text):
+                if sent_username and sent_password:
+                    raise AsyncTelnetAuthError(f"Xác thực Telnet thất bại cho {self.host}")
+                self._reset_output()
+                self._write(self.username + "\r\n")
+                sent_username = True
+                sent_password = False
+                continue
+            if PASSWORD_PROMPT_RE.search(text):
+                if sent_password:
+                    raise AsyncTelnetAuthError(f"Xác thực Telnet thất bại cho {self.host}")
+                self._reset_output()
+                self._write(self.password + "\r\n")
+                sent_password = True
+                continue
+            match = DEVICE_PROMPT_RE.search(text)
+            if match:
+                self.prompt = match.group("prompt")
+                self._reset_output()
+                return
+
+    async def _read_until_prompt(self) -> str:
+        while True:
+            await self._read_some()
+            if self._tail.rstrip().endswith(self.prompt):
+                return "".join(self._chunks)
+
+    async def _read_some(self) -> str:
+        data = await asyncio.wait_for(self._reader.read(READ_CHUNK_SIZE), timeout=self.timeout)
+        if not data:
+            raise AsyncTelnetError(f"Kết nối Telnet đến {self.host} bị đóng bởi thiết bị")
+        chunk = self._handle_iac(data).decode("utf-8", errors="ignore").replace("\r", "")
+        self._chunks.append(chunk)
+        self._tail = (self._tail + chunk)[-PROMPT_TAIL:]
+        return chunk
+
+    def _reset_output(self):
+        self._chunks = []
+        self._tail = ""
+
+    def _write(self, text: str):
+        self._writer.write(text.encode("utf-8"))
+
+    def _handle_iac(self, data: bytes) -> bytes:
+        # Từ chối mọi tùy chọn Telnet (giống hành vi mặc định của telnetlib) và loại bỏ chuỗi IAC khỏi dữ liệu
+        data = self._iac_pending + data
+        self._iac_pending = b""
+        clean = bytearray()
+        replies = bytearray()
+        i = 0
+        length = len(data)
+        while i < length:
+            byte = data[i]
+            if byte != IAC:
+                clean.append(byte)
+                i += 1
+                continue
+            if i + 1 >= length:
+                self._iac_pending = data[i:]
+                break
+            command = data[i + 1]
+            if command == IAC:
+                clean.append(IAC)
+                i += 2
+            elif command in (DO, DONT, WILL, WONT):
+                if i + 2 >= length:
+                    self._iac_pending = data[i:]
+                    break
+                option = data[i + 2]
+                if command == DO:
+                    replies.extend((IAC, WONT, option))
+                elif command == WILL:
+                    replies.extend((IAC, DONT, option))
+                i += 3
+            elif command == SB:
+                end = data.find(bytes((IAC, SE)), i + 2)
+                if end == -1:
+                    self._iac_pending = data[i:]
+                    break
+                i = end + 2
+            else:
+                i += 2
+        if replies and self._writer is not None:
+            self._writer.write(bytes(replies))
+        return bytes(clean)
+
+    def _strip_command_and_prompt(self, output: str, command: str) -> str:
+        lines = output.split("\n")
+        if lines and command.strip() and command.strip() in lines[0]:
+            lines = lines[1:]
+        if lines and lines[-1].strip().endswith(self.prompt):
+            lines = lines[:-1]
+        return "\n".join(lines)
+
+async def fetch_command_output(host: str, username: str, password: str, command: str,
+                               timeout: float = TELNET_TIMEOUT,
+                               on_auth_result: Optional[Callable[[str, bool], None]] = None) -> Tuple[Optional[str], str]:
+    # on_auth_result(host, đăng nhập thành công?) được gọi sau mỗi lần thiết bị chấp nhận/từ chối tài khoản
+    session = AsyncTelnetSession(host, username, password, timeout=timeout)
+    try:
+        await session.connect()
+        if on_auth_result is not None:
+            on_auth_result(host, True)
+        output = await session.send_command(command)
+        return output, f"Đã lấy '{command}' từ {host} qua Telnet bất đồng bộ"
+    except AsyncTelnetAuthError:
+        logger.error(f"Xác thực Telnet thất bại cho {host}")
+        if on_auth_result is not None:
+            on_auth_result(host, False)
+        return None, f"Xác thực Telnet thất bại cho {host}"
+    except (asyncio.TimeoutError, ConnectionError, OSError):
+        logger.warning(f"Hết thời gian hoặc lỗi kết nối Telnet đến {host}")
+        return None, f"Hết thời gian kết nối Telnet đến {host}"
+    except Exception as e:
+        logger.exception(f"Lỗi Telnet bất đồng bộ đến {host}: {type(e).__name__}")
+        return None, f"Lỗi kết nối Telnet đến {host}: {type(e).__name__}"
+    finally:
+        await session.close()
+
+async def collect_command_outputs(hosts: Iterable[str], username: str, password: str, command: str,
+                                  max_concurrency: int = ASYNC_TELNET_CONCURRENCY,
+                                  timeout: float = TELNET_TIMEOUT,
+                                  on_auth_result: Optional[Callable[[str, bool], None]] = None,
+                                  should_stop: Optional[Callable[[], bool]] = None) -> Dict[str, Tuple[Optional[str], str]]:
+    # Host chưa bắt đầu khi should_stop() trả về True sẽ bị bỏ qua và không có trong kết quả
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    host_list: List[str] = list(hosts)
+
+    async def _bounded(host: str) -> Optional[Tuple[Optional[str], str]]:
+        async with semaphore:
+            if should_stop is not None and should_stop():
+                return None
+            return await fetch_command_output(host, username, password, command, timeout=timeout,
+                                              on_auth_result=on_auth_result)
+
+    results = await asyncio.gather(*(_bounded(host) for host in host_list))
+    return {host: result for host, result in zip(host_list, results) if result is not None}
+
+def collect_mac_tables(hosts: Iterable[str], username: str, password: str,
+                       max_concurrency: int = ASYNC_TELNET_CONCURRENCY,
+                       timeout: float = TELNET_TIMEOUT,
+                       on_auth_result: Optional[Callable[[str, bool], None]] = None,
+                       should_stop: Optional[Callable[[], bool]] = None) -> Dict[str, Tuple[Optional[str], str]]:
+    # Dùng từ luồng worker (không phải luồng GUI): mỗi lần gọi tạo một event loop riêng
+    return asyncio.run(collect_command_outputs(hosts, username, password, "show mac address-table",
+                                               max_concurrency=max_concurrency, timeout=timeout,
+                                               on_auth_result=on_auth_result, should_stop=should_stop))
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Benchmark bộ phân tích `show interfaces status` (interface_status.parse_interfaces_status) trên stack nhiều cổng,
+# so với cách tách dòng cũ của enable_ho (lower() + kiểm tra chuỗi con + re.match không biên dịch mỗi dòng)
+#   python bench_interface_status.py --ports 500 5000
+import argparse
+import random
+import re
+import sys
+import time
+from typing import Callable, List, Tuple
+
+from interface_status import parse_interfaces_status, disabled_interfaces
+
+# Constants
+DEFAULT_PORTS = (48, 500, 5000)
+DEFAULT_REPEAT = 5
+MIN_MEASURE_SECONDS = 0.2
+PORTS_PER_MEMBER = 48
+NAMES = ("", "PC ke toan 01", "loop test phong B", "Printer-T3", "AP tang 2", "disabled by noc", "Camera-cong-chinh",
+         "Uplink-core-switch")
+STATUSES = ("connected",) * 6 + ("notconnect",) * 3 + ("disabled", "err-disabled")
+
+def generate_status_output(port_count: int, seed: int = 1) -> Tuple[str, int, int]:
+    # Trả về (đầu ra, số cổng, số cổng disabled/err-disabled); stack gồm các member 48 cổng, có dòng --More-- xen giữa
+    rng = random.Random(seed)
+    lines = ["", "Port      Name               Status       Vlan       Duplex  Speed Type"]
+    disabled = 0
+    for number in range(port_count):
+        member, index = divmod(number, PORTS_PER_MEMBER)
+        port = f"Gi{member + 1}/0/{index + 1}"
+        status = rng.choice(STATUSES)
+        disabled += status in ("disabled", "err-disabled")
+        vlan = "trunk" if index == PORTS_PER_MEMBER - 1 else str(rng.choice((1, 10, 20, 30, 100)))
+        duplex, speed = ("a-full", "a-1000") if status == "connected" else ("auto", "auto")
+        lines.append(f"{port:<9} {rng.choice(NAMES)[:18]:<18} {status:<12} {vlan:<10} {duplex:>6} {speed:>6} 10/100/1000BaseTX")
+        if index == PORTS_PER_MEMBER - 1 and number % 96 == 95:
+            lines.append(" --More-- ")
+    return "\r\n".join(lines), port_count, disabled
+
+def legacy_disabled_ports(output: str) -> int:
+    # Bản sao cách phân tích cũ của process_switch_enable_ho (chỉ để so sánh)
+    disabled_ports = []
+    for line in output.splitlines():
+        line_lower = line.lower()
+        if ("gi" in line_lower or "fa" in line_lower or "te" in line_lower) and "disabled" in line_lower:
+            parts = line.split()
+            if parts:
+                port_id = parts[0]
+                if re.match(r'^(Gi|Fa|Te|Eth)\d+([/\d.]*)?$', port_id, re.IGNORECASE):
+                    disabled_ports.append((port_id, " ".join(parts[1:-2]).lower()))
+    return len(disabled_ports)
+
+def parsed_all_ports(output: str) -> int:
+    return len(parse_interfaces_status(output))
+
+def parsed_disabled_ports(output: str) -> int:
+    return len(disabled_interfaces(output))
+
+def best_time(func: Callable[[str], int], output: str, repeat: int) -> Tuple[float, int]:
+    best = float("inf")
+    result = 0
+    for _ in range(repeat):
+        loops = 0
+        start = time.perf_counter()
+        while True:
+            result = func(output)
+            loops += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= MIN_MEASURE_SECONDS:
+                break
+        best = min(best, elapsed / loops)
+    return best, result
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark bộ phân tích show interfaces status")
+    parser.add_argument("--ports", type=int, nargs="+", default=list(DEFAULT_PORTS), help="Số cổng của mỗi stack giả lập")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Số lần đo, lấy lần nhanh nhất")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    errors: List[str] = []
+    print(f"{'Số cổng':>8} {'Tất cả (ms)':>12} {'cổng/s':>12} {'Disabled (ms)':>14} {'Cũ (ms)':>9} {'Disabled mới/cũ/đúng':>22}")
+    for port_count in args.ports:
+        output, expected_ports, expected_disabled = generate_status_output(port_count, seed=args.seed)
+        all_seconds, parsed_ports = best_time(parsed_all_ports, output, args.repeat)
+        if parsed_ports != expected_ports:
+            errors.append(f"{port_count} cổng: phân tích được {parsed_ports} bản ghi, cần {expected_ports}")
+        new_seconds, new_disabled = best_time(parsed_disabled_ports, output, args.repeat)
+        old_seconds, old_disabled = best_time(legacy_disabled_ports, output, args.repeat)
+        if new_disabled != expected_disabled:
+            errors.append(f"{port_count} cổng: tìm được {new_disabled} cổng disabled, cần {expected_disabled}")
+        print(f"{port_count:>8} {all_seconds * 1000:>12.2f} {expected_ports / all_seconds:>12,.0f} {new_seconds * 1000:>14.2f} "
+              f"{old_seconds * 1000:>9.2f} "
+              f"{f'{new_disabled}/{old_disabled}/{expected_disabled}':>22}", flush=True)
+
+    for error in errors:
+        print(f"LỖI: {error}")
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# Benchmark: tìm nhiều MAC (4 ký tự cuối) trong một bảng MAC lớn
+#   python bench_mac_matcher.py --targets 1000 --entries 50000
+import argparse
+import random
+import time
+from typing import Dict, List, Tuple
+
+from switch_core import parse_mac_table, find_mac_last4_in_parsed_table, match_mac_targets
+
+def generate_mac_table_output(entry_count: int, port_count: int = 48, seed: int = 1) -> str:
+    rng = random.Random(seed)
+    lines = [
+        "          Mac Address Table",
+        "-------------------------------------------",
+        "",
+        "Vlan    Mac Address       Type        Ports",
+        "----    -----------       --------    -----",
+    ]
+    for _ in range(entry_count):
+        mac = f"{rng.randrange(16 ** 4):04x}.{rng.randrange(16 ** 4):04x}.{rng.randrange(16 ** 4):04x}"
+        port = f"Gi1/0/{rng.randrange(1, port_count + 1)}"
+        lines.append(f" {rng.choice((10, 20, 30, 100))}    {mac}    DYNAMIC     {port}")
+    lines.append(f"Total Mac Addresses for this criterion: {entry_count}")
+    return "\n".join(lines)
+
+def legacy_match(entries: List[Dict[str, str]], targets: List[str]) -> Dict[str, List[Tuple[str, str, str, int]]]:
+    # Cách cũ: quét lại toàn bộ bảng cho mỗi mục tiêu, đếm MAC trên cổng bằng một lần quét nữa
+    result = {}
+    for target in targets:
+        found = []
+        for entry in entries:
+            if entry['mac'].replace('.', '').endswith(target):
+                port = entry['port']
+                count = sum(1 for e in entries if e['port'] == port)
+                found.append((entry['mac'], port, entry['vlan'], count))
+        result[target] = found
+    return result
+
+def timed(label: str, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed * 1000:10.1f} ms")
+    return result, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bộ so khớp nhiều MAC trên bảng MAC")
+    parser.add_argument("--targets", type=int, default=1000)
+    parser.add_argument("--entries", type=int, default=50000)
+    parser.add_argument("--skip-legacy", action="store_true", help="Bỏ qua cách quét cũ (rất chậm với bảng lớn)")
+    args = parser.parse_args()
+
+    output = generate_mac_table_output(args.entries)
+    table = parse_mac_table(output)
+    rng = random.Random(2)
+    present = [entry['mac'][-4:] for entry in rng.sample(table.entries, min(len(table), args.targets // 2))]
+    absent = [f"{rng.randrange(16 ** 4):04x}" for _ in range(args.targets - len(present))]
+    targets = sorted(set(present + absent))
+    print(f"Bảng MAC: {len(table)} mục, {len(targets)} mục tiêu (4 ký tự cuối)")
+
+    batch, batch_time = timed("match_mac_targets (theo lô)", match_mac_targets, table, targets, True)
+    indexed, _ = timed("find_mac_last4 từng mục tiêu", lambda: {t: find_mac_last4_in_parsed_table(table, t) for t in targets})
+    assert {t: sorted(v) for t, v in batch.items()} == {t: sorted(v) for t, v in indexed.items()}
+
+    if not args.skip_legacy:
+        legacy, legacy_time = timed("quét lại bảng cho từng mục tiêu", legacy_match, table.entries, targets)
+        assert {t: sorted(v) for t, v in batch.items()} == {t: sorted(v) for t, v in legacy.items()}
+        print(f"Tăng tốc so với cách cũ: {legacy_time / max(batch_time, 1e-9):.0f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# Benchmark và kiểm tra hồi quy cho bộ phân tích `show mac address-table` (MAC_TABLE_RE / parse_mac_table)
+#   python bench_mac_parser.py --save-baseline mac_parser_baseline.json    # lưu kết quả trên máy này
+#   python bench_mac_parser.py --baseline mac_parser_baseline.json         # mã thoát 1 nếu chậm/tốn bộ nhớ hơn ngưỡng
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+from switch_core import parse_mac_table, MacTableStreamParser
+
+# Constants
+DEFAULT_SIZES = (100, 1000, 10000, 50000, 200000)
+DEFAULT_THRESHOLD = 0.2  # Cho phép chậm hơn / tốn bộ nhớ hơn baseline tối đa 20%
+DEFAULT_REPEAT = 3
+MIN_MEASURE_SECONDS = 0.2  # Bảng nhỏ được phân tích lặp lại đến ít nhất chừng này thời gian để giảm nhiễu
+STREAM_CHUNK_SIZE = 65536  # Cỡ đoạn dữ liệu khi mô phỏng đọc từ kênh Telnet
+
+GARBAGE_LINES = (
+    "",
+    "--More--",
+    "          Multicast Entries",
+    "vlan    mac address     type        ports",
+    " 20     zzzz.1234.5678    DYNAMIC     Gi1/0/3",
+    "% Invalid input detected at '^' marker.",
+    "Total Mac Addresses for this criterion: 42",
+)
+
+def generate_mac_table_output(entry_count: int, seed: int = 1, garbage_ratio: float = 0.02) -> Tuple[str, int]:
+    # Trả về (đầu ra, số mục hợp lệ mà bộ phân tích phải tìm thấy)
+    rng = random.Random(seed)
+    lines = [
+        "          Mac Address Table",
+        "-------------------------------------------",
+        "",
+        "Vlan    Mac Address       Type        Ports",
+        "----    -----------       --------    -----",
+    ]
+    valid = 0
+    for number in range(entry_count):
+        mac = f"{rng.randrange(16 ** 4):04x}.{rng.randrange(16 ** 4):04x}.{rng.randrange(16 ** 4):04x}"
+        roll = rng.random()
+        if roll < garbage_ratio:
+            lines.append(rng.choice(GARBAGE_LINES))
+            continue
+        vlan = rng.choice((1, 10, 20, 30, 100, 4094))
+        if roll < 0.05:
+            lines.append(f" All    {mac}    STATIC      CPU")
+            continue
+        if roll < 0.06:
+            entry_type, port = "IGMP", f"Gi1/0/{rng.randrange(1, 49)},Gi1/0/{rng.randrange(1, 49)}"
+        elif roll < 0.10:
+            entry_type, port = "STATIC", f"Gi1/0/{rng.randrange(1, 49)}"
+        elif roll < 0.15:
+            entry_type, port = "DYNAMIC", f"Po{rng.randrange(1, 9)}"
+        elif roll < 0.18:
+            entry_type, port = "STATIC", f"Vl{vlan}"
+        elif roll < 0.25:
+            entry_type, port = "DYNAMIC", f"Te{rng.randrange(1, 3)}/1/{rng.randrange(1, 5)}"
+        else:
+            entry_type, port = "DYNAMIC", f"Gi{rng.randrange(1, 9)}/0/{rng.randrange(1, 49)}"
+        marker = "*" if number % 7 == 0 else " "
+        lines.append(f"{marker}{vlan:<4}    {mac}    {entry_type:<11} {port}")
+        valid += 1
+    lines.append(f"Total Mac Addresses for this criterion: {valid}")
+    return "\r\n".join(lines) if seed % 2 else "\n".join(lines), valid
+
+def parse_streamed(output: str) -> int:
+    parser = MacTableStreamParser()
+    for offset in range(0, len(output), STREAM_CHUNK_SIZE):
+        parser.feed(output[offset:offset + STREAM_CHUNK_SIZE])
+    return len(parser.close())
+
+def best_time(func, output: str, expected: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        loops = 0
+        start = time.perf_counter()
+        while True:
+            parsed = func(output)
+            loops += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= MIN_MEASURE_SECONDS:
+                break
+        if parsed != expected:
+            raise AssertionError(f"{func.__name__}: phân tích được {parsed} mục, cần {expected}")
+        best = min(best, elapsed / loops)
+    return best
+
+def parse_whole(output: str) -> int:
+    return len(parse_mac_table(output))
+
+def measure(output: str, expected: int, repeat: int) -> Dict[str, float]:
+    size_mb = len(output.encode("utf-8")) / 1e6
+    best = best_time(parse_whole, output, expected, repeat)
+    stream_best = best_time(parse_streamed, output, expected, repeat)
+
+    tracemalloc.start()
+    table = parse_mac_table(output)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del table
+    return {
+        "mb_per_s": size_mb / best,
+        "entries_per_s": expected / best,
+        "stream_mb_per_s": size_mb / stream_best,
+        "peak_kb": peak / 1024,
+        "bytes_per_entry": peak / max(expected, 1),
+    }
+
+def compare_with_baseline(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                          threshold: float) -> List[str]:
+    regressions = []
+    for size, current in results.items():
+        previous = baseline.get(size)
+        if not previous:
+            continue
+        for key in ("mb_per_s", "entries_per_s", "stream_mb_per_s"):
+            if current[key] < previous[key] * (1 - threshold):
+                regressions.append(f"{size} mục: {key} giảm từ {previous[key]:.1f} xuống {current[key]:.1f}")
+        if current["peak_kb"] > previous["peak_kb"] * (1 + threshold):
+            regressions.append(f"{size} mục: bộ nhớ đỉnh tăng từ {previous['peak_kb']:.0f} KB lên {current['peak_kb']:.0f} KB")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark và kiểm tra hồi quy bộ phân tích bảng MAC")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Số mục của mỗi bảng MAC giả lập")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Số lần đo, lấy lần nhanh nhất")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", help="File JSON kết quả trước đó để so sánh")
+    parser.add_argument("--save-baseline", help="Ghi kết quả lần chạy này ra file JSON")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Mức giảm hiệu năng / tăng bộ nhớ cho phép so với baseline (mặc định {DEFAULT_THRESHOLD})")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, float]] = {}
+    print(f"{'Số mục':>8} {'MB/s':>8} {'mục/s':>12} {'MB/s (đoạn)':>12} {'Bộ nhớ đỉnh':>12} {'byte/mục':>9}")
+    for size in args.sizes:
+        output, expected = generate_mac_table_output(size, seed=args.seed)
+        result = measure(output, expected, args.repeat)
+        results[str(size)] = result
+        print(f"{size:>8} {result['mb_per_s']:>8.1f} {result['entries_per_s']:>12,.0f} {result['stream_mb_per_s']:>12.1f} "
+              f"{result['peak_kb']:>9.0f} KB {result['bytes_per_entry']:>9.0f}", flush=True)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Đã lưu baseline vào {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        if regressions:
+            print("HỒI QUY so với baseline:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print(f"Không có hồi quy so với baseline (ngưỡng {args.threshold:.0%})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
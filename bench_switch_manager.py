@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# Benchmark: số switch xử lý mỗi phút cho từng chế độ, chạy task_worker trên các switch giả lập (fake_ios_server.py)
+#   python bench_switch_manager.py --switches 50 --max-workers 20 --latency 0.05 --mac-entries 2000
+# Cần quyền bind cổng 23 trên 127.0.1.x (root) vì connect_to_device luôn dùng cổng Telnet mặc định.
+import argparse
+import os
+import queue
+import random
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from fake_ios_server import FakeSwitch, FakeSwitchProfile, switch_addresses, DEFAULT_BASE_IP
+from reachability import sweep_reachability
+from switch_core import gui_queue, task_worker, mac_table_cache, phase_timings, MAX_CONCURRENT_SWITCHES, TELNET_PORT
+
+# Constants
+BENCH_MODES = ("mac_search", "last4_config", "full_mac_config", "vlan_switch", "enable_ho")
+SERVER_START_TIMEOUT = 30
+FAKE_SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_ios_server.py")
+
+def start_fake_server(args: argparse.Namespace, addresses: List[str]) -> subprocess.Popen:
+    command = [sys.executable, FAKE_SERVER_SCRIPT, "--switches", str(args.switches), "--base-ip", args.base_ip,
+               "--mac-entries", str(args.mac_entries), "--latency", str(args.latency), "--jitter", str(args.jitter),
+               "--login-latency", str(args.login_latency), "--fail-rate", str(args.fail_rate), "--seed", str(args.seed)]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Switch giả lập dừng với mã {server.returncode} (cần quyền bind cổng {TELNET_PORT}?)")
+        results = sweep_reachability(addresses, ports=(TELNET_PORT,), timeout=0.5, use_cache=False)
+        if all(TELNET_PORT in open_ports for open_ports, _ in results.values()):
+            return server
+        time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("Switch giả lập không sẵn sàng sau thời gian chờ")
+
+def pick_mac_targets(args: argparse.Namespace) -> List[str]:
+    # Lấy MAC có thật trong bảng của các switch giả lập (cùng seed với server) để chế độ MAC có việc để làm
+    profile = FakeSwitchProfile(mac_entries=args.mac_entries, seed=args.seed)
+    rng = random.Random(args.seed)
+    targets = []
+    for index in rng.sample(range(1, args.switches + 1), min(args.macs, args.switches)):
+        entries = FakeSwitch(index, profile).mac_entries
+        if entries:
+            targets.append(rng.choice(entries)[1])
+    return targets
+
+def run_mode(mode: str, args: argparse.Namespace, addresses: List[str], mac_targets: List[str]) -> Dict[str, float]:
+    task_details = {
+        "mode": mode,
+        "username": args.username,
+        "password": args.password,
+        "start_ip": addresses[0],
+        "end_ip": addresses[-1],
+        "source_vlan": "20",
+        "target_vlan": "200" if mode == "vlan_switch" else "100",
+        "mac_list": mac_targets if mode == "full_mac_config" else [mac[-4:] for mac in mac_targets],
+        "max_workers": args.max_workers,
+        "async_telnet": args.async_telnet and mode == "mac_search",
+        "refresh_mac_cache": True,
+        "tcp_precheck": True,
+    }
+    mac_table_cache.clear()
+    start = time.perf_counter()
+    task_worker(task_details)
+    duration = time.perf_counter() - start
+
+    errors = 0
+    while True:
+        try:
+            event = gui_queue.get_nowait()
+        except queue.Empty:
+            break
+        if event[0] == "log" and len(event) > 2 and event[2] == "ERROR":
+            errors += 1
+    total_p50 = phase_timings.summary().get("total", (0, 0.0, 0.0, 0.0))[1]
+    return {"seconds": duration, "per_minute": len(addresses) / duration * 60, "errors": errors, "total_p50": total_p50}
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo số switch xử lý mỗi phút của từng chế độ trên switch giả lập")
+    parser.add_argument("--switches", type=int, default=20)
+    parser.add_argument("--base-ip", default=DEFAULT_BASE_IP)
+    parser.add_argument("--modes", nargs="+", choices=BENCH_MODES, default=list(BENCH_MODES))
+    parser.add_argument("--max-workers", type=int, default=MAX_CONCURRENT_SWITCHES)
+    parser.add_argument("--async-telnet", action="store_true", help="mac_search dùng Telnet bất đồng bộ")
+    parser.add_argument("--macs", type=int, default=10, help="Số MAC cần tìm cho các chế độ MAC")
+    parser.add_argument("--mac-entries", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--login-latency", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="bench")
+    parser.add_argument("--external-server", action="store_true", help="Dùng switch giả lập đang chạy sẵn, không tự khởi động")
+    args = parser.parse_args()
+
+    addresses = switch_addresses(args.base_ip, args.switches)
+    server = None if args.external_server else start_fake_server(args, addresses)
+    try:
+        mac_targets = pick_mac_targets(args)
+        print(f"{args.switches} switch giả lập, {args.max_workers} switch song song, bảng MAC {args.mac_entries} mục, "
+              f"độ trễ {args.latency}s, tỉ lệ lỗi {args.fail_rate}")
+        print(f"{'Chế độ':<18} {'Thời gian (s)':>14} {'Switch/phút':>12} {'p50/switch (s)':>15} {'Lỗi':>5}")
+        for mode in args.modes:
+            result = run_mode(mode, args, addresses, mac_targets)
+            print(f"{mode:<18} {result['seconds']:>14.2f} {result['per_minute']:>12.1f} "
+                  f"{result['total_p50']:>15.2f} {result['errors']:>5}", flush=True)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from netmiko import ConnectHandler
+from interface_status import disabled_port_names
 import getpass
 
 def enable_disabled_ports(switch_ip, username, password):
@@ -16,11 +17,9 @@ commands = [
         # Find disabled ports
         output = net_connect.send_command("show int status")
         disabled_ports = []
-        for line in output.splitlines():
-            if "disabled" in line:
-                port = line.split()[0]
-                disabled_ports.append(port)
-                print(f"Found disabled port: {port}")
+        for port in disabled_port_names(output):
+            disabled_ports.append(port)
+            print(f"Found disabled port: {port}")
 
         # Enable disabled ports (confirmation prompt optional)
         if disabled_ports:
@@ -1,6 +1,6 @@
 from netmiko import ConnectHandler
 from getpass import getpass
-import time
+from port_range import range_config_commands
 
 ip = input("Nhập IP của switch: ")
 username = input("Nhập username: ")
@@ -19,16 +19,11 @@ connection = ConnectHandler(**cisco_device)
 # Lệnh cần gửi
 command = "no switchport port-security mac-address sticky 00a8.59fa.90fd"
 
-# Gửi lệnh tới từng cổng
-for i in range(1, 49):
-    config_commands = [
-        f'interface GigabitEthernet0/{i}',
-        command,
-        'exit'
-    ]
-    output = connection.send_config_set(config_commands)
-    print(output)  # In kết quả ra màn hình hoặc ghi vào file log
-    time.sleep(10)  # Đợi 10 giây trước khi gửi lệnh cho cổng tiếp theo
+# Gửi lệnh tới cả 48 cổng trong một lần: các cổng được gộp thành lệnh interface range
+ports = [f'GigabitEthernet0/{i}' for i in range(1, 49)]
+config_commands = range_config_commands(ports, [command], cisco_device['device_type'])
+output = connection.send_config_set(config_commands)
+print(output)  # In kết quả ra màn hình hoặc ghi vào file log
 
 # Đóng kết nối
 connection.disconnect()
\ No newline at end of file
@@ -1,4 +1,5 @@
 import paramiko
+from interface_status import disabled_port_names
 import getpass
 
 ssh = paramiko.SSHClient()
@@ -21,18 +22,16 @@ conn.send('n')
 conn.send('show int statusn')
 output = conn.recv(65535).decode("utf-8")
 
-for line in output.splitlines():
-    if "disabled" in line:
-        port = line.split()[0]
-        print(f"Enabling port {port}")
-        # Thực hiện lệnh enable trên cổng
-        commands = [
-            f"interface {port}",
-            "shutdown",
-            "no shutdown"
-        ]
-        for command in commands:
-            conn.send(command)
-            conn.send('n')
+for port in disabled_port_names(output):
+    print(f"Enabling port {port}")
+    # Thực hiện lệnh enable trên cổng
+    commands = [
+        f"interface {port}",
+        "shutdown",
+        "no shutdown"
+    ]
+    for command in commands:
+        conn.send(command)
+        conn.send('n')
 
 ssh.close()
@@ -1,4 +1,5 @@
 from netmiko import ConnectHandler
+from interface_status import disabled_port_names
 import time
 import getpass
 import os
@@ -28,23 +29,21 @@ def connect_and_configure(ip, username, password):
             
             # Tìm kiếm các cổng bị disable
             output = net_connect.send_command("show int status")
-            for line in output.splitlines():
-                if "disabled" in line:
-                    port = line.split()[0]
-                    print(f"Checking port {port}")
+            for port in disabled_port_names(output):
+                print(f"Checking port {port}")
                     
-                    # Kiểm tra xem có loop không
-                    port_output = net_connect.send_command(f"show interface {port}")
-                    if "loop" in port_output.lower():
-                        print(f"Skipping port {port} due to loop detection")
-                    else:
-                        print(f"Enabling port {port}")
-                        commands = [
-                            f"interface {port}",
-                            "shutdown",
-                            "no shutdown"
-                        ]
-                        net_connect.send_config_set(commands)
+                # Kiểm tra xem có loop không
+                port_output = net_connect.send_command(f"show interface {port}")
+                if "loop" in port_output.lower():
+                    print(f"Skipping port {port} due to loop detection")
+                else:
+                    print(f"Enabling port {port}")
+                    commands = [
+                        f"interface {port}",
+                        "shutdown",
+                        "no shutdown"
+                    ]
+                    net_connect.send_config_set(commands)
         
         print(f"Finished with {ip}. Moving to the next switch after 20 seconds...")
         time.sleep(20)  # Delay 20 giây trước khi chuyển sang switch tiếp theo
@@ -1,4 +1,5 @@
 from netmiko import ConnectHandler
+from interface_status import disabled_port_names
 import getpass
 # Khởi tạo kết nối đến switch Cisco
 device = {
@@ -13,14 +14,12 @@ with ConnectHandler(**device) as net_connect:
 
     # Tìm kiếm các cổng bị disable
     output = net_connect.send_command("show int status")
-    for line in output.splitlines():
-        if "disabled" in line:
-            port = line.split()[0]
-            print(f"Enabling port {port}")
-            # Thực hiện lệnh enable trên cổng
-            commands = [
-                f"interface {port}",
-                "shutdown",
-                "no shutdown"
-            ]
-            net_connect.send_config_set(commands)
+    for port in disabled_port_names(output):
+        print(f"Enabling port {port}")
+        # Thực hiện lệnh enable trên cổng
+        commands = [
+            f"interface {port}",
+            "shutdown",
+            "no shutdown"
+        ]
+        net_connect.send_config_set(commands)
@@ -1,4 +1,5 @@
 from netmiko import ConnectHandler
+from interface_status import disabled_port_names
 import getpass
 
 device = {
@@ -15,16 +16,14 @@ with ConnectHandler(**device) as net_connect:
     # Lấy thông tin trạng thái các interface
     output = net_connect.send_command("show int status")
     
-    for line in output.splitlines():
-        if "disabled" in line:
-            port = line.split()[0]
-            print(f"Enabling port {port}")
+    for port in disabled_port_names(output):
+        print(f"Enabling port {port}")
             
-            commands = [
-                f"interface {port}",
-                "shutdown",
-                "no shutdown"
-            ]
-            net_connect.send_config_set(commands)
+        commands = [
+            f"interface {port}",
+            "shutdown",
+            "no shutdown"
+        ]
+        net_connect.send_config_set(commands)
 
 print("Hoàn thành việc bật các cổng bị vô hiệu hóa.")
\ No newline at end of file
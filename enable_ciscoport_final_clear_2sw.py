@@ -1,4 +1,5 @@
 from netmiko import ConnectHandler
+from interface_status import disabled_port_names
 import getpass
 
 def connect_to_switch(ip, username, password):
@@ -15,10 +16,8 @@ def clear_port_security(connection):
 def get_disabled_ports(connection):
     output = connection.send_command("show int status")
     disabled_ports = []
-    for line in output.splitlines():
-        if "disabled" in line:
-            port = line.split()[0]
-            disabled_ports.append(port)
+    for port in disabled_port_names(output):
+        disabled_ports.append(port)
     return disabled_ports
 
 def enable_ports(connection, ports):
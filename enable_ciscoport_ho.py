@@ -1,4 +1,5 @@
 from netmiko import ConnectHandler
+from interface_status import disabled_port_names
 import time
 import getpass
 # Tạo danh sách IP từ 10.38.1.4 đến 10.38.1.40
@@ -22,17 +23,15 @@ for ip in ip_list:
             net_connect.send_command("clear port-security all")
             # Tìm kiếm các cổng bị disable
             output = net_connect.send_command("show int status")
-            for line in output.splitlines():
-                if "disabled" in line:
-                    port = line.split()[0]
-                    print(f"Enabling port {port}")
-                    # Thực hiện lệnh enable trên cổng
-                    commands = [
-                        f"interface {port}",
-                        "shutdown",
-                        "no shutdown"
-                    ]
-                    net_connect.send_config_set(commands)
+            for port in disabled_port_names(output):
+                print(f"Enabling port {port}")
+                # Thực hiện lệnh enable trên cổng
+                commands = [
+                    f"interface {port}",
+                    "shutdown",
+                    "no shutdown"
+                ]
+                net_connect.send_config_set(commands)
         print(f"Finished with {ip}. Moving to the next switch after 20 seconds...")
         time.sleep(20)  # Delay 20 giây trước khi chuyển sang switch tiếp theo
     except Exception as e:
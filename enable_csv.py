@@ -1,5 +1,6 @@
 import csv
 from netmiko import ConnectHandler
+from interface_status import disabled_port_names
 import getpass
 
 def enable_port(net_connect, port):
@@ -20,10 +21,8 @@ def handle_switch(ip, username, password):
         net_connect.send_command("clear port-security all")
         output = net_connect.send_command("show int status")
         
-        for line in output.splitlines():
-            if "disabled" in line:
-                port = line.split()[0]
-                enable_port(net_connect, port)
+        for port in disabled_port_names(output):
+            enable_port(net_connect, port)
 
 # Đọc csv và thực hiện các lệnh trên mỗi switch
 username = input("Nhập username:")
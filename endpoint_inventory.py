@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+# Kho thiết bị đầu cuối (SQLite): mỗi bảng MAC đầy đủ lấy được trong các lần quét được ghi lại theo
+# (switch, cổng, VLAN, MAC, lần đầu thấy, lần cuối thấy) để tra vị trí một MAC mà không cần quét lại.
+# Cùng file lưu ảnh chụp bảng MAC gần nhất của từng switch (mac_diff) và nhật ký MAC mới/mất/đổi cổng.
+#   python endpoint_inventory.py switch_manager_inventory.db 1a2b aabb.ccdd.eeff
+#   python endpoint_inventory.py switch_manager_inventory.db --changes-hours 24
+import argparse
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Constants
+INVENTORY_BATCH_ROWS = 20000  # Số dòng gom lại trước khi ghi trong một transaction
+INVENTORY_MAX_AGE = 7 * 24 * 3600  # Vị trí cũ hơn thời gian này không được dùng để ưu tiên quét
+INVENTORY_RETENTION = 90 * 24 * 3600  # Dòng không thấy lại sau thời gian này bị xóa khi mở kho
+INVENTORY_CACHE_KB = 65536  # Bộ nhớ đệm trang SQLite; chỉ mục MAC ngẫu nhiên ghi chậm hẳn khi không vừa bộ đệm
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS endpoints (
+    switch TEXT NOT NULL,
+    port TEXT NOT NULL,
+    vlan TEXT NOT NULL,
+    mac TEXT NOT NULL,
+    last4 TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (mac, switch, vlan)
+);
+CREATE INDEX IF NOT EXISTS idx_endpoints_last4 ON endpoints (last4);
+CREATE INDEX IF NOT EXISTS idx_endpoints_switch_port ON endpoints (switch, port, last_seen);
+CREATE TABLE IF NOT EXISTS mac_snapshots (
+    switch TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS mac_changes (
+    switch TEXT NOT NULL,
+    mac TEXT NOT NULL,
+    vlan TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    old_port TEXT,
+    new_port TEXT,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_mac_changes_mac ON mac_changes (mac);
+CREATE INDEX IF NOT EXISTS idx_mac_changes_switch ON mac_changes (switch, seen_at);
+"""
+
+UPSERT_SQL = """
+INSERT INTO endpoints (switch, port, vlan, mac, last4, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (mac, switch, vlan) DO UPDATE SET port = excluded.port, last_seen = excluded.last_seen
+"""
+# Lần quét có ảnh chụp trước đó: các dòng không đổi được cập nhật last_seen bằng một câu lệnh,
+# MAC đã mất được trả lại last_seen cũ
+BUMP_SQL = "UPDATE endpoints SET last_seen = ? WHERE switch = ? AND last_seen = ?"
+RESTORE_SQL = "UPDATE endpoints SET last_seen = ? WHERE mac = ? AND switch = ? AND vlan = ?"
+SNAPSHOT_SQL = "INSERT OR REPLACE INTO mac_snapshots (switch, seen_at, data) VALUES (?, ?, ?)"
+CHANGE_SQL = "INSERT INTO mac_changes (switch, mac, vlan, kind, old_port, new_port, seen_at) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+# Số MAC trên cổng được tính trong cùng lần quét: mọi dòng của một bảng được ghi với cùng last_seen
+LOCATE_SQL = """
+SELECT e.switch, e.port, e.vlan, e.mac, e.last_seen,
+       (SELECT COUNT(*) FROM endpoints p WHERE p.switch = e.switch AND p.port = e.port AND p.last_seen = e.last_seen)
+FROM endpoints e WHERE e.{column} = ? AND e.last_seen >= ? ORDER BY e.last_seen DESC
+"""
+
+# (switch, cổng, VLAN, MAC, lần cuối thấy, số MAC trên cổng trong lần quét đó)
+Location = Tuple[str, str, str, str, float, int]
+
+class EndpointInventory:
+    # Dùng chung giữa các luồng worker và các tác vụ chạy đồng thời: ghi được gom theo lô, một kết nối SQLite có khóa.
+    # Mỗi tác vụ open() một lần và release() khi xong; kho chỉ đóng khi tác vụ cuối cùng trả lại.
+    def __init__(self, batch_rows: int = INVENTORY_BATCH_ROWS):
+        self.batch_rows = batch_rows
+        self.path: Optional[str] = None
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pending: List[Tuple[str, List[tuple]]] = []  # (câu lệnh SQL, tham số), ghi theo đúng thứ tự
+        self._pending_rows = 0
+        self._pending_snapshots: Dict[str, bytes] = {}
+        self._users = 0
+        self._lock = threading.Lock()
+
+    def open(self, path: Optional[str]) -> bool:
+        # True nếu người gọi giữ một tham chiếu (phải release()); path rỗng không làm gì, không đóng kho đang mở
+        if not path:
+            return False
+        with self._lock:
+            if self._connection is not None:
+                if path == self.path:
+                    self._users += 1
+                    return True
+                if self._users > 0:
+                    logger.warning(f"Kho thiết bị đầu cuối {self.path} đang được tác vụ khác dùng, không mở {path}")
+                    return False
+                self._close_locked()
+            connection = sqlite3.connect(path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(f"PRAGMA cache_size=-{INVENTORY_CACHE_KB}")
+            connection.executescript(SCHEMA)
+            with connection:
+                removed = connection.execute("DELETE FROM endpoints WHERE last_seen < ?",
+                                             (time.time() - INVENTORY_RETENTION,)).rowcount
+            if removed:
+                logger.info(f"Đã xóa {removed} dòng cũ khỏi kho thiết bị đầu cuối {path}")
+            self._connection = connection
+            self.path = path
+            self._users = 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._users = max(0, self._users - 1)
+            if self._users == 0:
+                self._close_locked()
+
+    def is_open(self) -> bool:
+        return self._connection is not None
+
+    def record_sweep(self, switch: str, entries: Iterable[Dict[str, str]], changes: List[Tuple[str, str, str, Optional[str], Optional[str]]],
+                     previous_seen: Optional[float], seen_at: float, snapshot: bytes):
+        # Chỉ ghi phần thay đổi so với ảnh chụp trước (mac_diff); lần đầu thấy switch thì ghi toàn bộ bảng
+        if self._connection is None:
+            return
+        if previous_seen is None:
+            rows = [(switch, entry['port'], entry['vlan'], entry['mac'], entry['mac'][-4:], seen_at, seen_at) for entry in entries]
+        else:
+            rows = [(switch, new_port, vlan, mac, mac[-4:], seen_at, seen_at) for kind, mac, vlan, _, new_port in changes
+                    if kind != "disappeared"]
+        with self._lock:
+            self._queue_locked(UPSERT_SQL, rows)
+            if previous_seen is not None:
+                self._queue_locked(BUMP_SQL, [(seen_at, switch, previous_seen)])
+                self._queue_locked(RESTORE_SQL, [(previous_seen, mac, switch, vlan) for kind, mac, vlan, _, _ in changes
+                                                 if kind == "disappeared"])
+                self._queue_locked(CHANGE_SQL, [(switch, mac, vlan, kind, old_port, new_port, seen_at)
+                                                for kind, mac, vlan, old_port, new_port in changes])
+            self._queue_locked(SNAPSHOT_SQL, [(switch, seen_at, snapshot)])
+            self._pending_snapshots[switch] = snapshot
+
+    def load_snapshot(self, switch: str) -> Optional[bytes]:
+        with self._lock:
+            if self._connection is None:
+                return None
+            if switch in self._pending_snapshots:
+                return self._pending_snapshots[switch]
+            row = self._connection.execute("SELECT data FROM mac_snapshots WHERE switch = ?", (switch,)).fetchone()
+            return row[0] if row else None
+
+    def _queue_locked(self, sql: str, params: List[tuple]):
+        if not params:
+            return
+        self._pending.append((sql, params))
+        self._pending_rows += len(params)
+        if self._pending_rows >= self.batch_rows:
+            self._flush_locked()
+
+    def flush(self) -> int:
+        with self._lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> int:
+        if self._connection is None or not self._pending:
+            return 0
+        pending, row_count = self._pending, self._pending_rows
+        self._pending, self._pending_rows, self._pending_snapshots = [], 0, {}
+        start = time.perf_counter()
+        with self._connection:
+            for sql, params in pending:
+                self._connection.executemany(sql, params)
+        logger.info(f"Đã ghi {row_count} dòng vào kho thiết bị đầu cuối trong {time.perf_counter() - start:.3f}s")
+        return row_count
+
+    def locate(self, target: str, max_age: float = INVENTORY_MAX_AGE) -> List[Location]:
+        # target: MAC dạng Cisco (aabb.ccdd.eeff) hoặc 4 ký tự cuối
+        target = target.lower()
+        column = "last4" if len(target) == 4 else "mac"
+        with self._lock:
+            if self._connection is None:
+                return []
+            self._flush_locked()
+            return self._connection.execute(LOCATE_SQL.format(column=column), (target, time.time() - max_age)).fetchall()
+
+    def recent_changes(self, since: float, mac: Optional[str] = None) -> List[Tuple[str, str, str, str, Optional[str], Optional[str], float]]:
+        with self._lock:
+            if self._connection is None:
+                return []
+            self._flush_locked()
+            sql = "SELECT switch, mac, vlan, kind, old_port, new_port, seen_at FROM mac_changes WHERE seen_at >= ?"
+            params: tuple = (since,)
+            if mac:
+                sql += " AND mac = ?"
+                params += (mac.lower(),)
+            return self._connection.execute(sql + " ORDER BY seen_at, switch", params).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._close_locked()
+
+    def _close_locked(self):
+        if self._connection is None:
+            return
+        self._flush_locked()
+        self._connection.close()
+        self._connection = None
+        self.path = None
+        self._users = 0
+
+endpoint_inventory = EndpointInventory()
+
+def main():
+    parser = argparse.ArgumentParser(description="Tra vị trí MAC trong kho thiết bị đầu cuối")
+    parser.add_argument("database")
+    parser.add_argument("targets", nargs="*", help="MAC dạng Cisco (aabb.ccdd.eeff) hoặc 4 ký tự cuối")
+    parser.add_argument("--max-age-days", type=float, default=INVENTORY_MAX_AGE / 86400)
+    parser.add_argument("--changes-hours", type=float, help="Liệt kê MAC mới/mất/đổi cổng trong chừng này giờ gần nhất")
+    args = parser.parse_args()
+
+    inventory = EndpointInventory()
+    inventory.open(args.database)
+    for target in args.targets:
+        start = time.perf_counter()
+        locations = inventory.locate(target, max_age=args.max_age_days * 86400)
+        print(f"{target}: {len(locations)} vị trí ({(time.perf_counter() - start) * 1000:.1f} ms)")
+        for switch, port, vlan, mac, last_seen, port_count in locations:
+            seen = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(last_seen))
+            print(f"  {switch:<15} {port:<12} VLAN {vlan:<5} {mac}  {port_count} MAC trên cổng, thấy lúc {seen}")
+    if args.changes_hours is not None:
+        changes = inventory.recent_changes(time.time() - args.changes_hours * 3600)
+        print(f"{len(changes)} thay đổi trong {args.changes_hours:g} giờ gần nhất")
+        for switch, mac, vlan, kind, old_port, new_port, seen_at in changes:
+            seen = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(seen_at))
+            print(f"  {seen} {switch:<15} {kind:<11} {mac} VLAN {vlan:<5} {old_port or '-'} -> {new_port or '-'}")
+    inventory.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+# Switch Cisco IOS giả lập qua Telnet để đo hiệu năng switch_manager khi không có thiết bị thật.
+#   python fake_ios_server.py --switches 50 --mac-entries 2000 --latency 0.05
+# Mỗi switch nghe trên một địa chỉ loopback riêng (mặc định 127.0.1.1, 127.0.1.2, ...) ở cổng 23, nên
+# connect_to_device / task_worker quét được dải này mà không cần sửa gì. Cổng 23 cần quyền root
+# (hoặc CAP_NET_BIND_SERVICE); trên macOS cần tạo alias cho các địa chỉ 127.0.1.x trước.
+import argparse
+import asyncio
+import logging
+import random
+import re
+from ipaddress import ip_address
+from typing import Dict, List, Optional
+
+from async_telnet import TELNET_PORT, IAC, DO, DONT, WILL, WONT, SB, SE
+
+# Constants
+DEFAULT_BASE_IP = "127.0.1.1"
+DEFAULT_PORT_COUNT = 48
+DEFAULT_MAC_ENTRIES = 500
+DEFAULT_ERRDISABLED_PORTS = 2
+VLANS = (10, 20, 30, 100)
+ECHO = 1
+SUPPRESS_GO_AHEAD = 3
+
+logger = logging.getLogger(__name__)
+
+INTERFACE_PREFIXES = (("gigabitethernet", "Gi"), ("gi", "Gi"), ("fastethernet", "Fa"), ("fa", "Fa"),
+                      ("tengigabitethernet", "Te"), ("te", "Te"), ("port-channel", "Po"), ("po", "Po"))
+INTERFACE_RE = re.compile(r"^\s*([a-z\-]+)\s*(\d+(?:/\d+)*)\s*$", re.IGNORECASE)
+WRITE_MEMORY_RE = re.compile(r"^wr(?:i(?:te?)?)?(?:\s+mem(?:o(?:ry?)?)?)?$")
+RANGE_ITEM_RE = re.compile(r"^\s*([a-z\-]+)\s*((?:\d+/)*)(\d+)\s*(?:-\s*(\d+))?\s*$", re.IGNORECASE)
+
+class FakeSwitchProfile:
+    # Tham số chung cho mọi switch giả lập
+    def __init__(self, port_count: int = DEFAULT_PORT_COUNT, mac_entries: int = DEFAULT_MAC_ENTRIES,
+                 errdisabled_ports: int = DEFAULT_ERRDISABLED_PORTS, latency: float = 0.0, jitter: float = 0.0,
+                 login_latency: float = 0.0, fail_rate: float = 0.0, username: Optional[str] = None,
+                 password: Optional[str] = None, seed: int = 1):
+        self.port_count = port_count
+        self.mac_entries = mac_entries
+        self.errdisabled_ports = errdisabled_ports
+        self.latency = latency
+        self.jitter = jitter
+        self.login_latency = login_latency
+        self.fail_rate = fail_rate
+        self.username = username
+        self.password = password
+        self.seed = seed
+
+class FakeCliSession:
+    # Chế độ CLI và cổng đang chọn của một phiên Telnet; như IOS thật, mỗi phiên có trạng thái riêng
+    def __init__(self):
+        self.mode = "exec"
+        self.selected_ports: List[str] = []
+
+class FakeSwitch:
+    # Trạng thái một switch: cổng (VLAN, trạng thái, mô tả) và bảng MAC, thay đổi theo lệnh cấu hình
+    def __init__(self, index: int, profile: FakeSwitchProfile):
+        rng = random.Random(profile.seed * 100003 + index)
+        self.hostname = f"SW-{index}"
+        self.ports: Dict[str, Dict[str, object]] = {}
+        for number in range(1, profile.port_count + 1):
+            self.ports[f"Gi1/0/{number}"] = {"vlan": rng.choice(VLANS), "status": "connected", "name": f"PC-{index}-{number}"}
+        port_names = list(self.ports)
+        for number, port in enumerate(rng.sample(port_names, min(profile.errdisabled_ports, len(port_names)))):
+            self.ports[port]["status"] = "err-disabled"
+            if number == 0 and profile.errdisabled_ports > 1:
+                self.ports[port]["name"] = "LOOP-TEST"
+        self.mac_entries: List[List[object]] = []
+        for _ in range(profile.mac_entries):
+            port = rng.choice(port_names)
+            mac = f"{rng.randrange(16 ** 4):04x}.{rng.randrange(16 ** 4):04x}.{rng.randrange(16 ** 4):04x}"
+            self.mac_entries.append([self.ports[port]["vlan"], mac, port])
+        self.saved = True
+
+    def prompt(self, session: FakeCliSession) -> str:
+        suffix = {"exec": "#", "config": "(config)#", "config-if": "(config-if)#", "config-if-range": "(config-if-range)#"}
+        return self.hostname + suffix[session.mode]
+
+    def normalize_port(self, text: str) -> Optional[str]:
+        match = INTERFACE_RE.match(text)
+        if not match:
+            return None
+        prefix = match.group(1).lower()
+        for long_name, short_name in INTERFACE_PREFIXES:
+            if prefix == long_name:
+                port = f"{short_name}{match.group(2)}"
+                return port if port in self.ports else None
+        return None
+
+    def expand_range(self, text: str) -> Optional[List[str]]:
+        ports = []
+        for item in text.split(","):
+            match = RANGE_ITEM_RE.match(item)
+            if not match:
+                return None
+            prefix, slot, first, last = match.groups()
+            for number in range(int(first), int(last or first) + 1):
+                port = self.normalize_port(f"{prefix}{slot}{number}")
+                if port is None:
+                    return None
+                ports.append(port)
+        return ports
+
+    def execute(self, command: str, session: FakeCliSession) -> str:
+        command = command.strip()
+        lowered = command.lower()
+        if not command:
+            return ""
+        if session.mode != "exec":
+            return self.execute_config(command, lowered, session)
+        if lowered.startswith(("terminal ", "term ")):
+            return ""
+        if lowered in ("configure terminal", "conf t", "config t"):
+            session.mode = "config"
+            return "Enter configuration commands, one per line.  End with CNTL/Z."
+        if lowered.startswith("show mac address-table") or lowered.startswith("show mac-address-table"):
+            return self.show_mac_table(command, session)
+        if lowered in ("show int status", "show interfaces status", "show interface status"):
+            return self.show_interfaces_status()
+        if WRITE_MEMORY_RE.match(lowered) or lowered == "copy running-config startup-config":
+            self.saved = True
+            return "Building configuration...\n[OK]"
+        if lowered == "clear port-security all":
+            return ""
+        if lowered == "show clock":
+            return "*00:00:00.000 UTC Mon Mar 1 1993"
+        return self.invalid(command, session)
+
+    def execute_config(self, command: str, lowered: str, session: FakeCliSession) -> str:
+        if lowered in ("end", "\x1a"):
+            session.mode = "exec"
+            session.selected_ports = []
+            return ""
+        if lowered == "exit":
+            session.mode = "exec" if session.mode == "config" else "config"
+            session.selected_ports = []
+            return ""
+        if lowered.startswith("interface range "):
+            ports = self.expand_range(command[len("interface range "):])
+            if not ports:
+                return self.invalid(command, session)
+            session.mode = "config-if-range"
+            session.selected_ports = ports
+            return ""
+        if lowered.startswith("interface "):
+            port = self.normalize_port(command[len("interface "):])
+            if port is None:
+                return self.invalid(command, session)
+            session.mode = "config-if"
+            session.selected_ports = [port]
+            return ""
+        if session.mode in ("config-if", "config-if-range"):
+            vlan_match = re.match(r"^switchport access vlan (\d+)$", lowered)
+            if vlan_match:
+                vlan = int(vlan_match.group(1))
+                if not 1 <= vlan <= 4094:
+                    return self.invalid(command, session)
+                for port in session.selected_ports:
+                    self.ports[port]["vlan"] = vlan
+                for entry in self.mac_entries:
+                    if entry[2] in session.selected_ports:
+                        entry[0] = vlan
+                self.saved = False
+                return ""
+            if lowered == "shutdown":
+                for port in session.selected_ports:
+                    self.ports[port]["status"] = "disabled"
+                self.saved = False
+                return ""
+            if lowered == "no shutdown":
+                for port in session.selected_ports:
+                    self.ports[port]["status"] = "connected"
+                self.saved = False
+                return ""
+            if lowered.startswith(("description ", "switchport mode access")):
+                return ""
+        return self.invalid(command, session)
+
+    def invalid(self, command: str, session: FakeCliSession) -> str:
+        return f"{' ' * len(self.prompt(session))}^\n% Invalid input detected at '^' marker."
+
+    def show_mac_table(self, command: str, session: FakeCliSession) -> str:
+        base, _, include = command.partition("|")
+        include = include.strip()
+        include_re = None
+        if include:
+            if not include.lower().startswith("include "):
+                return self.invalid(command, session)
+            include_re = re.compile(include[len("include "):].strip(), re.IGNORECASE)
+        args = base.split()[3:]
+        entries = self.mac_entries
+        if len(args) == 2 and args[0].lower() == "vlan" and args[1].isdigit():
+            entries = [entry for entry in entries if entry[0] == int(args[1])]
+        elif len(args) == 2 and args[0].lower() == "interface":
+            port = self.normalize_port(args[1])
+            if port is None:
+                return self.invalid(command, session)
+            entries = [entry for entry in entries if entry[2] == port]
+        elif args:
+            return self.invalid(command, session)
+
+        lines = [f" {vlan:<4}    {mac}    DYNAMIC     {port}" for vlan, mac, port in entries]
+        if include_re is not None:
+            return "\n".join(line for line in lines if include_re.search(line))
+        header = ["          Mac Address Table", "-------------------------------------------", "",
+                  "Vlan    Mac Address       Type        Ports", "----    -----------       --------    -----"]
+        return "\n".join(header + lines + [f"Total Mac Addresses for this criterion: {len(entries)}"])
+
+    def show_interfaces_status(self) -> str:
+        lines = ["", "Port      Name               Status       Vlan       Duplex  Speed Type"]
+        for port, state in self.ports.items():
+            lines.append(f"{port:<9} {str(state['name'])[:18]:<18} {state['status']:<12} {state['vlan']:<10} "
+                         f"a-full a-1000 10/100/1000BaseTX")
+        return "\n".join(lines)
+
+class FakeTelnetConnection:
+    # Một phiên Telnet đến switch giả lập: đăng nhập, đọc từng dòng lệnh, trả kết quả kèm prompt
+    def __init__(self, switch: FakeSwitch, profile: FakeSwitchProfile, reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter, rng: random.Random):
+        self.switch = switch
+        self.profile = profile
+        self.reader = reader
+        self.writer = writer
+        self.rng = rng
+        self.session = FakeCliSession()
+        self._pending = b""
+        self._last_was_cr = False
+
+    async def run(self):
+        if self.profile.fail_rate and self.rng.random() < self.profile.fail_rate:
+            self.writer.close()
+            return
+        self.write_raw(bytes((IAC, WILL, ECHO, IAC, WILL, SUPPRESS_GO_AHEAD)))
+        if not await self.login():
+            return
+        self.write("\n" + self.switch.prompt(self.session))
+        while True:
+            line = await self.read_line()
+            if line is None:
+                return
+            self.write(line + "\n")
+            if self.profile.latency or self.profile.jitter:
+                await asyncio.sleep(self.profile.latency + self.rng.uniform(0, self.profile.jitter))
+            if line.strip().lower() in ("exit", "logout") and self.session.mode == "exec":
+                return
+            output = self.switch.execute(line, self.session)
+            self.write((output + "\n" if output else "") + self.switch.prompt(self.session))
+            await self.writer.drain()
+
+    async def login(self) -> bool:
+        for _ in range(3):
+            self.write("\nUser Access Verification\n\nUsername: ")
+            username = await self.read_line()
+            if username is None:
+                return False
+            self.write(username + "\nPassword: ")
+            password = await self.read_line()
+            if password is None:
+                return False
+            if self.profile.login_latency:
+                await asyncio.sleep(self.profile.login_latency)
+            if ((self.profile.username is None or username.strip() == self.profile.username) and
+                    (self.profile.password is None or password == self.profile.password)):
+                return True
+            self.write("\n% Authentication failed\n")
+        self.writer.close()
+        return False
+
+    def write(self, text: str):
+        self.write_raw(text.replace("\n", "\r\n").encode("utf-8"))
+
+    def write_raw(self, data: bytes):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    async def read_line(self) -> Optional[str]:
+        while True:
+            for index, byte in enumerate(self._pending):
+                if byte in (10, 13):
+                    line = self._pending[:index]
+                    self._pending = self._pending[index + 1:]
+                    if byte == 10 and self._last_was_cr and not line:
+                        self._last_was_cr = False
+                        break
+                    self._last_was_cr = byte == 13
+                    if self._pending[:1] == b"\x00":
+                        self._pending = self._pending[1:]
+                    return line.decode("utf-8", errors="ignore")
+            else:
+                try:
+                    data = await self.reader.read(4096)
+                except ConnectionError:
+                    return None
+                if not data:
+                    return None
+                self._pending += self.strip_iac(data)
+                continue
+
+    def strip_iac(self, data: bytes) -> bytes:
+        clean = bytearray()
+        i = 0
+        while i < len(data):
+            byte = data[i]
+            if byte != IAC:
+                clean.append(byte)
+                i += 1
+            elif i + 1 < len(data) and data[i + 1] in (DO, DONT, WILL, WONT):
+                i += 3
+            elif i + 1 < len(data) and data[i + 1] == SB:
+                end = data.find(bytes((IAC, SE)), i + 2)
+                i = len(data) if end == -1 else end + 2
+            else:
+                i += 2
+        return bytes(clean)
+
+def switch_addresses(base_ip: str, count: int) -> List[str]:
+    start = int(ip_address(base_ip))
+    return [str(ip_address(start + offset)) for offset in range(count)]
+
+async def serve_switches(addresses: List[str], profile: FakeSwitchProfile, port: int = TELNET_PORT):
+    servers = []
+    for index, address in enumerate(addresses, start=1):
+        switch = FakeSwitch(index, profile)
+        rng = random.Random(profile.seed + index)
+
+        async def _handle(reader, writer, switch=switch, rng=rng):
+            try:
+                await FakeTelnetConnection(switch, profile, reader, writer, rng).run()
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                writer.close()
+
+        servers.append(await asyncio.start_server(_handle, address, port))
+    print(f"Đang giả lập {len(addresses)} switch: {addresses[0]} - {addresses[-1]} cổng {port}", flush=True)
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+def main():
+    parser = argparse.ArgumentParser(description="Switch Cisco IOS giả lập qua Telnet để đo hiệu năng")
+    parser.add_argument("--switches", type=int, default=10)
+    parser.add_argument("--base-ip", default=DEFAULT_BASE_IP, help=f"Địa chỉ của switch đầu tiên (mặc định {DEFAULT_BASE_IP})")
+    parser.add_argument("--port", type=int, default=TELNET_PORT)
+    parser.add_argument("--ports", type=int, default=DEFAULT_PORT_COUNT, help="Số cổng mỗi switch")
+    parser.add_argument("--mac-entries", type=int, default=DEFAULT_MAC_ENTRIES, help="Số mục trong bảng MAC mỗi switch")
+    parser.add_argument("--errdisabled", type=int, default=DEFAULT_ERRDISABLED_PORTS, help="Số cổng err-disabled mỗi switch")
+    parser.add_argument("--latency", type=float, default=0.0, help="Độ trễ (giây) trước mỗi kết quả lệnh")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Độ trễ ngẫu nhiên thêm tối đa (giây)")
+    parser.add_argument("--login-latency", type=float, default=0.0, help="Độ trễ xác thực (giây), mô phỏng TACACS/AAA")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Tỉ lệ kết nối bị đóng ngay (0-1)")
+    parser.add_argument("--username", help="Chỉ chấp nhận tên người dùng này (mặc định: chấp nhận mọi tài khoản)")
+    parser.add_argument("--password", help="Chỉ chấp nhận mật khẩu này")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    profile = FakeSwitchProfile(port_count=args.ports, mac_entries=args.mac_entries, errdisabled_ports=args.errdisabled,
+                                latency=args.latency, jitter=args.jitter, login_latency=args.login_latency,
+                                fail_rate=args.fail_rate, username=args.username, password=args.password, seed=args.seed)
+    try:
+        asyncio.run(serve_switches(switch_addresses(args.base_ip, args.switches), profile, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Phân tích `show interfaces status` (show int status) của Cisco IOS thành bản ghi có kiểu, dùng chung cho switch_core và các script.
+# Cột Port/Name/Status căn trái theo vị trí tiêu đề; Name có thể trống hoặc chứa khoảng trắng nên không tách được bằng split().
+# Vlan/Duplex/Speed/Type được tách theo khoảng trắng (Duplex/Speed căn phải nên không cắt theo vị trí tiêu đề).
+import re
+from typing import Iterable, List, NamedTuple, Optional
+
+# Constants
+DISABLED_STATUSES = ("disabled", "err-disabled")
+# Status values IOS prints; only used when the header line is missing (e.g. output filtered with '| include')
+KNOWN_STATUSES = ("connected", "notconnect", "disabled", "err-disabled", "inactive", "monitoring", "suspended",
+                  "sfpAbsent", "xcvrAbsent", "noOperMem", "notPresent", "faulty", "routed")
+
+HEADER_RE = re.compile(r"^Port\s+Name\s+Status\s+Vlan\s+Duplex\s+Speed(?:\s+Type)?\s*$", re.IGNORECASE)
+LINE_RE = re.compile(
+    r"^(?P<port>\S+)\s+(?:(?P<name>.*\S)\s+)?(?P<status>" + "|".join(re.escape(status) for status in KNOWN_STATUSES) +
+    r")\s+(?P<vlan>\S+)\s+(?P<duplex>\S+)\s+(?P<speed>\S+)(?:\s+(?P<type>.*?))?\s*$"
+)
+PORT_TOKEN = r"[A-Za-z][A-Za-z\-]*\d[\w/.:\-]*"
+PORT_TOKEN_RE = re.compile(rf"^{PORT_TOKEN}$")
+
+class InterfaceStatus(NamedTuple):
+    port: str
+    name: str
+    status: str
+    vlan: str  # Số VLAN, "trunk", "routed" hoặc "unassigned"
+    duplex: str
+    speed: str
+    type: str
+
+def row_regex(name_start: int, status_start: int) -> "re.Pattern[str]":
+    # Một regex cho mỗi bố cục tiêu đề: Port và Name phải nằm gọn trong cột (không tràn), phần sau tách theo khoảng trắng
+    return re.compile(
+        rf"^(?P<port>{PORT_TOKEN}) +(?<=^.{{{name_start}}})(?P<name>.{{{status_start - name_start - 1}}}) "
+        r"(?P<status>\S+) +(?P<vlan>\S+) +(?P<duplex>\S+) +(?P<speed>\S+)(?: +(?P<type>.*?))? *$"
+    )
+
+def _parse_with_regex(line: str) -> Optional[InterfaceStatus]:
+    match = LINE_RE.match(line)
+    if not match or not PORT_TOKEN_RE.match(match.group("port")):
+        return None
+    return InterfaceStatus(match.group("port"), match.group("name") or "", match.group("status"), match.group("vlan"),
+                           match.group("duplex"), match.group("speed"), match.group("type") or "")
+
+def parse_interfaces_status(output: str, statuses: Optional[Iterable[str]] = None) -> List[InterfaceStatus]:
+    # Dòng rác (--More--, prompt, thông báo lỗi) bị bỏ qua; không có dòng tiêu đề thì nhận dạng theo giá trị Status.
+    # statuses: chỉ trả về cổng có Status thuộc danh sách; dòng không chứa giá trị nào trong đó được bỏ qua trước khi chạy regex
+    wanted = tuple(statuses) if statuses is not None else None
+    status_filter = re.compile("|".join(re.escape(status) for status in wanted)) if wanted else None
+    records: List[InterfaceStatus] = []
+    row_re: Optional["re.Pattern[str]"] = None
+    for line in (output or "").splitlines():
+        if status_filter is not None and row_re is not None and not status_filter.search(line):
+            continue
+        match = row_re.match(line) if row_re is not None else None
+        if match is not None:
+            port, name, status, vlan, duplex, speed, port_type = match.groups()
+            record = InterfaceStatus(port, name.strip(), status, vlan, duplex, speed, port_type or "")
+        elif HEADER_RE.match(line):
+            row_re = row_regex(line.index("Name"), line.index("Status"))
+            continue
+        else:
+            record = _parse_with_regex(line) if line.strip() else None
+        if record is not None and (wanted is None or record.status in wanted):
+            records.append(record)
+    return records
+
+def disabled_interfaces(output: str) -> List[InterfaceStatus]:
+    return parse_interfaces_status(output, DISABLED_STATUSES)
+
+def disabled_port_names(output: str) -> List[str]:
+    # Tên các cổng đang disabled/err-disabled, theo thứ tự trong đầu ra
+    return [record.port for record in disabled_interfaces(output)]
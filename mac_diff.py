@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# So sánh bảng MAC của một switch giữa hai lần quét liên tiếp: chỉ trả về MAC mới, MAC mất, MAC đổi cổng,
+# và phát hiện MAC đổi cổng liên tục (flap). Ảnh chụp lần quét trước được giữ ở dạng gọn (khóa số nguyên).
+import json
+import struct
+import threading
+import zlib
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Constants
+FLAP_WINDOW_SWEEPS = 5  # Số lần quét gần nhất được xét khi đếm số lần đổi cổng
+FLAP_MIN_MOVES = 2  # Đổi cổng từ chừng này lần trở lên trong cửa sổ -> coi là flap
+SNAPSHOT_FORMAT_VERSION = 2  # v2: moves keep the sweep numbers of recent moves (v1: running count + last sweep)
+
+# (loại: appeared/disappeared/moved, MAC dạng Cisco, VLAN, cổng cũ, cổng mới)
+MacChange = Tuple[str, str, str, Optional[str], Optional[str]]
+
+def mac_key(mac: str, vlan: str) -> int:
+    # MAC 48 bit + VLAN 12 bit trong một số nguyên
+    return (int(mac.replace('.', ''), 16) << 12) | (int(vlan) & 0xFFF)
+
+def key_to_mac_vlan(key: int) -> Tuple[str, str]:
+    mac_hex = f"{key >> 12:012x}"
+    return f"{mac_hex[0:4]}.{mac_hex[4:8]}.{mac_hex[8:12]}", str(key & 0xFFF)
+
+class MacSnapshot:
+    # Ảnh chụp bảng MAC: khóa (MAC, VLAN) -> chỉ số cổng trong danh sách cổng, kèm lịch sử đổi cổng gần đây
+    def __init__(self, seen_at: float, sweep: int, ports: List[str], entries: Dict[int, int],
+                 moves: Optional[Dict[int, Tuple[int, ...]]] = None):
+        self.seen_at = seen_at
+        self.sweep = sweep
+        self.ports = ports
+        self.entries = entries
+        self.moves = moves or {}  # khóa -> số thứ tự các lần quét có đổi cổng, chỉ giữ các lần trong cửa sổ
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def to_bytes(self) -> bytes:
+        keys = array('Q', self.entries.keys())
+        port_indexes = array('I', self.entries.values())
+        move_keys = array('Q', self.moves.keys())
+        move_counts = array('I', (len(sweeps) for sweeps in self.moves.values()))
+        move_sweeps = array('I', (value for sweeps in self.moves.values() for value in sweeps))
+        header = json.dumps({"v": SNAPSHOT_FORMAT_VERSION, "seen_at": self.seen_at, "sweep": self.sweep,
+                             "ports": self.ports, "move_sweeps": len(move_sweeps)}).encode("utf-8")
+        body = b"".join(part.tobytes() for part in (keys, port_indexes, move_keys, move_counts, move_sweeps))
+        return zlib.compress(struct.pack("<III", len(header), len(keys), len(move_keys)) + header + body)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'MacSnapshot':
+        raw = zlib.decompress(data)
+        header_len, entry_count, move_count = struct.unpack_from("<III", raw)
+        offset = struct.calcsize("<III")
+        header = json.loads(raw[offset:offset + header_len])
+        version = header.get("v")
+        if version not in (1, SNAPSHOT_FORMAT_VERSION):
+            raise ValueError(f"Phiên bản ảnh chụp bảng MAC không hỗ trợ: {version}")
+        offset += header_len
+        layout = [('Q', entry_count), ('I', entry_count), ('Q', move_count)]
+        if version == 1:
+            layout.append(('I', move_count * 2))
+        else:
+            layout += [('I', move_count), ('I', header["move_sweeps"])]
+        arrays = []
+        for typecode, count in layout:
+            values = array(typecode)
+            values.frombytes(raw[offset:offset + count * values.itemsize])
+            offset += count * values.itemsize
+            arrays.append(values)
+        keys, port_indexes, move_keys = arrays[:3]
+        if version == 1:
+            # v1 chỉ biết chắc lần đổi cổng gần nhất nằm trong cửa sổ
+            move_data = arrays[3]
+            moves = {key: (move_data[i * 2 + 1],) for i, key in enumerate(move_keys)}
+        else:
+            move_counts, move_sweeps = arrays[3:]
+            moves = {}
+            position = 0
+            for key, count in zip(move_keys, move_counts):
+                moves[key] = tuple(move_sweeps[position:position + count])
+                position += count
+        return cls(header["seen_at"], header["sweep"], header["ports"], dict(zip(keys, port_indexes)), moves)
+
+def diff_mac_table(previous: Optional[MacSnapshot], entries: Iterable[Dict[str, str]],
+                   seen_at: float) -> Tuple[MacSnapshot, List[MacChange], List[Tuple[MacChange, int]]]:
+    # Một lần duyệt bảng mới + một lần duyệt ảnh chụp cũ: thời gian tuyến tính theo kích thước bảng.
+    # Trả về (ảnh chụp mới, thay đổi, [(thay đổi đổi cổng, số lần đổi trong cửa sổ)] của các MAC đang flap)
+    sweep = previous.sweep + 1 if previous else 1
+    old_entries = previous.entries if previous else {}
+    old_ports = previous.ports if previous else []
+    ports: List[str] = []
+    port_indexes: Dict[str, int] = {}
+    new_entries: Dict[int, int] = {}
+    changes: List[MacChange] = []
+    # Chỉ giữ các lần đổi cổng trong FLAP_WINDOW_SWEEPS lần quét gần nhất (tính cả lần này)
+    moves: Dict[int, Tuple[int, ...]] = {}
+    for key, sweeps in (previous.moves if previous else {}).items():
+        recent = tuple(move_sweep for move_sweep in sweeps if sweep - move_sweep < FLAP_WINDOW_SWEEPS)
+        if recent:
+            moves[key] = recent
+    flapping: List[Tuple[MacChange, int]] = []
+
+    for entry in entries:
+        port = entry['port']
+        port_index = port_indexes.get(port)
+        if port_index is None:
+            port_index = port_indexes[port] = len(ports)
+            ports.append(port)
+        try:
+            key = mac_key(entry['mac'], entry['vlan'])
+        except ValueError:
+            continue
+        new_entries[key] = port_index
+        if previous is None:
+            continue
+        old_index = old_entries.get(key)
+        if old_index is None:
+            changes.append(("appeared", entry['mac'], entry['vlan'], None, port))
+        elif old_ports[old_index] != port:
+            change = ("moved", entry['mac'], entry['vlan'], old_ports[old_index], port)
+            changes.append(change)
+            recent_moves = moves.get(key, ()) + (sweep,)
+            moves[key] = recent_moves
+            if len(recent_moves) >= FLAP_MIN_MOVES:
+                flapping.append((change, len(recent_moves)))
+
+    for key, old_index in old_entries.items():
+        if key not in new_entries:
+            mac, vlan = key_to_mac_vlan(key)
+            changes.append(("disappeared", mac, vlan, old_ports[old_index], None))
+    return MacSnapshot(seen_at, sweep, ports, new_entries, moves), changes, flapping
+
+class MacTableDiffer:
+    # Giữ ảnh chụp gần nhất của từng switch trong bộ nhớ, dùng chung giữa các luồng worker
+    def __init__(self):
+        self._snapshots: Dict[str, MacSnapshot] = {}
+        self._lock = threading.Lock()
+
+    def get(self, switch: str) -> Optional[MacSnapshot]:
+        with self._lock:
+            return self._snapshots.get(switch)
+
+    def diff(self, switch: str, entries: Iterable[Dict[str, str]], seen_at: float,
+             previous: Optional[MacSnapshot] = None,
+             use_memory: bool = True) -> Tuple[Optional[MacSnapshot], MacSnapshot, List[MacChange], List[Tuple[MacChange, int]]]:
+        # use_memory=False: previous là nguồn duy nhất (kho có ảnh chụp riêng), None nghĩa là so với bảng rỗng;
+        # ảnh chụp mới không được giữ trong bộ nhớ vì kho đã lưu bản nén của nó
+        if previous is None and use_memory:
+            previous = self.get(switch)
+        snapshot, changes, flapping = diff_mac_table(previous, entries, seen_at)
+        with self._lock:
+            if use_memory:
+                self._snapshots[switch] = snapshot
+            else:
+                self._snapshots.pop(switch, None)
+        return previous, snapshot, changes, flapping
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+
+mac_differ = MacTableDiffer()
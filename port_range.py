@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# Gộp danh sách cổng (Gi1/0/1, Gi1/0/2, Gi1/0/3, Gi1/0/7...) thành ít lệnh `interface range` nhất để cấu hình
+# nhiều cổng trong một lần vào chế độ cấu hình: Gi1/0/1, Gi1/0/2, Gi1/0/3, Gi1/0/7 -> "interface range Gi1/0/1 - 3, Gi1/0/7"
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Constants
+MAX_RANGES_PER_LINE = 5  # IOS chấp nhận tối đa 5 khoảng (phân tách bằng dấu phẩy) trong một lệnh interface range
+RANGES_PER_LINE = {  # Max comma-separated ranges per `interface range` line, by netmiko device_type
+    "cisco_ios": 5,
+    "cisco_ios_telnet": 5,
+    "cisco_xe": 5,
+    "cisco_xe_telnet": 5,
+}
+
+PORT_RE = re.compile(r"^([A-Za-z][A-Za-z\-]*?)((?:\d+/)*)(\d+)$")
+
+def split_port(port: str) -> Optional[Tuple[str, str, int]]:
+    # "Gi1/0/12" -> ("Gi", "1/0/", 12); cổng con (Gi1/0/1.100) hoặc tên lạ trả về None
+    match = PORT_RE.match(port.strip())
+    if not match:
+        return None
+    return match.group(1), match.group(2), int(match.group(3))
+
+def port_ranges(ports: Iterable[str]) -> Tuple[List[Tuple[str, List[str]]], List[str]]:
+    # Trả về ([(khoảng dạng "Gi1/0/1 - 3", [các cổng trong khoảng])], [cổng không gộp được]).
+    # Một khoảng chỉ gồm các cổng liên tiếp cùng loại và cùng slot/module, như IOS yêu cầu
+    by_slot: Dict[Tuple[str, str], Dict[int, str]] = {}
+    singles: List[str] = []
+    for port in ports:
+        parts = split_port(port)
+        if parts is None:
+            if port not in singles:
+                singles.append(port)
+            continue
+        prefix, slot, number = parts
+        by_slot.setdefault((prefix, slot), {}).setdefault(number, port.strip())
+
+    ranges: List[Tuple[str, List[str]]] = []
+    for (prefix, slot), numbered in sorted(by_slot.items()):
+        numbers = sorted(numbered)
+        first = previous = numbers[0]
+        for number in numbers[1:] + [None]:
+            if number is not None and number == previous + 1:
+                previous = number
+                continue
+            members = [numbered[n] for n in range(first, previous + 1)]
+            text = f"{prefix}{slot}{first}" if first == previous else f"{prefix}{slot}{first} - {previous}"
+            ranges.append((text, members))
+            if number is not None:
+                first = previous = number
+    return ranges, singles
+
+def ranges_per_line(device_type: Optional[str]) -> int:
+    # Loại thiết bị chưa biết dùng giới hạn của IOS
+    return RANGES_PER_LINE.get((device_type or "").lower(), MAX_RANGES_PER_LINE)
+
+def interface_range_lines(ports: Iterable[str], max_ranges_per_line: int = MAX_RANGES_PER_LINE) -> List[Tuple[str, List[str]]]:
+    # [(lệnh "interface range ..." hoặc "interface ...", [các cổng mà lệnh chọn])]
+    ranges, singles = port_ranges(ports)
+    lines: List[Tuple[str, List[str]]] = []
+    for start in range(0, len(ranges), max(1, max_ranges_per_line)):
+        chunk = ranges[start:start + max(1, max_ranges_per_line)]
+        members = [port for _, chunk_ports in chunk for port in chunk_ports]
+        if len(members) == 1:
+            lines.append((f"interface {members[0]}", members))
+        else:
+            lines.append((f"interface range {', '.join(text for text, _ in chunk)}", members))
+    lines.extend((f"interface {port}", [port]) for port in singles)
+    return lines
+
+def range_config_commands(ports: Iterable[str], commands: List[str], device_type: Optional[str] = None) -> List[str]:
+    # Lệnh cấu hình đầy đủ cho send_config_set: mỗi lệnh interface range (hoặc interface) theo sau bởi commands
+    config_commands: List[str] = []
+    for interface_line, _ in interface_range_lines(ports, ranges_per_line(device_type)):
+        config_commands.append(interface_line)
+        config_commands.extend(commands)
+    return config_commands
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from async_telnet import TELNET_PORT
+
+# Constants
+SSH_PORT = 22
+PROBE_PORTS = (TELNET_PORT, SSH_PORT)
+PROBE_TIMEOUT = 1.5  # Seconds per TCP connect attempt; a live switch answers in milliseconds
+PROBE_CONCURRENCY = 256  # TCP connects in flight at once during the sweep
+REACHABILITY_CACHE_TTL = 120  # Seconds a sweep result for one IP is reused
+REACHABILITY_CACHE_MAX_ENTRIES = 8192
+
+logger = logging.getLogger(__name__)
+
+# Kết quả cho một IP: ({cổng mở: thời gian bắt tay TCP (giây)}, thiết bị có phản hồi hay không - RST cũng tính là phản hồi)
+ProbeResult = Tuple[Dict[int, float], bool]
+
+async def probe_port(host: str, port: int, timeout: float = PROBE_TIMEOUT) -> Tuple[Optional[bool], float]:
+    # (True: cổng mở; False: thiết bị từ chối kết nối (RST); None: không phản hồi, thời gian kết nối)
+    start = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout)
+    except ConnectionRefusedError:
+        return False, time.perf_counter() - start
+    except (asyncio.TimeoutError, OSError):
+        return None, time.perf_counter() - start
+    elapsed = time.perf_counter() - start
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True, elapsed
+
+async def probe_hosts(hosts: Iterable[str], ports: Iterable[int] = PROBE_PORTS, timeout: float = PROBE_TIMEOUT,
+                      max_concurrency: int = PROBE_CONCURRENCY) -> Dict[str, ProbeResult]:
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    host_list: List[str] = list(hosts)
+    port_list: List[int] = list(ports)
+
+    async def _bounded(host: str, port: int) -> Tuple[Optional[bool], float]:
+        async with semaphore:
+            return await probe_port(host, port, timeout=timeout)
+
+    outcomes = await asyncio.gather(*(_bounded(host, port) for host in host_list for port in port_list))
+    results = {}
+    for index, host in enumerate(host_list):
+        host_outcomes = outcomes[index * len(port_list):(index + 1) * len(port_list)]
+        open_ports = {port: elapsed for port, (outcome, elapsed) in zip(port_list, host_outcomes) if outcome}
+        results[host] = (open_ports, any(outcome is not None for outcome, _ in host_outcomes))
+    return results
+
+class ReachabilityCache:
+    # Cache LRU có TTL cho kết quả quét TCP theo IP, dùng chung giữa các tác vụ
+    def __init__(self, ttl: float = REACHABILITY_CACHE_TTL, max_entries: int = REACHABILITY_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Tuple[float, ProbeResult]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ip: str) -> Optional[ProbeResult]:
+        with self._lock:
+            entry = self._entries.get(ip)
+            if entry is None:
+                return None
+            checked_at, result = entry
+            if time.monotonic() - checked_at > self.ttl:
+                del self._entries[ip]
+                return None
+            self._entries.move_to_end(ip)
+            return result
+
+    def put(self, ip: str, result: ProbeResult):
+        with self._lock:
+            self._entries[ip] = (time.monotonic(), result)
+            self._entries.move_to_end(ip)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, ip: str):
+        with self._lock:
+            self._entries.pop(ip, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+reachability_cache = ReachabilityCache()
+
+def sweep_reachability(hosts: Iterable[str], ports: Iterable[int] = PROBE_PORTS, timeout: float = PROBE_TIMEOUT,
+                       max_concurrency: int = PROBE_CONCURRENCY, use_cache: bool = True) -> Dict[str, ProbeResult]:
+    # Dùng từ luồng worker (không phải luồng GUI): mỗi lần gọi tạo một event loop riêng
+    host_list = list(hosts)
+    results: Dict[str, ProbeResult] = {}
+    to_probe = []
+    for host in host_list:
+        cached = reachability_cache.get(host) if use_cache else None
+        if cached is not None:
+            results[host] = cached
+        else:
+            to_probe.append(host)
+
+    if to_probe:
+        start = time.monotonic()
+        probed = asyncio.run(probe_hosts(to_probe, ports, timeout=timeout, max_concurrency=max_concurrency))
+        logger.info(f"Quét TCP {len(to_probe)} IP trong {time.monotonic() - start:.2f}s "
+                    f"({len(host_list) - len(to_probe)} IP lấy từ cache)")
+        for host, result in probed.items():
+            reachability_cache.put(host, result)
+        results.update(probed)
+    return {host: results[host] for host in host_list}
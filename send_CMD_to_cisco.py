@@ -1,6 +1,6 @@
 from netmiko import ConnectHandler
 from getpass import getpass
-import time
+from port_range import range_config_commands
 
 # Nhập thông tin từ người dùng
 ip = input("Nhập IP của switch: ")
@@ -21,14 +21,20 @@ connection = ConnectHandler(**cisco_device)
 # Danh sách các cổng
 ports = ['gi1/0/{}'.format(i) for i in range(1, 25)]  # Thay đổi số lượng cổng tùy theo switch của bạn
 
-# Gửi lệnh đến từng cổng
+# Nhập lệnh cho từng cổng (Enter để dùng lại lệnh trước), các cổng cùng lệnh được gửi chung bằng interface range
+port_commands = {}
+command = ""
 for port in ports:
-    print(f"Đang gửi lệnh đến cổng {port}")
-    command = input("Nhập lệnh bạn muốn gửi: ")
-    connection.config_mode()  # Chuyển sang chế độ config terminal
-    output = connection.send_command_timing(f"interface {port}\n{command}\nexit")  # Gửi lệnh người dùng nhập vào
+    command = input(f"Nhập lệnh bạn muốn gửi đến cổng {port}: ").strip() or command
+    if command:
+        port_commands.setdefault(command, []).append(port)
+
+config_commands = []
+for command, command_ports in port_commands.items():
+    config_commands.extend(range_config_commands(command_ports, [command], cisco_device['device_type']))
+if config_commands:
+    output = connection.send_config_set(config_commands)  # Một lần vào chế độ config terminal cho tất cả cổng
     print(output)
-    time.sleep(10)  # Dừng 10 giây trước khi gửi lệnh đến cổng tiếp theo
 
 # Đóng kết nối
 connection.disconnect()
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+# Chạy các chế độ của switch_manager không cần giao diện (cron, jump host không có màn hình).
+#   python switch_cli.py --mode mac_search -u admin --start-ip 10.0.0.1 --end-ip 10.0.0.254 --mac 1a2b --mac 3c4d
+#   python switch_cli.py --job nightly_sweep.json
+#   python switch_cli.py --mode save_retry -u admin --ip 10.0.0.7 --ip 10.0.0.9    # lưu lại các switch lưu lỗi
+# Mật khẩu lấy từ --password, job file, biến môi trường SWITCH_MANAGER_PASSWORD hoặc nhập từ bàn phím.
+# Mỗi sự kiện của tác vụ được in ra stdout dưới dạng một dòng JSON; log kỹ thuật ghi ra stderr.
+# Ctrl+C lần đầu: dừng tác vụ an toàn (switch đang xử lý được lưu và ngắt kết nối); lần thứ hai: thoát ngay.
+import argparse
+import getpass
+import json
+import logging
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from ipaddress import ip_address
+from typing import Any, Dict, List, Optional, TextIO
+
+from switch_core import (gui_queue, task_worker, auth_breaker, cancel_token, log_formatter, MAX_CONCURRENT_SWITCHES, MAX_CONCURRENT_SWITCHES_LIMIT,
+                         RESTRICTED_USERNAMES, VALID_VLAN_RE)
+
+# Constants
+MODES = ("enable_ho", "vlan_switch", "full_mac_config", "last4_config", "mac_search", "save_retry")
+MAC_MODES = ("full_mac_config", "last4_config", "mac_search")
+JOB_KEYS = ("mode", "username", "password", "start_ip", "end_ip", "source_vlan", "target_vlan", "mac_list",
+            "max_workers", "async_telnet", "refresh_mac_cache", "tcp_precheck", "timings_file", "inventory_db", "ips")
+PASSWORD_ENV_VAR = "SWITCH_MANAGER_PASSWORD"
+EXIT_OK = 0
+EXIT_DEVICE_ERRORS = 1  # Tác vụ chạy xong nhưng có lỗi trên một hoặc nhiều switch
+EXIT_INVALID_JOB = 2  # Thông tin tác vụ không hợp lệ, không switch nào được xử lý
+EXIT_AUTH_ABORTED = 3  # Dừng sớm vì thiết bị từ chối tài khoản liên tiếp (bộ ngắt xác thực), các switch còn lại bị bỏ qua
+EXIT_INTERRUPTED = 130
+
+logger = logging.getLogger(__name__)
+
+def load_job_file(path: str) -> Dict[str, Any]:
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    if path.lower().endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("Cần cài PyYAML để đọc job file YAML (pip install pyyaml), hoặc dùng job file JSON")
+        job = yaml.safe_load(text)
+    else:
+        job = json.loads(text)
+    if not isinstance(job, dict):
+        raise ValueError(f"Job file {path} phải chứa một object (khóa: giá trị)")
+    unknown_keys = sorted(set(job) - set(JOB_KEYS))
+    if unknown_keys:
+        raise ValueError(f"Khóa không hợp lệ trong job file {path}: {', '.join(unknown_keys)}")
+    return job
+
+def validate_task_details(task_details: Dict[str, Any]) -> Optional[str]:
+    # Cùng các quy tắc kiểm tra với SwitchManagerApp.start_task
+    mode = task_details.get("mode")
+    if mode not in MODES:
+        return f"Chế độ không hợp lệ: {mode!r} (hợp lệ: {', '.join(MODES)})"
+    ip_keys = () if task_details.get("ips") else ("start_ip", "end_ip")
+    missing = [key for key in ("username", "password") + ip_keys if not task_details.get(key)]
+    if missing:
+        return f"Thiếu thông tin: {', '.join(missing)}"
+    try:
+        for ip in task_details.get("ips") or (task_details["start_ip"], task_details["end_ip"]):
+            ip_address(ip)
+    except ValueError:
+        return "Địa chỉ IP Bắt đầu hoặc Kết thúc không hợp lệ." if ip_keys else f"Địa chỉ IP không hợp lệ: {ip}"
+    if mode == "save_retry" and not task_details.get("ips"):
+        return "Chế độ save_retry cần danh sách IP (--ip)."
+    if task_details["username"].lower() in RESTRICTED_USERNAMES:
+        return "Tên và mật khẩu không đúng."
+
+    max_workers = task_details.get("max_workers", MAX_CONCURRENT_SWITCHES)
+    if not isinstance(max_workers, int) or not (1 <= max_workers <= MAX_CONCURRENT_SWITCHES_LIMIT):
+        return f"Số switch song song phải là số từ 1-{MAX_CONCURRENT_SWITCHES_LIMIT}."
+
+    vlan_keys = {"vlan_switch": ("source_vlan", "target_vlan"), "full_mac_config": ("target_vlan",),
+                 "last4_config": ("target_vlan",)}.get(mode, ())
+    for key in vlan_keys:
+        vlan = str(task_details.get(key) or "").strip()
+        if not VALID_VLAN_RE.match(vlan) or not (1 <= int(vlan) <= 4094):
+            return f"{key} là bắt buộc cho chế độ {mode}, phải là số từ 1-4094."
+        task_details[key] = vlan
+    if mode == "vlan_switch" and task_details["source_vlan"] == task_details["target_vlan"]:
+        return "VLAN Nguồn và VLAN Đích không được trùng nhau."
+
+    if mode in MAC_MODES and not task_details.get("mac_list"):
+        return f"Danh sách MAC không được để trống cho chế độ {mode}."
+    return None
+
+def build_task_details(args: argparse.Namespace) -> Dict[str, Any]:
+    task_details = load_job_file(args.job) if args.job else {}
+    overrides = {
+        "mode": args.mode,
+        "username": args.username,
+        "password": args.password,
+        "start_ip": args.start_ip,
+        "end_ip": args.end_ip,
+        "source_vlan": args.source_vlan,
+        "target_vlan": args.target_vlan,
+        "max_workers": args.max_workers,
+        "async_telnet": args.async_telnet,
+        "refresh_mac_cache": args.refresh_mac_cache,
+        "tcp_precheck": args.tcp_precheck,
+        "timings_file": args.timings_jsonl,
+        "inventory_db": args.inventory_db,
+    }
+    task_details.update({key: value for key, value in overrides.items() if value is not None})
+
+    mac_list: List[str] = list(args.mac or [])
+    if args.mac_file:
+        with open(args.mac_file, encoding='utf-8') as f:
+            mac_list.extend(line.strip() for line in f if line.strip())
+    if mac_list:
+        task_details["mac_list"] = mac_list
+    if args.ip:
+        task_details["ips"] = [ip.strip() for ip in args.ip if ip.strip()]
+    task_details["mac_list"] = [str(mac).strip() for mac in task_details.get("mac_list") or [] if str(mac).strip()]
+
+    if not task_details.get("password"):
+        task_details["password"] = os.environ.get(PASSWORD_ENV_VAR) or (
+            getpass.getpass(f"Mật khẩu cho {task_details.get('username', '')}: ") if sys.stdin.isatty() else None)
+    return task_details
+
+def event_to_json(event: tuple) -> str:
+    msg_type, msg_data = event[0], event[1]
+    record: Dict[str, Any] = {"ts": round(time.time(), 3), "event": msg_type}
+    if msg_type == "log":
+        record["level"] = event[2] if len(event) > 2 else "NORMAL"
+        record["message"] = msg_data
+    elif msg_type == "messagebox":
+        record["level"], record["message"] = msg_data
+    elif msg_type == "progress":
+        record["current"], record["total"] = msg_data
+    elif msg_type == "cache_stats":
+        record["hits"], record["misses"] = msg_data
+    else:
+        record["data"] = msg_data
+    return json.dumps(record, ensure_ascii=False, default=str)
+
+def request_stop(signum, frame):
+    if cancel_token.is_cancelled():
+        raise KeyboardInterrupt
+    cancel_token.cancel()
+    print("Đang dừng tác vụ: chờ các switch đang xử lý hoàn tất (Ctrl+C lần nữa để thoát ngay)...", file=sys.stderr)
+
+def run_job(task_details: Dict[str, Any], out: TextIO = sys.stdout) -> int:
+    worker = threading.Thread(target=task_worker, args=(task_details,), name=f"Worker-{task_details['mode']}", daemon=True)
+    worker.start()
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGINT, request_stop)
+    exit_code = EXIT_OK
+    while True:
+        try:
+            event = gui_queue.get(timeout=0.2)
+        except queue.Empty:
+            if not worker.is_alive() and gui_queue.empty():
+                break
+            continue
+        out.write(event_to_json(event) + "\n")
+        out.flush()
+        if event[0] == "messagebox" and event[1][0] == "error":
+            exit_code = EXIT_INVALID_JOB
+        elif event[0] == "log" and len(event) > 2 and event[2] == "ERROR":
+            exit_code = max(exit_code, EXIT_DEVICE_ERRORS)
+    if cancel_token.is_cancelled():
+        return EXIT_INTERRUPTED
+    # Thông báo lỗi của bộ ngắt xác thực đến sau khi đã liên hệ switch, không phải lỗi job
+    if auth_breaker.is_tripped():
+        return EXIT_AUTH_ABORTED
+    return exit_code
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Chạy tác vụ switch_manager không cần giao diện, xuất sự kiện dạng JSON lines")
+    parser.add_argument("--job", help="Job file JSON hoặc YAML với các khóa của task_details; tham số dòng lệnh ghi đè job file")
+    parser.add_argument("--mode", choices=MODES)
+    parser.add_argument("-u", "--username")
+    parser.add_argument("-p", "--password", help=f"Nên dùng biến môi trường {PASSWORD_ENV_VAR} thay vì tham số này")
+    parser.add_argument("--start-ip")
+    parser.add_argument("--end-ip")
+    parser.add_argument("--ip", action="append", help="IP cụ thể thay cho dải --start-ip/--end-ip (vd. save_retry); lặp lại cho nhiều IP")
+    parser.add_argument("--source-vlan")
+    parser.add_argument("--target-vlan")
+    parser.add_argument("--mac", action="append", help="MAC đầy đủ hoặc 4 ký tự cuối; lặp lại cho nhiều MAC")
+    parser.add_argument("--mac-file", help="File chứa danh sách MAC, mỗi dòng một MAC")
+    parser.add_argument("--max-workers", type=int)
+    parser.add_argument("--async-telnet", action="store_true", default=None, help="Chỉ dùng cho mac_search")
+    parser.add_argument("--refresh-mac-cache", action="store_true", default=None,
+                        help="Chỉ dùng cho mac_search; chế độ cấu hình luôn lấy bảng MAC mới")
+    parser.add_argument("--no-tcp-precheck", dest="tcp_precheck", action="store_false", default=None,
+                        help="Không quét cổng TCP trước khi đăng nhập")
+    parser.add_argument("--timings-jsonl", help="Ghi thời gian từng giai đoạn của mỗi switch vào file JSONL (ghi nối tiếp)")
+    parser.add_argument("--inventory-db", help="Kho SQLite ghi lại MAC từ các bảng MAC đầy đủ; các chế độ MAC quét trước switch đã biết")
+    parser.add_argument("--log-level", default="WARNING", help="Mức log kỹ thuật ghi ra stderr (mặc định: WARNING)")
+    args = parser.parse_args(argv)
+
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(log_formatter)
+    handler.setLevel(args.log_level.upper())
+    logging.basicConfig(level=args.log_level.upper(), handlers=[handler])
+
+    try:
+        task_details = build_task_details(args)
+    except (OSError, ValueError) as e:
+        print(f"LỖI: {e}", file=sys.stderr)
+        return EXIT_INVALID_JOB
+    error_msg = validate_task_details(task_details)
+    if error_msg:
+        print(f"LỖI: {error_msg}", file=sys.stderr)
+        return EXIT_INVALID_JOB
+
+    log_details = {k: v for k, v in task_details.items() if k != 'password'}
+    logger.info(f"Bắt đầu tác vụ không giao diện với chi tiết: {log_details}")
+    try:
+        return run_job(task_details)
+    except KeyboardInterrupt:
+        print("Đã dừng bởi người dùng.", file=sys.stderr)
+        return EXIT_INTERRUPTED
+
+if __name__ == "__main__":
+    sys.exit(main())
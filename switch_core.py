@@ -0,0 +1,1952 @@
+# -*- coding: utf-8 -*-
+from netmiko import ConnectHandler
+from netmiko.exceptions import NetmikoTimeoutException, NetmikoAuthenticationException
+import re
+import json
+import math
+import sqlite3
+import struct
+import zlib
+import threading
+import queue
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from ipaddress import ip_address
+from typing import List, Tuple, Optional, Dict, Any, Callable, Iterable, Iterator, Set
+from async_telnet import collect_mac_tables, ASYNC_TELNET_CONCURRENCY, TELNET_PORT
+from reachability import sweep_reachability, SSH_PORT
+from endpoint_inventory import endpoint_inventory
+from mac_diff import mac_differ, MacSnapshot, FLAP_WINDOW_SWEEPS
+from port_range import interface_range_lines, ranges_per_line
+from interface_status import disabled_interfaces
+
+# Constants
+TELNET_TIMEOUT = 20
+MAX_MAC_COUNT_SEARCH = 10  # Skip ports with more than this number of MACs in mac_search mode
+MAX_CONCURRENT_SWITCHES = 10  # Default number of switches processed in parallel per task
+MAX_CONCURRENT_SWITCHES_LIMIT = 64
+COMMAND_READ_TIMEOUT = 90  # Absolute limit for one command, prompt or not
+COMMAND_POLL_INTERVAL = 0.05
+TIMING_LAST_READ = 2.0  # Idle seconds per delay_factor unit that send_command_timing would wait out
+COMMAND_ECHO_CHARS = 40  # Leading characters of the echoed command that mark where its output starts
+PROMPT_TAIL = 256  # Characters before each new chunk searched again for the prompt/expected pattern (may span chunks)
+MAC_CACHE_TTL = 300  # Seconds a downloaded MAC table stays reusable across tasks
+MAC_CACHE_MAX_ENTRIES = 512  # Least recently used switches are evicted beyond this
+PLANNER_MAX_TARGETED = 8  # More MAC targets than this per switch -> download the full table
+PLANNER_MIN_TABLE_SIZE = 300  # Tables last seen smaller than this are cheaper to fetch whole
+PLANNER_FILTER_MAX_LEN = 200  # Max length of one IOS '| include' regex
+MAC_DIFF_LOG_LIMIT = 20  # MAC changes listed per switch; the rest are only counted
+AUTH_FAILURE_THRESHOLD = 3  # Consecutive login rejections that stop the rest of the scan
+MAX_TOTAL_CONNECTIONS = 64  # Telnet sessions open at once across all tasks running in parallel
+MAX_CONCURRENT_TASKS = 4  # Tasks running at once from the task queue; later ones wait their turn
+DEVICE_WAIT_POLL = 0.5  # Seconds between stop checks while waiting for a session slot or a switch lock
+READ_ONLY_MODES = ("mac_search",)  # Modes that never change config and do not take the per-switch lock
+LOG_TAGS = ("ERROR", "WARNING", "SUCCESS", "INFO", "CMD")
+RESTRICTED_USERNAMES = ("vietnd", "vietnd1")
+PHASES = ("wait", "tcp_connect", "login", "find_prompt", "command", "parse", "config", "save", "total")
+RESULT_STATUS_LEVELS = {"Đã chuyển VLAN": "SUCCESS", "Chuyển VLAN thất bại": "ERROR"}
+
+# Logging Setup (Console/GUI Only)
+log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - [%(threadName)s] - %(message)s')
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Regex
+MAC_TABLE_RE = re.compile(
+    r"^\s*(?:\*|\s)\s*(?P<vlan>\d+)\s+"
+    r"(?P<mac>[0-9a-fA-F]{4}\.[0-9a-fA-F]{4}\.[0-9a-fA-F]{4})\s+"
+    r"\S+\s+"
+    r"(?P<port>\S+)\s*$",
+    re.IGNORECASE | re.MULTILINE
+)
+VALID_MAC_RE = re.compile(r'^[0-9a-fA-F:-]{12,17}$')
+VALID_MAC_LAST4_RE = re.compile(r'^[0-9a-fA-F]{4}$')
+VALID_VLAN_RE = re.compile(r'^\d{1,4}$')
+WRITE_MEMORY_DONE_RE = re.compile(r"\[OK\][\s\S]*[>#]\s*$|\[confirm\]\s*$|\]\?\s*$", re.IGNORECASE)
+WRITE_MEMORY_OK_RE = re.compile(r"\[OK\][\s\S]*[>#]\s*$", re.IGNORECASE)
+WRITE_MEMORY_CONFIRM_RE = re.compile(r"\[confirm\]\s*$|\]\?\s*$", re.IGNORECASE)
+PHYSICAL_PORT_RE = re.compile(r'^(Gi|Fa|Te|Eth)\d+([/\d.]*)?$', re.IGNORECASE)
+CONFIG_ECHO_RE = re.compile(r"^\S+\(config[^)]*\)#\s*(.*?)\s*$")
+# "% Access VLAN does not exist. Creating vlan ..." chỉ là thông báo, không phải lỗi
+CONFIG_ERROR_RE = re.compile(r"^%\s*(?:Invalid input|Incomplete command|Ambiguous command|Error|.*\b(?:rejected|failed|not allowed)\b)",
+                             re.IGNORECASE)
+
+# Thread-Safe Queue
+gui_queue = queue.Queue()
+_worker_local = threading.local()
+
+def post_event(event: Tuple[Any, ...]):
+    # Sự kiện log: ("log", message) hoặc ("log", message, level) với level thuộc LOG_TAGS
+    # Trong luồng quét song song, sự kiện được gom theo từng switch để GUI hiển thị đúng thứ tự.
+    # Ngoài luồng quét, sự kiện đi vào hàng đợi của tác vụ hiện tại (gui_queue khi chạy không qua TaskQueue)
+    events = getattr(_worker_local, 'events', None)
+    if events is not None:
+        events.append(event)
+    else:
+        current_task().events.put(event)
+
+class PhaseTimings:
+    # Thời gian từng giai đoạn (kết nối TCP, đăng nhập, lệnh, phân tích, cấu hình, lưu) theo từng switch trong một lần chạy
+    def __init__(self):
+        self.mode: Optional[str] = None
+        self.run_started: Optional[float] = None
+        self._spans: 'OrderedDict[str, List[Tuple[str, Optional[str], float]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def reset(self, mode: Optional[str]):
+        with self._lock:
+            self.mode = mode
+            self.run_started = time.time()
+            self._spans.clear()
+
+    def add(self, ip: str, phase: str, duration: float, detail: Optional[str] = None):
+        with self._lock:
+            self._spans.setdefault(ip, []).append((phase, detail, duration))
+
+    def records(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{
+                "run_started": self.run_started,
+                "mode": self.mode,
+                "ip": ip,
+                "spans": [{"phase": phase, "detail": detail, "duration": round(duration, 4)} for phase, detail, duration in spans],
+            } for ip, spans in self._spans.items()]
+
+    def summary(self) -> Dict[str, Tuple[int, float, float, float]]:
+        # phase -> (số lần, p50, p95, max)
+        with self._lock:
+            by_phase: Dict[str, List[float]] = {}
+            for spans in self._spans.values():
+                for phase, _, duration in spans:
+                    by_phase.setdefault(phase, []).append(duration)
+        result = {}
+        for phase in sorted(by_phase, key=lambda p: PHASES.index(p) if p in PHASES else len(PHASES)):
+            durations = sorted(by_phase[phase])
+            result[phase] = (len(durations), _percentile(durations, 50), _percentile(durations, 95), durations[-1])
+        return result
+
+    def export_jsonl(self, path: str):
+        # Nhiều tác vụ có thể ghi cùng một file khi kết thúc cùng lúc
+        with _export_lock, open(path, 'a', encoding='utf-8') as f:
+            for record in self.records():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    return sorted_values[max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)]
+
+phase_timings = PhaseTimings()
+_export_lock = threading.Lock()
+
+@contextmanager
+def timed_phase(ip: str, phase: str, detail: Optional[str] = None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current_task().phase_timings.add(ip, phase, time.perf_counter() - start, detail)
+
+# Core Network & Logic Functions
+def generate_switch_ips(start_ip: str, end_ip: str) -> Tuple[Optional[List[str]], Optional[str]]:
+    ip_list = []
+    try:
+        start_ip_clean = start_ip.strip()
+        end_ip_clean = end_ip.strip()
+        start_parts = start_ip_clean.split('.')
+        end_parts = end_ip_clean.split('.')
+
+        if (len(start_parts) != 4 or len(end_parts) != 4 or
+                not all(part.isdigit() and 0 <= int(part) <= 255 for part in start_parts + end_parts)):
+            raise ValueError("Định dạng địa chỉ IP không hợp lệ.")
+
+        start_octets = [int(x) for x in start_parts]
+        end_octets = [int(x) for x in end_parts]
+
+        start_num = (start_octets[0] << 24) | (start_octets[1] << 16) | (start_octets[2] << 8) | start_octets[3]
+        end_num = (end_octets[0] << 24) | (end_octets[1] << 16) | (end_octets[2] << 8) | end_octets[3]
+
+        if start_num > end_num:
+            raise ValueError("IP bắt đầu phải nhỏ hơn hoặc bằng IP kết thúc.")
+
+        ip_count = end_num - start_num + 1
+        if ip_count > 1024:
+            logger.warning(f"Yêu cầu dải IP lớn: {start_ip_clean} - {end_ip_clean} ({ip_count} IPs)")
+
+        current_num = start_num
+        while current_num <= end_num:
+            ip = f"{(current_num >> 24) & 255}.{(current_num >> 16) & 255}.{(current_num >> 8) & 255}.{current_num & 255}"
+            ip_list.append(ip)
+            current_num += 1
+
+        if not ip_list:
+            raise ValueError("Danh sách IP sinh ra trống (dải có thể không hợp lệ).")
+
+        return ip_list, None
+
+    except ValueError as e:
+        logger.error(f"Lỗi dải IP: {e}. Đầu vào: '{start_ip}' - '{end_ip}'")
+        return None, f"Lỗi dải IP: {e}"
+    except Exception as e:
+        logger.exception(f"Lỗi không xác định khi tạo dải IP: {start_ip} - {end_ip}")
+        return None, f"Lỗi không xác định khi tạo dải IP: {e}"
+
+def clean_mac(mac: str) -> Optional[str]:
+    cleaned = re.sub(r'[-:.]', '', mac.strip().lower())
+    if len(cleaned) == 12 and all(c in '0123456789abcdef' for c in cleaned):
+        return cleaned
+    logger.warning(f"Phát hiện định dạng MAC không hợp lệ: {mac}")
+    return None
+
+def format_mac_cisco(mac_cleaned: str) -> str:
+    if len(mac_cleaned) != 12:
+        logger.error(f"Đầu vào không hợp lệ cho format_mac_cisco: {mac_cleaned}")
+        return mac_cleaned
+    return f"{mac_cleaned[:4]}.{mac_cleaned[4:8]}.{mac_cleaned[8:]}"
+
+class AuthCircuitBreaker:
+    # Dừng quét khi nhiều switch liên tiếp từ chối cùng một tài khoản (tránh khóa tài khoản trên TACACS/AAA).
+    # Chỉ tính các lần đăng nhập bị từ chối; IP không phản hồi không làm thay đổi bộ đếm.
+    # Chưa có lần đăng nhập nào thành công (hoặc vừa bị từ chối) thì chỉ cho tối đa threshold - số lần từ chối liên tiếp
+    # phiên đăng nhập chạy cùng lúc, để số lần bị từ chối không vượt ngưỡng dù nhiều switch được xử lý song song.
+    def __init__(self, threshold: int = AUTH_FAILURE_THRESHOLD):
+        self.threshold = threshold
+        self.username: Optional[str] = None
+        self.failed_ips: List[str] = []
+        self.skipped = 0
+        self.tripped = False
+        self.consecutive = 0
+        self._verified = False
+        self._logins_in_flight = 0
+        self._condition = threading.Condition()
+
+    def reset(self, username: Optional[str]):
+        with self._condition:
+            self.username = username
+            self.failed_ips = []
+            self.skipped = 0
+            self.tripped = False
+            self.consecutive = 0
+            self._verified = False
+            self._logins_in_flight = 0
+            self._condition.notify_all()
+
+    def _login_limit(self) -> float:
+        if self._verified and self.consecutive == 0:
+            return math.inf
+        return max(1, self.threshold - self.consecutive)
+
+    def begin_login(self, cancel: Optional["CancelToken"] = None) -> bool:
+        # Chờ đến lượt đăng nhập; False nếu đã dừng quét (hoặc tác vụ được yêu cầu dừng) trong lúc chờ
+        with self._condition:
+            while not self.tripped and self._logins_in_flight >= self._login_limit():
+                if cancel is not None and cancel.is_cancelled():
+                    return False
+                self._condition.wait(DEVICE_WAIT_POLL)
+            if self.tripped:
+                return False
+            self._logins_in_flight += 1
+            return True
+
+    def end_login(self):
+        with self._condition:
+            self._logins_in_flight -= 1
+            self._condition.notify_all()
+
+    def record(self, ip: str, success: bool):
+        with self._condition:
+            self._condition.notify_all()
+            if success:
+                self._verified = True
+                self.consecutive = 0
+                return
+            self.consecutive += 1
+            self.failed_ips.append(ip)
+            if self.consecutive >= self.threshold and not self.tripped:
+                self.tripped = True
+                logger.error(f"Dừng quét: {self.consecutive} lần xác thực thất bại liên tiếp với tài khoản '{self.username}'")
+
+    def is_tripped(self) -> bool:
+        return self.tripped
+
+    def skip(self, ip: str):
+        with self._condition:
+            self.skipped += 1
+        logger.info(f"Bỏ qua {ip}: đã dừng quét do xác thực thất bại liên tiếp")
+
+auth_breaker = AuthCircuitBreaker()
+
+class CancelToken:
+    # Dừng tác vụ theo yêu cầu (nút Dừng, Ctrl+C). Switch chưa bắt đầu bị bỏ qua; switch đang xử lý
+    # hoàn tất lệnh cấu hình đang gửi, lưu cấu hình nếu đã thay đổi rồi ngắt kết nối.
+    def __init__(self):
+        self.skipped = 0
+        self.requested_at: Optional[float] = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.skipped = 0
+            self.requested_at = None
+            self._event.clear()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.requested_at = time.time()
+            self._event.set()
+        logger.warning("Đã nhận yêu cầu dừng tác vụ")
+
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def skip(self, ip: str):
+        with self._lock:
+            self.skipped += 1
+        logger.info(f"Bỏ qua {ip}: tác vụ đã được yêu cầu dừng")
+
+cancel_token = CancelToken()
+
+class MacQueryPlanner:
+    # Chọn cách lấy bảng MAC cho từng switch: toàn bộ bảng, lọc theo MAC ('| include'), hoặc theo VLAN.
+    # Ghi lại quyết định và số byte đã nhận của từng switch; mỗi tác vụ có planner riêng (TaskContext.mac_query_planner).
+    def __init__(self, max_targeted: int = PLANNER_MAX_TARGETED, min_table_size: int = PLANNER_MIN_TABLE_SIZE,
+                 filter_max_len: int = PLANNER_FILTER_MAX_LEN, shared_sizes: Optional['MacQueryPlanner'] = None):
+        self.max_targeted = max_targeted
+        self.min_table_size = min_table_size
+        self.filter_max_len = filter_max_len
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        # Số MAC lần trước là thông tin của switch chứ không của tác vụ: planner của các tác vụ dùng chung với shared_sizes
+        self._table_sizes: Dict[str, int] = shared_sizes._table_sizes if shared_sizes is not None else {}
+        self._sizes_lock = shared_sizes._sizes_lock if shared_sizes is not None else threading.Lock()
+
+    def plan(self, ip: str, mode: Optional[str], targets: Optional[List[str]]) -> Tuple[str, List[str]]:
+        if mode == "vlan_switch" and targets:
+            return "vlan", [f"show mac address-table vlan {targets[0]}"]
+        if mode not in ("full_mac_config", "last4_config", "mac_search") or not targets:
+            return "full", ["show mac address-table"]
+        with self._sizes_lock:
+            last_size = self._table_sizes.get(ip)
+        if len(targets) > self.max_targeted or (last_size is not None and last_size < self.min_table_size):
+            return "full", ["show mac address-table"]
+
+        patterns = [format_mac_cisco(t) if mode == "full_mac_config" else t for t in targets]
+        commands = []
+        batch: List[str] = []
+        for pattern in patterns:
+            if batch and len("|".join(batch + [pattern])) > self.filter_max_len:
+                commands.append(f"show mac address-table | include {'|'.join(batch)}")
+                batch = []
+            batch.append(pattern)
+        if batch:
+            commands.append(f"show mac address-table | include {'|'.join(batch)}")
+        return "filtered", commands
+
+    def record_table_size(self, ip: str, entry_count: int):
+        with self._sizes_lock:
+            self._table_sizes[ip] = entry_count
+
+    def record(self, ip: str, strategy: str, commands: List[str], bytes_received: int):
+        with self._lock:
+            self.records[ip] = {"strategy": strategy, "commands": list(commands), "bytes": bytes_received}
+        logger.info(f"Kế hoạch truy vấn bảng MAC cho {ip}: {strategy}, {len(commands)} lệnh, {bytes_received} byte")
+
+    def forget(self, ips: Iterable[str]):
+        with self._lock:
+            for ip in ips:
+                self.records.pop(ip, None)
+
+    def summary(self, ips: Iterable[str]) -> Tuple[Dict[str, int], int]:
+        strategies: Dict[str, int] = {}
+        total_bytes = 0
+        with self._lock:
+            for ip in ips:
+                record = self.records.get(ip)
+                if record is None:
+                    continue
+                strategies[record["strategy"]] = strategies.get(record["strategy"], 0) + 1
+                total_bytes += record["bytes"]
+        return strategies, total_bytes
+
+mac_query_planner = MacQueryPlanner()
+
+class TaskContext:
+    # Trạng thái riêng của một tác vụ: hàng đợi sự kiện GUI, bộ ngắt xác thực, yêu cầu dừng, thời gian từng giai đoạn
+    # và thống kê truy vấn bảng MAC. Các tác vụ chạy đồng thời qua TaskQueue mỗi tác vụ có một TaskContext.
+    def __init__(self, name: str, events: Optional[queue.Queue] = None, auth: Optional[AuthCircuitBreaker] = None,
+                 cancel: Optional[CancelToken] = None, timings: Optional[PhaseTimings] = None,
+                 planner: Optional[MacQueryPlanner] = None):
+        self.name = name
+        self.events = events if events is not None else queue.Queue()
+        self.auth_breaker = auth if auth is not None else AuthCircuitBreaker()
+        self.cancel_token = cancel if cancel is not None else CancelToken()
+        self.phase_timings = timings if timings is not None else PhaseTimings()
+        self.mac_query_planner = planner if planner is not None else MacQueryPlanner(shared_sizes=mac_query_planner)
+
+# Tác vụ chạy trực tiếp bằng task_worker (CLI, benchmark) dùng các đối tượng toàn cục
+default_task = TaskContext("default", gui_queue, auth_breaker, cancel_token, phase_timings, mac_query_planner)
+_task_local = threading.local()
+
+def current_task() -> TaskContext:
+    return getattr(_task_local, 'context', None) or default_task
+
+class DeviceScheduler:
+    # Dùng chung giữa các tác vụ: giới hạn tổng số phiên Telnet đang mở và không cho hai tác vụ cùng thay đổi
+    # cấu hình một switch. Chỗ phiên và khóa switch được lấy cùng lúc, luồng chờ khóa không giữ chỗ phiên.
+    def __init__(self, max_connections: int = MAX_TOTAL_CONNECTIONS):
+        self.max_connections = max_connections
+        self._in_use = 0
+        self._locked: Dict[str, str] = {}  # IP -> tên tác vụ đang giữ khóa
+        self._condition = threading.Condition()
+
+    def acquire(self, ip: str, lock_device: bool, task: TaskContext) -> bool:
+        # False nếu tác vụ được yêu cầu dừng trong lúc chờ
+        waiting_logged = False
+        with self._condition:
+            while self._in_use >= self.max_connections or (lock_device and ip in self._locked):
+                if task.cancel_token.is_cancelled():
+                    return False
+                owner = self._locked.get(ip) if lock_device else None
+                if owner and not waiting_logged:
+                    post_event(("log", f"Đang chờ tác vụ {owner} xử lý xong {ip}...", "INFO"))
+                    waiting_logged = True
+                self._condition.wait(DEVICE_WAIT_POLL)
+            self._in_use += 1
+            if lock_device:
+                self._locked[ip] = task.name
+            return True
+
+    def release(self, ip: str, lock_device: bool):
+        with self._condition:
+            self._in_use -= 1
+            if lock_device:
+                self._locked.pop(ip, None)
+            self._condition.notify_all()
+
+    def acquire_slots(self, wanted: int, task: TaskContext) -> int:
+        # Cho các phiên đọc bất đồng bộ: chờ đến khi còn ít nhất một chỗ, lấy tối đa wanted chỗ
+        with self._condition:
+            while self._in_use >= self.max_connections:
+                if task.cancel_token.is_cancelled():
+                    return 0
+                self._condition.wait(DEVICE_WAIT_POLL)
+            slots = min(wanted, self.max_connections - self._in_use)
+            self._in_use += slots
+            return slots
+
+    def release_slots(self, slots: int):
+        with self._condition:
+            self._in_use -= slots
+            self._condition.notify_all()
+
+    def stats(self) -> Tuple[int, int, int]:
+        # (phiên đang dùng, giới hạn phiên, số switch đang bị khóa)
+        with self._condition:
+            return self._in_use, self.max_connections, len(self._locked)
+
+device_scheduler = DeviceScheduler()
+
+def connect_to_device(ip: str, username: str, password: str) -> Tuple[Optional[ConnectHandler], str]:
+    device_info = {
+        'device_type': 'cisco_ios_telnet',
+        'host': ip,
+        'username': username,
+        'password': password,
+        'timeout': TELNET_TIMEOUT,
+    }
+    try:
+        logger.info(f"Đang thử kết nối Telnet đến {ip}...")
+        with timed_phase(ip, "login"):
+            connection = ConnectHandler(**device_info)
+        with timed_phase(ip, "find_prompt"):
+            prompt = connection.find_prompt()
+        logger.info(f"Kết nối Telnet thành công đến {ip} ({prompt})")
+        current_task().auth_breaker.record(ip, True)
+        return connection, f"Đã kết nối Telnet đến {ip}"
+    except NetmikoTimeoutException:
+        logger.warning(f"Hết thời gian kết nối Telnet đến {ip}")
+        return None, f"Hết thời gian kết nối Telnet đến {ip}"
+    except NetmikoAuthenticationException:
+        logger.error(f"Xác thực Telnet thất bại cho {ip}")
+        current_task().auth_breaker.record(ip, False)
+        return None, f"Xác thực Telnet thất bại cho {ip}"
+    except Exception as e:
+        logger.exception(f"Kết nối Telnet đến {ip} thất bại: {type(e).__name__}")
+        return None, f"Lỗi kết nối Telnet đến {ip}: {type(e).__name__}"
+
+def disconnect_device(connection: Optional[ConnectHandler], ip: str):
+    if connection and connection.is_alive():
+        try:
+            connection.disconnect()
+            logger.info(f"Đã ngắt kết nối Telnet khỏi {ip}")
+        except Exception:
+            logger.exception(f"Lỗi khi ngắt kết nối Telnet khỏi {ip}")
+    elif connection:
+        logger.warning(f"Thử ngắt kết nối Telnet khỏi {ip}, nhưng kết nối không còn hoạt động.")
+
+def run_command(connection: ConnectHandler, command: str, expect_pattern: Optional[re.Pattern] = None,
+                delay_factor: float = 2, read_timeout: float = COMMAND_READ_TIMEOUT,
+                strip_prompt: bool = True, strip_command: bool = True,
+                on_chunk: Optional[Callable[[str], Any]] = None, keep_output: bool = True) -> str:
+    # Trả về ngay khi thấy prompt (hoặc mẫu mong đợi của lệnh, vd. [OK] cho 'write memory').
+    # Chỉ khi không mẫu nào khớp mới quay về cách chờ theo thời gian như send_command_timing.
+    # on_chunk nhận từng đoạn dữ liệu ngay khi đọc được (vd. để phân tích bảng MAC trong lúc đang tải).
+    # keep_output=False: đầu ra chỉ đi qua on_chunk, không được giữ lại và hàm trả về chuỗi rỗng.
+    ip = getattr(connection, 'host', 'IP không xác định')
+    if expect_pattern is None:
+        expect_pattern = re.compile(rf"{re.escape(connection.base_prompt)}[^\n]*[>#]\s*$")
+    idle_limit = TIMING_LAST_READ * delay_factor
+    # Prompt còn sót trong kênh (vd. phản hồi trễ của find_prompt) không được tính: chỉ tìm sau phần lặp lại lệnh
+    echo_marker = command.strip()[:COMMAND_ECHO_CHARS]
+    echo_start: Optional[int] = None
+    echo_end = 0
+    chunks: List[str] = []
+    # Chỉ giữ phần cuối đầu ra để tìm phần lặp lại lệnh và prompt; window_start là vị trí của nó trong toàn bộ đầu ra
+    window = ""
+    window_start = 0
+
+    connection.write_channel(connection.normalize_cmd(command))
+    matched = False
+    start = time.monotonic()
+    last_data_at = start
+    while True:
+        chunk = connection.read_channel()
+        now = time.monotonic()
+        if chunk:
+            last_data_at = now
+            if keep_output:
+                chunks.append(chunk)
+            if on_chunk is not None:
+                on_chunk(chunk)
+            window += chunk
+            # Chỉ tìm trong đoạn mới và PROMPT_TAIL ký tự trước nó, không quét lại toàn bộ đầu ra mỗi lần nhận dữ liệu
+            if echo_start is None:
+                echo_index = window.find(echo_marker, max(0, len(window) - len(chunk) - len(echo_marker)))
+                if echo_index != -1:
+                    echo_start = window_start + echo_index
+                    echo_end = echo_start + len(echo_marker)
+            if echo_start is not None and expect_pattern.search(window, max(echo_end - window_start, len(window) - len(chunk) - PROMPT_TAIL)):
+                matched = True
+                break
+            if len(window) > PROMPT_TAIL:
+                window_start += len(window) - PROMPT_TAIL
+                window = window[-PROMPT_TAIL:]
+        elif now - last_data_at >= idle_limit:
+            break
+        if now - start >= read_timeout:
+            logger.warning(f"Lệnh '{command}' trên {ip} vượt quá {read_timeout}s, trả về đầu ra đã nhận")
+            break
+        time.sleep(COMMAND_POLL_INTERVAL)
+
+    elapsed = time.monotonic() - start
+    current_task().phase_timings.add(ip, "command", elapsed, command)
+    if matched:
+        logger.info(f"'{command}' @ {ip}: hoàn tất sau {elapsed:.2f}s theo prompt (chờ cố định sẽ mất thêm tới {idle_limit:.1f}s)")
+    else:
+        logger.info(f"'{command}' @ {ip}: không thấy prompt/mẫu mong đợi, dùng chờ theo thời gian ({elapsed:.2f}s)")
+
+    if not keep_output:
+        return ""
+    output = "".join(chunks)
+    if echo_start:
+        output = output[echo_start:]
+    if strip_command:
+        output = connection.strip_command(command, output)
+    if strip_prompt:
+        output = connection.strip_prompt(output)
+    return output
+
+def get_mac_address_table(connection: ConnectHandler, command: str = "show mac address-table",
+                          parser: Optional["MacTableStreamParser"] = None) -> Optional[str]:
+    # Có parser: dữ liệu được phân tích ngay khi nhận, không giữ đầu ra thô (trả về chuỗi rỗng khi thành công)
+    ip = getattr(connection, 'host', 'IP không xác định')
+    try:
+        logger.debug(f"Gửi lệnh '{command}' đến {ip}")
+        if parser is not None:
+            output = run_command(connection, command, delay_factor=2, on_chunk=parser.feed, keep_output=False)
+            parser.close()
+        else:
+            output = run_command(connection, command, delay_factor=2)
+        logger.debug(f"Nhận bảng MAC từ {ip} (độ dài: {parser.chars_received if parser is not None else len(output or '')})")
+        if output is None:
+            logger.error(f"Lệnh '{command}' trả về None cho {ip}")
+            post_event(("log", f"LỖI: Không lấy được bảng MAC từ {ip} (Lệnh trả về None)", "ERROR"))
+            return None
+        return output
+    except Exception as e:
+        logger.exception(f"Không lấy được bảng MAC từ {ip}")
+        post_event(("log", f"LỖI: Không lấy được bảng MAC từ {ip}: {e}", "ERROR"))
+        return None
+
+class MacTable:
+    # Bảng MAC đã phân tích kèm các chỉ mục dựng trong một lần duyệt:
+    # số MAC theo cổng, MAC -> mục, VLAN -> cổng, 4 ký tự cuối -> các mục
+    def __init__(self):
+        self.entries: List[Dict[str, str]] = []
+        self.port_counts: Dict[str, int] = {}
+        self.by_mac: Dict[str, Dict[str, str]] = {}
+        self.vlan_ports: Dict[str, Set[str]] = {}
+        self.by_last4: Dict[str, List[Dict[str, str]]] = {}
+        self.complete = True  # False khi bảng chỉ là kết quả truy vấn đã lọc
+
+    def add(self, entry: Dict[str, str]):
+        mac = entry['mac']
+        port = entry['port']
+        self.entries.append(entry)
+        self.port_counts[port] = self.port_counts.get(port, 0) + 1
+        self.by_mac.setdefault(mac, entry)
+        self.vlan_ports.setdefault(entry['vlan'], set()).add(port)
+        self.by_last4.setdefault(mac[-4:], []).append(entry)
+
+    def count_on_port(self, port: str) -> int:
+        return self.port_counts.get(port.lower(), 0)
+
+    def find_mac(self, mac_cisco: str) -> Optional[Dict[str, str]]:
+        return self.by_mac.get(mac_cisco.lower())
+
+    def find_last4(self, last4: str) -> List[Dict[str, str]]:
+        last4_lower = last4.lower()
+        if len(last4_lower) == 4:
+            return self.by_last4.get(last4_lower, [])
+        return [entry for entry in self.entries if entry['mac'].replace('.', '').endswith(last4_lower)]
+
+    def ports_in_vlan(self, vlan: str) -> List[str]:
+        return sorted(self.vlan_ports.get(vlan.lower(), ()))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        return iter(self.entries)
+
+class MacTableStreamParser:
+    # Phân tích bảng MAC theo từng đoạn dữ liệu nhận từ kênh Telnet; dòng bị cắt giữa hai đoạn
+    # được giữ lại đến khi nhận đủ. Không cần giữ toàn bộ đầu ra trong bộ nhớ để phân tích.
+    def __init__(self):
+        self.table = MacTable()
+        self.parse_seconds = 0.0
+        self.chars_received = 0
+        self._partial_line = ""
+
+    def feed(self, chunk: str) -> List[Dict[str, str]]:
+        self.chars_received += len(chunk)
+        data = self._partial_line + chunk
+        last_newline = data.rfind("\n")
+        if last_newline == -1:
+            self._partial_line = data
+            return []
+        self._partial_line = data[last_newline + 1:]
+        start = time.perf_counter()
+        new_entries = self._parse_lines(data[:last_newline + 1])
+        self.parse_seconds += time.perf_counter() - start
+        return new_entries
+
+    def close(self) -> MacTable:
+        if self._partial_line:
+            start = time.perf_counter()
+            self._parse_lines(self._partial_line)
+            self.parse_seconds += time.perf_counter() - start
+            self._partial_line = ""
+        return self.table
+
+    def _parse_lines(self, text: str) -> List[Dict[str, str]]:
+        new_entries = []
+        for match in MAC_TABLE_RE.finditer(text):
+            try:
+                entry_data = {k: v.strip().lower() for k, v in match.groupdict().items()}
+                if not entry_data.get('vlan') or not entry_data.get('mac') or not entry_data.get('port'):
+                    logger.warning(f"Bỏ qua mục MAC phân tích không đầy đủ: {match.group(0)}")
+                    continue
+                self.table.add(entry_data)
+                new_entries.append(entry_data)
+            except Exception as e:
+                logger.error(f"Lỗi phân tích dòng bảng MAC: {match.group(0)} - {e}")
+        return new_entries
+
+def parse_mac_table(mac_table_output: str) -> MacTable:
+    parser = MacTableStreamParser()
+    if mac_table_output:
+        parser.feed(mac_table_output)
+    return parser.close()
+
+def count_macs_on_port(parsed_mac_table: MacTable, target_port: str) -> int:
+    return parsed_mac_table.count_on_port(target_port)
+
+def find_mac_in_parsed_table(parsed_mac_table: MacTable, target_mac_cleaned: str) -> Optional[Tuple[str, str, int]]:
+    entry = parsed_mac_table.find_mac(format_mac_cisco(target_mac_cleaned))
+    if entry is None:
+        return None
+    port = entry.get('port', 'Không xác định')
+    vlan = entry.get('vlan', 'Không xác định')
+    return port, vlan, parsed_mac_table.count_on_port(port)
+
+def find_mac_last4_in_parsed_table(parsed_mac_table: MacTable, target_mac_last4: str) -> List[Tuple[str, str, str, int]]:
+    found_entries = []
+    for entry in parsed_mac_table.find_last4(target_mac_last4):
+        port = entry.get('port', 'Không xác định')
+        vlan = entry.get('vlan', 'Không xác định')
+        found_entries.append((entry['mac'], port, vlan, parsed_mac_table.count_on_port(port)))
+    return found_entries
+
+def match_mac_targets(parsed_mac_table: MacTable, targets: Iterable[str], match_last4: bool) -> Dict[str, List[Tuple[str, str, str, int]]]:
+    # Tìm tất cả mục tiêu trong một lượt qua chỉ mục của bảng MAC (không quét lại bảng cho từng mục tiêu)
+    hits: Dict[str, List[Tuple[str, str, str, int]]] = {}
+    for target in set(targets):
+        if match_last4:
+            entries = parsed_mac_table.find_last4(target)
+        else:
+            entry = parsed_mac_table.find_mac(format_mac_cisco(target))
+            entries = [entry] if entry is not None else []
+        hits[target] = [(entry['mac'], entry['port'], entry['vlan'], parsed_mac_table.count_on_port(entry['port']))
+                        for entry in entries]
+    return hits
+
+class MacTableCache:
+    # Cache LRU có TTL cho bảng MAC đã phân tích (không giữ đầu ra thô), dùng chung giữa các tác vụ
+    def __init__(self, ttl: float = MAC_CACHE_TTL, max_entries: int = MAC_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[str, Tuple[float, MacTable]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ip: str) -> Optional[Tuple[MacTable, float]]:
+        with self._lock:
+            entry = self._entries.get(ip)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, parsed_table = entry
+            age = time.monotonic() - stored_at
+            if age > self.ttl:
+                del self._entries[ip]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(ip)
+            self.hits += 1
+            return parsed_table, age
+
+    def put(self, ip: str, parsed_table: MacTable):
+        with self._lock:
+            self._entries[ip] = (time.monotonic(), parsed_table)
+            self._entries.move_to_end(ip)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def is_fresh(self, ip: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(ip)
+            return entry is not None and time.monotonic() - entry[0] <= self.ttl
+
+    def invalidate(self, ip: str):
+        with self._lock:
+            self._entries.pop(ip, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Tuple[int, int]:
+        with self._lock:
+            return self.hits, self.misses
+
+mac_table_cache = MacTableCache()
+
+def configure_vlan(connection: ConnectHandler, port: str, vlan: str) -> bool:
+    ip = getattr(connection, 'host', 'IP không xác định')
+    config_commands = [
+        f"interface {port}",
+        f"switchport access vlan {vlan}",
+        "end"
+    ]
+    try:
+        logger.info(f"Cấu hình VLAN {vlan} trên {port} @ {ip}")
+        with timed_phase(ip, "config", port):
+            output = connection.send_config_set(config_commands, exit_config_mode=False)
+        logger.debug(f"Kết quả cấu hình VLAN từ {ip} cho {port}: {output}")
+        output_lower = output.lower() if output else ""
+        if "error" in output_lower or "invalid" in output_lower or "exceeded" in output_lower or "%" in output:
+            logger.error(f"Có thể xảy ra lỗi khi cấu hình VLAN {vlan} trên {port} @ {ip}. Kết quả: {output}")
+            post_event(("log", f"CẢNH BÁO: Có thể xảy ra lỗi khi cấu hình VLAN {vlan} trên {port} @ {ip}. Kết quả: {output}", "WARNING"))
+        post_event(("log", f"Đã đặt VLAN {vlan} trên {port} @ {ip}", "SUCCESS"))
+        return True
+    except Exception as e:
+        logger.exception(f"Không đặt được VLAN {vlan} trên {port} @ {ip}")
+        post_event(("log", f"LỖI: Không đặt được VLAN {vlan} trên {port} @ {ip}: {e}", "ERROR"))
+        return False
+
+def config_errors_by_command(output: str, commands: List[str]) -> Dict[int, List[str]]:
+    # Gán mỗi dòng lỗi "% ..." cho lệnh được echo ngay trước nó (theo thứ tự trong commands)
+    errors: Dict[int, List[str]] = {}
+    normalized = [" ".join(command.split()).lower() for command in commands]
+    current = -1
+    for line in (output or "").splitlines():
+        line = line.strip()
+        echo = CONFIG_ECHO_RE.match(line)
+        if echo:
+            echoed = " ".join(echo.group(1).split()).lower()
+            for index in range(current + 1, len(normalized)):
+                if normalized[index] == echoed:
+                    current = index
+                    break
+            continue
+        if current >= 0 and CONFIG_ERROR_RE.match(line):
+            errors.setdefault(current, []).append(line)
+    return errors
+
+def push_port_groups(connection: ConnectHandler, groups: List[Tuple[str, List[str]]],
+                     commands: List[str]) -> Tuple[List[str], Dict[str, str], List[str]]:
+    # Một lần send_config_set cho mọi nhóm cổng, mỗi nhóm nhận cùng các lệnh commands.
+    # Trả về (cổng đã cấu hình, {cổng lỗi: lý do}, cổng của nhóm bị từ chối lệnh interface)
+    ip = getattr(connection, 'host', 'IP không xác định')
+    config_commands: List[str] = []
+    for interface_line, _ in groups:
+        config_commands.append(interface_line)
+        config_commands.extend(commands)
+    config_commands.append("end")
+    port_count = sum(len(group_ports) for _, group_ports in groups)
+
+    logger.info(f"Cấu hình {commands} trên {port_count} cổng @ {ip} ({len(groups)} lệnh interface)")
+    with timed_phase(ip, "config", f"{port_count} cổng"):
+        output = connection.send_config_set(config_commands, exit_config_mode=False)
+    logger.debug(f"Kết quả cấu hình từ {ip}: {output}")
+
+    errors = config_errors_by_command(output, config_commands)
+    configured: List[str] = []
+    failed: Dict[str, str] = {}
+    rejected: List[str] = []
+    stride = len(commands) + 1
+    for group_index, (interface_line, group_ports) in enumerate(groups):
+        interface_errors = errors.get(stride * group_index)
+        command_errors = [line for offset in range(1, stride) for line in errors.get(stride * group_index + offset, [])]
+        if interface_errors:
+            # Lỗi ở các lệnh phía sau chỉ là hệ quả, không xét
+            logger.warning(f"{ip} từ chối '{interface_line}': {interface_errors[0]}")
+            if len(group_ports) > 1:
+                rejected.extend(group_ports)
+            else:
+                failed.update({port: interface_errors[0] for port in group_ports})
+        elif command_errors:
+            failed.update({port: command_errors[0] for port in group_ports})
+        else:
+            configured.extend(group_ports)
+    return configured, failed, rejected
+
+def configure_ports_bulk(connection: ConnectHandler, ports: List[str], commands: List[str]) -> Tuple[List[str], Dict[str, str]]:
+    # Áp dụng cùng các lệnh cho tất cả cổng trong một lần vào chế độ cấu hình, các cổng liên tiếp gộp thành interface range.
+    # Nhóm nào switch không nhận interface range thì đẩy lại từng cổng trong một lần nữa. Trả về (cổng đã cấu hình, {cổng lỗi: lý do})
+    ip = getattr(connection, 'host', 'IP không xác định')
+    groups = interface_range_lines(ports, ranges_per_line(getattr(connection, 'device_type', None)))
+    configured, failed, rejected = push_port_groups(connection, groups, commands)
+    if rejected:
+        post_event(("log", f"    {ip} không nhận interface range cho {len(rejected)} cổng, cấu hình lại từng cổng...", "WARNING"))
+        retried, retry_failed, _ = push_port_groups(connection, [(f"interface {port}", [port]) for port in rejected], commands)
+        configured.extend(retried)
+        failed.update(retry_failed)
+    return configured, failed
+
+def configure_vlan_bulk(connection: ConnectHandler, ports: List[str], vlan: str) -> Tuple[List[str], Dict[str, str]]:
+    ip = getattr(connection, 'host', 'IP không xác định')
+    try:
+        configured, failed = configure_ports_bulk(connection, ports, [f"switchport access vlan {vlan}"])
+    except Exception as e:
+        logger.exception(f"Không đặt được VLAN {vlan} trên các cổng @ {ip}")
+        post_event(("log", f"LỖI: Không đặt được VLAN {vlan} trên {len(ports)} cổng @ {ip}: {e}", "ERROR"))
+        return [], {port: str(e) for port in ports}
+
+    if configured:
+        post_event(("log", f"Đã đặt VLAN {vlan} trên {len(configured)} cổng @ {ip}: {', '.join(configured)}", "SUCCESS"))
+    for port, reason in failed.items():
+        post_event(("log", f"LỖI: Không đặt được VLAN {vlan} trên {port} @ {ip}: {reason}", "ERROR"))
+    return configured, failed
+
+def save_configuration(connection: ConnectHandler) -> Tuple[bool, str]:
+    # Chỉ coi là đã lưu khi thấy [OK] và prompt quay lại sau đó; trả về (đã lưu, chi tiết)
+    ip = getattr(connection, 'host', 'IP không xác định')
+    try:
+        if not connection.is_alive():
+            logger.error(f"Kết nối Telnet đến {ip} không còn hoạt động trước khi lưu cấu hình.")
+            post_event(("log", f"LỖI: Kết nối Telnet đến {ip} đã ngắt trước khi lưu cấu hình.", "ERROR"))
+            return False, "Mất kết nối trước khi lưu"
+
+        logger.info(f"Đang thử lưu cấu hình trên {ip} qua Telnet...")
+        output = run_command(
+            connection,
+            "write memory",
+            expect_pattern=WRITE_MEMORY_DONE_RE,
+            delay_factor=4,
+            strip_prompt=False,
+            strip_command=False
+        )
+        logger.debug(f"Kết quả lệnh 'write memory' từ {ip}: {output}")
+
+        if WRITE_MEMORY_CONFIRM_RE.search(output or ""):
+            logger.info(f"Phát hiện yêu cầu xác nhận khi lưu cấu hình trên {ip}. Gửi Enter.")
+            output = run_command(connection, "", expect_pattern=WRITE_MEMORY_DONE_RE, delay_factor=4,
+                                 strip_prompt=False, strip_command=False)
+            logger.debug(f"Kết quả xác nhận từ {ip}: {output}")
+
+        if WRITE_MEMORY_OK_RE.search(output or ""):
+            logger.info(f"Cấu hình được lưu thành công trên {ip}")
+            post_event(("log", f"Đã lưu cấu hình thành công trên {ip}", "SUCCESS"))
+            return True, "[OK]"
+
+        # Dòng cuối không phải prompt hay lệnh lặp lại, thường là thông báo lỗi của IOS (vd. %Error opening nvram)
+        last_line = next((line.strip() for line in reversed((output or "").splitlines())
+                          if line.strip() and line.strip() != "write memory" and not line.rstrip().endswith(("#", ">"))), "")
+        detail = f"Không thấy [OK]: {last_line}" if last_line else "Không có phản hồi cho 'write memory'"
+        logger.warning(f"Lưu cấu hình trên {ip} không tìm thấy xác nhận thành công. Kết quả: {output}")
+        post_event(("log", f"CẢNH BÁO: Lưu cấu hình trên {ip} không xác nhận được. Kết quả: {output}", "WARNING"))
+        return False, detail
+
+    except Exception as e:
+        logger.exception(f"Lỗi khi lưu cấu hình trên {ip}: {str(e)}")
+        post_event(("log", f"LỖI: Không lưu được cấu hình trên {ip}: {str(e)}", "ERROR"))
+        return False, f"Lỗi: {e}"
+
+# (đã lưu, số giây, chi tiết)
+SaveOutcome = Tuple[bool, float, str]
+# (cổng đã kích hoạt, cổng bỏ qua vì "loop", {cổng lỗi: lý do})
+EnableHoPorts = Tuple[List[str], List[str], Dict[str, str]]
+
+class SwitchSession:
+    # Giữ một phiên Telnet đã xác thực cho toàn bộ công việc trên một switch (cấu hình + lưu).
+    # Chỉ kết nối lại khi phiên đã ngắt.
+    def __init__(self, ip: str, username: str, password: str):
+        self.ip = ip
+        self.username = username
+        self.password = password
+        self.connection: Optional[ConnectHandler] = None
+        self.changed = False
+        self.saved: Optional[bool] = None
+        self.save_detail = ""
+        self.save_seconds = 0.0
+        self._was_connected = False
+
+    def open(self) -> bool:
+        task = current_task()
+        # Khi đã dừng, chỉ cho phép kết nối lại phiên đang dở (để lưu cấu hình), không mở phiên mới
+        if task.cancel_token.is_cancelled() and not self._was_connected:
+            task.cancel_token.skip(self.ip)
+            return False
+        if not task.auth_breaker.begin_login(None if self._was_connected else task.cancel_token):
+            if task.auth_breaker.is_tripped():
+                task.auth_breaker.skip(self.ip)
+            else:
+                task.cancel_token.skip(self.ip)
+            return False
+        try:
+            self.connection, status_msg = connect_to_device(self.ip, self.username, self.password)
+        finally:
+            task.auth_breaker.end_login()
+        post_event(("log", status_msg, "NORMAL" if self.connection is not None else "ERROR"))
+        if self.connection is not None:
+            self._was_connected = True
+        return self.connection is not None
+
+    def ensure_alive(self) -> Optional[ConnectHandler]:
+        if self.connection is not None and self.connection.is_alive():
+            return self.connection
+        if self._was_connected:
+            logger.warning(f"Phiên Telnet đến {self.ip} đã ngắt, đang kết nối lại")
+            post_event(("log", f"CẢNH BÁO: Phiên Telnet đến {self.ip} đã ngắt. Đang kết nối lại...", "WARNING"))
+        self.connection = None
+        self.open()
+        return self.connection
+
+    def mark_changed(self):
+        self.changed = True
+        mac_table_cache.invalidate(self.ip)
+
+    def save_if_changed(self) -> Optional[bool]:
+        if not self.changed:
+            return None
+        post_event(("log", f"Đang lưu cấu hình trên {self.ip}...", "INFO"))
+        start = time.perf_counter()
+        connection = self.ensure_alive()
+        if connection is None:
+            post_event(("log", f"LỖI: Không thể kết nối lại với {self.ip} để lưu cấu hình.", "ERROR"))
+            self.saved, self.save_detail = False, "Không kết nối lại được để lưu"
+        else:
+            with timed_phase(self.ip, "save"):
+                self.saved, self.save_detail = save_configuration(connection)
+        self.save_seconds = time.perf_counter() - start
+        return self.saved
+
+    def save_outcome(self) -> Optional[SaveOutcome]:
+        # None khi chưa thử lưu (không có thay đổi)
+        if self.saved is None:
+            return None
+        return self.saved, self.save_seconds, self.save_detail
+
+    def close(self):
+        if self.connection:
+            disconnect_device(self.connection, self.ip)
+        self.connection = None
+
+    def __enter__(self) -> 'SwitchSession':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def process_switch_enable_ho(ip: str, username: str, password: str) -> Tuple[Optional[EnableHoPorts], Optional[SaveOutcome]]:
+    # Trả về (cổng đã kích hoạt/bỏ qua vì 'loop'/lỗi, kết quả lưu); cổng là None khi chưa đọc được trạng thái cổng
+    session = SwitchSession(ip, username, password)
+    port_report: Optional[EnableHoPorts] = None
+    try:
+        if not session.open():
+            return None, None
+        connection = session.connection
+
+        logger.info(f"Đã kết nối Telnet đến switch {ip}")
+        logger.info(f"Đang xóa port-security trên {ip}...")
+        post_event(("log", f"Đang xóa port-security trên {ip}...", "INFO"))
+        try:
+            run_command(connection, "clear port-security all", delay_factor=2)
+            post_event(("log", f"Đã gửi lệnh xóa port-security đến {ip}"))
+        except Exception as cmd_err:
+            logger.error(f"Lỗi khi gửi lệnh 'clear port-security all' đến {ip}: {cmd_err}")
+            post_event(("log", f"LỖI khi gửi lệnh 'clear port-security all' đến {ip}: {cmd_err}", "ERROR"))
+            return port_report, session.save_outcome()
+
+        if current_task().cancel_token.is_cancelled():
+            post_event(("log", f"Đã dừng theo yêu cầu: bỏ qua kiểm tra cổng trên {ip}.", "WARNING"))
+            return port_report, session.save_outcome()
+
+        logger.info(f"Đang kiểm tra các cổng bị vô hiệu hóa trên {ip}...")
+        post_event(("log", f"Đang kiểm tra các cổng bị vô hiệu hóa trên {ip}...", "INFO"))
+        output = None
+        try:
+            output = run_command(connection, "show int status", delay_factor=2)
+        except Exception as cmd_err:
+            logger.error(f"Lỗi khi gửi lệnh 'show int status' đến {ip}: {cmd_err}")
+            post_event(("log", f"LỖI khi gửi lệnh 'show int status' đến {ip}: {cmd_err}", "ERROR"))
+            return port_report, session.save_outcome()
+
+        if not output:
+            logger.error(f"Không nhận được đầu ra từ lệnh 'show int status' trên {ip}")
+            post_event(("log", f"LỖI: Không nhận được đầu ra từ lệnh 'show int status' trên {ip}", "ERROR"))
+            return port_report, session.save_outcome()
+
+        disabled_ports = []
+        skipped_loop_ports = []
+        for record in disabled_interfaces(output):
+            if not PHYSICAL_PORT_RE.match(record.port):
+                logger.debug(f"Bỏ qua {record.port} ({record.status}): không phải cổng vật lý")
+            elif "loop" in record.name.lower():
+                skipped_loop_ports.append(record.port)
+                logger.info(f"Bỏ qua cổng {record.port} vì mô tả/tên chứa 'loop': '{record.name}'")
+                post_event(("log", f"INFO: Bỏ qua cổng {record.port} vì mô tả/tên chứa 'loop': '{record.name}'", "INFO"))
+            else:
+                disabled_ports.append(record.port)
+
+        port_report = ([], skipped_loop_ports, {})
+        logger.info(f"Tìm thấy {len(disabled_ports)} cổng bị vô hiệu hóa cần kích hoạt trên {ip}: {disabled_ports}")
+        post_event(("log", f"Tìm thấy {len(disabled_ports)} cổng bị vô hiệu hóa cần kích hoạt trên {ip}: {disabled_ports}"))
+
+        if disabled_ports and current_task().cancel_token.is_cancelled():
+            post_event(("log", f"Đã dừng theo yêu cầu: không kích hoạt {len(disabled_ports)} cổng trên {ip}.", "WARNING"))
+            return port_report, session.save_outcome()
+
+        if disabled_ports:
+            logger.info(f"Đang kích hoạt các cổng trên {ip}...")
+            post_event(("log", f"Đang kích hoạt các cổng trên {ip}...", "INFO"))
+            try:
+                enabled_ports, failed_ports = configure_ports_bulk(connection, disabled_ports, ["shutdown", "no shutdown"])
+            except Exception as config_err:
+                logger.error(f"Lỗi khi gửi lệnh cấu hình kích hoạt cổng đến {ip}: {config_err}")
+                post_event(("log", f"LỖI khi gửi lệnh kích hoạt cổng đến {ip}: {config_err}", "ERROR"))
+                port_report[2].update({port: str(config_err) for port in disabled_ports})
+                return port_report, session.save_outcome()
+            port_report = (enabled_ports, skipped_loop_ports, failed_ports)
+            if enabled_ports:
+                logger.info(f"Đã gửi lệnh kích hoạt cho {len(enabled_ports)} cổng trên {ip}: {enabled_ports}")
+                post_event(("log", f"Đã gửi lệnh kích hoạt cho {len(enabled_ports)} cổng trên {ip}: {', '.join(enabled_ports)}"))
+            for port, reason in failed_ports.items():
+                post_event(("log", f"LỖI: Không kích hoạt được cổng {port} trên {ip}: {reason}", "ERROR"))
+            session.mark_changed()
+
+        else:
+            logger.info(f"Không có cổng nào cần kích hoạt trên {ip}")
+            post_event(("log", f"Không có cổng nào cần kích hoạt trên {ip}"))
+
+        if session.changed:
+            session.save_if_changed()
+        else:
+            post_event(("log", f"Không có thay đổi nào được thực hiện trên {ip}, bỏ qua lưu cấu hình."))
+        return port_report, session.save_outcome()
+
+    except Exception as e:
+        logger.exception(f"Lỗi không mong muốn khi xử lý enable_ho cho {ip}: {str(e)}")
+        post_event(("log", f"LỖI NGHIÊM TRỌNG khi xử lý {ip} (enable_ho): {str(e)}", "ERROR"))
+        return port_report, session.save_outcome()
+    finally:
+        session.close()
+
+def process_switch_save_retry(ip: str, username: str, password: str) -> Optional[SaveOutcome]:
+    # Lưu lại cấu hình đang chạy trên switch mà lần lưu trước thất bại
+    with SwitchSession(ip, username, password) as session:
+        if not session.open():
+            task = current_task()
+            if task.cancel_token.is_cancelled() or task.auth_breaker.is_tripped():
+                return None
+            return False, 0.0, "Không kết nối được để lưu"
+        session.changed = True
+        session.save_if_changed()
+        return session.save_outcome()
+
+def find_ports_in_vlan(parsed_mac_table: MacTable, source_vlan: str) -> List[str]:
+    return parsed_mac_table.ports_in_vlan(source_vlan)
+
+class PendingTargets:
+    # Tập MAC/4 ký tự cuối chưa xử lý, dùng chung giữa các luồng quét song song
+    def __init__(self, targets: Set[str]):
+        self._targets = set(targets)
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> List[str]:
+        with self._lock:
+            return sorted(self._targets)
+
+    def claim(self, target: str) -> bool:
+        with self._lock:
+            if target not in self._targets:
+                return False
+            self._targets.discard(target)
+            return True
+
+    def remaining(self) -> Set[str]:
+        with self._lock:
+            return set(self._targets)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._targets)
+
+def _run_with_event_buffer(func: Callable[[str], Any], ip: str, task: Optional[TaskContext],
+                           read_only: bool) -> Tuple[Any, List[Tuple[str, Any]]]:
+    events: List[Tuple[str, Any]] = []
+    _worker_local.events = events
+    _task_local.context = task
+    acquired = False
+    try:
+        with timed_phase(ip, "wait"):
+            acquired = device_scheduler.acquire(ip, not read_only, task or default_task)
+        if not acquired:
+            (task or default_task).cancel_token.skip(ip)
+            return None, events
+        with timed_phase(ip, "total"):
+            return func(ip), events
+    except Exception as e:
+        logger.exception(f"Lỗi không xác định khi xử lý switch {ip}")
+        events.append(("log", f"LỖI NGHIÊM TRỌNG khi xử lý {ip}: {e}", "ERROR"))
+        return None, events
+    finally:
+        if acquired:
+            device_scheduler.release(ip, not read_only)
+        _worker_local.events = None
+        _task_local.context = None
+
+def run_switch_pool(ips: List[str], func: Callable[[str], Any], max_workers: int, thread_name_prefix: str = "Switch",
+                    progress_base: int = 0, progress_total: Optional[int] = None,
+                    read_only: bool = False) -> Iterator[Tuple[str, Any]]:
+    # Chạy func(ip) song song; sự kiện GUI của từng IP được gom lại và phát theo đúng thứ tự IP.
+    # progress_base/progress_total: tiến độ chung khi một tác vụ chạy nhiều đợt.
+    # read_only: func không thay đổi cấu hình, không cần giữ khóa switch (vẫn tính vào giới hạn phiên chung)
+    total = progress_total or len(ips)
+    max_workers = max(1, min(max_workers, len(ips) or 1))
+    task = getattr(_task_local, 'context', None)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix) as executor:
+        futures = [executor.submit(_run_with_event_buffer, func, ip, task, read_only) for ip in ips]
+        for index, (ip, future) in enumerate(zip(ips, futures), start=progress_base + 1):
+            result, events = future.result()
+            for event in events:
+                post_event(event)
+            post_event(("status", f"Đã xử lý {ip} ({index}/{total})..."))
+            post_event(("progress", (index, total)))
+            post_event(("cache_stats", mac_table_cache.stats()))
+            yield ip, result
+
+def track_mac_changes(ip: str, parsed_table: MacTable):
+    # So với lần quét bảng đầy đủ trước đó của cùng switch; kho thiết bị đầu cuối chỉ ghi phần thay đổi.
+    # Khi kho đang mở, ảnh chụp trong kho là nguồn duy nhất: kho chưa có ảnh chụp của switch thì ghi toàn bộ bảng
+    seen_at = time.time()
+    previous = None
+    inventory_open = endpoint_inventory.is_open()
+    if inventory_open:
+        try:
+            data = endpoint_inventory.load_snapshot(ip)
+            previous = MacSnapshot.from_bytes(data) if data else None
+        except (sqlite3.Error, ValueError, zlib.error, struct.error) as e:
+            logger.warning(f"Không đọc được ảnh chụp bảng MAC trước của {ip}, so sánh lại từ đầu: {e}")
+    previous, snapshot, changes, flapping = mac_differ.diff(ip, parsed_table, seen_at, previous, use_memory=not inventory_open)
+    if endpoint_inventory.is_open():
+        try:
+            endpoint_inventory.record_sweep(ip, parsed_table, changes, previous.seen_at if previous else None,
+                                            seen_at, snapshot.to_bytes())
+        except sqlite3.Error as e:
+            logger.error(f"Không ghi được bảng MAC của {ip} vào kho thiết bị đầu cuối: {e}")
+    if previous is None or not changes:
+        return
+
+    counts = {"appeared": 0, "disappeared": 0, "moved": 0}
+    for change in changes:
+        counts[change[0]] += 1
+    post_event(("log", f"  Thay đổi bảng MAC trên {ip} so với lần quét trước ({(seen_at - previous.seen_at) / 60:.0f} phút trước): "
+                       f"{counts['appeared']} MAC mới, {counts['disappeared']} MAC mất, {counts['moved']} MAC đổi cổng"))
+    for _, mac, vlan, old_port, new_port in [change for change in changes if change[0] == "moved"][:MAC_DIFF_LOG_LIMIT]:
+        post_event(("log", f"    {mac} VLAN {vlan}: {old_port} -> {new_port}"))
+    for (_, mac, vlan, old_port, new_port), move_count in flapping:
+        post_event(("log", f"  CẢNH BÁO: MAC {mac} (VLAN {vlan}) trên {ip} đã đổi cổng {move_count} lần trong "
+                           f"{FLAP_WINDOW_SWEEPS} lần quét gần đây ({old_port} -> {new_port}), nghi ngờ loop/flap", "WARNING"))
+
+def load_mac_table(session: SwitchSession, use_cache: bool = True, mode: Optional[str] = None,
+                   targets: Optional[List[str]] = None) -> Optional[MacTable]:
+    planner = current_task().mac_query_planner
+    if use_cache:
+        cached = mac_table_cache.get(session.ip)
+        if cached is not None:
+            parsed_table, age = cached
+            post_event(("log", f"Dùng bảng MAC trong cache cho {session.ip} (lấy cách đây {age:.0f} giây)"))
+            planner.record(session.ip, "cache", [], 0)
+            return parsed_table
+
+    strategy, commands = planner.plan(session.ip, mode, targets)
+    connection = session.ensure_alive()
+    if connection is None:
+        return None
+
+    # Phân tích ngay khi dữ liệu về, không đợi nhận xong toàn bộ bảng và không giữ đầu ra thô
+    stream_parser = MacTableStreamParser()
+    for command in commands:
+        if get_mac_address_table(connection, command, parser=stream_parser) is None:
+            return None
+    bytes_received = stream_parser.chars_received
+    parsed_table = stream_parser.table
+    parsed_table.complete = strategy == "full"
+    current_task().phase_timings.add(session.ip, "parse", stream_parser.parse_seconds, strategy)
+
+    if strategy == "full":
+        planner.record_table_size(session.ip, len(parsed_table))
+        mac_table_cache.put(session.ip, parsed_table)
+        track_mac_changes(session.ip, parsed_table)
+    elif strategy == "filtered":
+        # Đầu ra đã lọc không cho biết số MAC trên mỗi cổng; hỏi riêng các cổng có MAC khớp
+        hit_ports = {entry[1] for hits in match_mac_targets(parsed_table, targets, match_last4=(mode != "full_mac_config")).values()
+                     for entry in hits}
+        for port in sorted(hit_ports):
+            if current_task().cancel_token.is_cancelled():
+                return None
+            port_command = f"show mac address-table interface {port}"
+            port_parser = MacTableStreamParser()
+            if get_mac_address_table(connection, port_command, parser=port_parser) is None:
+                return None
+            commands.append(port_command)
+            bytes_received += port_parser.chars_received
+            parsed_table.port_counts[port] = len(port_parser.table)
+
+    planner.record(session.ip, strategy, commands, bytes_received)
+    if strategy != "full":
+        post_event(("log", f"Truy vấn bảng MAC trên {session.ip}: {strategy} ({len(commands)} lệnh, {bytes_received} byte)"))
+    return parsed_table
+
+def process_switch_vlan_switch(ip: str, username: str, password: str, source_vlan: str, target_vlan: str,
+                               refresh_cache: bool = False) -> Optional[SaveOutcome]:
+    with SwitchSession(ip, username, password) as session:
+        try:
+            parsed_mac_table = load_mac_table(session, use_cache=not refresh_cache, mode="vlan_switch", targets=[source_vlan])
+            if parsed_mac_table is None:
+                return None
+
+            if not parsed_mac_table:
+                post_event(("log", f"THÔNG TIN: Không tìm thấy hoặc phân tích được mục MAC nào trong bảng cho {ip}.", "INFO"))
+                return None
+
+            ports_in_source_vlan = find_ports_in_vlan(parsed_mac_table, source_vlan)
+            if not ports_in_source_vlan:
+                post_event(("log", f"THÔNG TIN: Không tìm thấy cổng nào trong VLAN {source_vlan} trên {ip}.", "INFO"))
+                return None
+
+            post_event(("log", f"    Tìm thấy {len(ports_in_source_vlan)} cổng trong VLAN {source_vlan} trên {ip}: {', '.join(ports_in_source_vlan)}"))
+
+            if current_task().cancel_token.is_cancelled():
+                post_event(("log", f"    Đã dừng theo yêu cầu: bỏ qua {len(ports_in_source_vlan)} cổng trên {ip}.", "WARNING"))
+                return None
+            post_event(("log", f"    Đang chuyển {len(ports_in_source_vlan)} cổng từ VLAN {source_vlan} sang VLAN {target_vlan}...", "INFO"))
+            connection = session.ensure_alive()
+            if connection is not None:
+                configured, _ = configure_vlan_bulk(connection, ports_in_source_vlan, target_vlan)
+                if configured:
+                    session.mark_changed()
+
+        except Exception as e:
+            logger.exception(f"Lỗi không xác định khi xử lý switch {ip} (vlan_switch)")
+            post_event(("log", f"LỖI NGHIÊM TRỌNG khi xử lý {ip} (vlan_switch): {e}", "ERROR"))
+
+        session.save_if_changed()
+        return session.save_outcome()
+
+def process_switch_mac_modes(ip: str, username: str, password: str, mode: str, target_vlan: Optional[str],
+                             pending_macs: PendingTargets, original_mac_map: Dict[str, str],
+                             prefetch_errors: Optional[Dict[str, str]] = None,
+                             refresh_cache: bool = False) -> Tuple[List[Tuple[str, str, str, str]], Optional[SaveOutcome]]:
+    processed_results: List[Tuple[str, str, str, str]] = []
+    targets = pending_macs.snapshot()
+    if not targets:
+        post_event(("log", f"Đã xử lý tất cả MAC/4 ký tự cuối mục tiêu. Bỏ qua {ip}."))
+        return processed_results, None
+
+    # Switch không lấy được bảng MAC qua Telnet bất đồng bộ (mac_search) thì không thử lại bằng netmiko
+    if prefetch_errors and ip in prefetch_errors:
+        post_event(("log", prefetch_errors[ip], "ERROR"))
+        return processed_results, None
+
+    with SwitchSession(ip, username, password) as session:
+        try:
+            parsed_mac_table = load_mac_table(session, use_cache=not refresh_cache, mode=mode, targets=targets)
+            if parsed_mac_table is None:
+                return processed_results, None
+
+            if not parsed_mac_table and parsed_mac_table.complete:
+                post_event(("log", f"THÔNG TIN: Không tìm thấy hoặc phân tích được mục MAC nào trong bảng cho {ip}.", "INFO"))
+                return processed_results, None
+
+            matches_by_target = match_mac_targets(parsed_mac_table, targets, match_last4=(mode != "full_mac_config"))
+
+            for index, mac_key in enumerate(targets):
+                if current_task().cancel_token.is_cancelled():
+                    post_event(("log", f"  Đã dừng theo yêu cầu: bỏ qua {len(targets) - index} mục tiêu còn lại trên {ip}.", "WARNING"))
+                    break
+                original_input_mac = original_mac_map.get(mac_key, mac_key)
+                post_event(("log", f"  Đang kiểm tra '{original_input_mac}' trên {ip}...", "INFO"))
+
+                found_port, found_vlan, found_mac_count = None, None, None
+                found_full_mac_cisco = None
+                found_on_this_switch = False
+
+                if mode == "full_mac_config":
+                    hits = matches_by_target.get(mac_key)
+                    if hits:
+                        if not pending_macs.claim(mac_key):
+                            post_event(("log", f"    '{original_input_mac}' đã được xử lý trên switch khác. Bỏ qua."))
+                            continue
+                        _, found_port, found_vlan, found_mac_count = hits[0]
+                        found_full_mac_cisco = format_mac_cisco(mac_key)
+                        post_event(("log", f"    Tìm thấy {found_full_mac_cisco}: Cổng={found_port}, VLAN={found_vlan}, Số MAC trên cổng={found_mac_count}"))
+                        found_on_this_switch = True
+
+                elif mode in ["last4_config", "mac_search"]:
+                    matches = matches_by_target.get(mac_key, [])
+                    if matches:
+                        if mode == "mac_search":
+                            valid_matches = [m for m in matches if m[3] <= MAX_MAC_COUNT_SEARCH]
+                            if valid_matches and not pending_macs.claim(mac_key):
+                                post_event(("log", f"    '{original_input_mac}' đã được tìm thấy trên switch khác. Bỏ qua."))
+                                continue
+
+                        post_event(("log", f"    Tìm thấy {len(matches)} kết quả khớp cho *{original_input_mac} trên {ip}:"))
+                        best_candidate = None
+
+                        for f_mac, f_port, f_vlan, f_count in matches:
+                            if mode == "mac_search" and f_count > MAX_MAC_COUNT_SEARCH:
+                                post_event(("log", f"      - MAC: {f_mac}, Cổng={f_port}, VLAN={f_vlan}, Số MAC trên cổng={f_count} (BỎ QUA: Quá nhiều MAC)"))
+                                continue
+
+                            post_event(("log", f"      - MAC: {f_mac}, Cổng={f_port}, VLAN={f_vlan}, Số MAC trên cổng={f_count}"))
+
+                            if mode == "mac_search":
+                                details = f"MAC={f_mac}, Cổng={f_port}, VLAN={f_vlan}, Số MAC trên cổng={f_count}"
+                                processed_results.append((ip, original_input_mac, "Đã tìm thấy", details))
+                                found_on_this_switch = True
+                            elif mode == "last4_config":
+                                if f_count < 4 and f_vlan.isdigit() and best_candidate is None:
+                                    best_candidate = (f_port, f_vlan, f_count, f_mac)
+                                    post_event(("log", f"      -> Chọn ứng viên: {f_mac} trên cổng {f_port} (Số MAC: {f_count}, VLAN: {f_vlan})"))
+                                elif best_candidate:
+                                    post_event(("log", f"      -> Bỏ qua ứng viên khác: {f_mac} (đã chọn ứng viên)"))
+
+                        if mode == "last4_config":
+                            if best_candidate:
+                                if not pending_macs.claim(mac_key):
+                                    post_event(("log", f"    '{original_input_mac}' đã được xử lý trên switch khác. Bỏ qua."))
+                                    continue
+                                found_port, found_vlan, found_mac_count, found_full_mac_cisco = best_candidate
+                                found_on_this_switch = True
+                            else:
+                                post_event(("log", f"    Không tìm thấy ứng viên phù hợp (ít hơn 4 MAC, VLAN số) cho *{original_input_mac} để cấu hình VLAN."))
+                                processed_results.append((ip, original_input_mac, "Không có ứng viên phù hợp", "Không có cổng nào có < 4 MAC và VLAN số"))
+
+                if mode in ["full_mac_config", "last4_config"] and found_port:
+                    if not target_vlan:
+                        post_event(("log", f"    LỖI NỘI BỘ: Thiếu VLAN đích khi cố gắng cấu hình cho {original_input_mac}", "ERROR"))
+                        continue
+
+                    if not found_vlan.isdigit():
+                        details = f"VLAN hiện tại không phải số ('{found_vlan}') trên cổng {found_port} cho MAC {found_full_mac_cisco}"
+                        post_event(("log", f"    BỎ QUA: {details}"))
+                        processed_results.append((ip, original_input_mac, "Bỏ qua (VLAN không hợp lệ)", details))
+                        continue
+
+                    if found_mac_count < 4:
+                        if found_vlan == target_vlan:
+                            details = f"Đã ở VLAN mục tiêu {target_vlan} trên cổng {found_port} (MAC: {found_full_mac_cisco}, Số MAC trên cổng: {found_mac_count})"
+                            post_event(("log", f"    THÔNG TIN: {details}", "INFO"))
+                            processed_results.append((ip, original_input_mac, "Đã đúng VLAN", details))
+                        else:
+                            post_event(("log", f"    Đang thử chuyển VLAN: {found_full_mac_cisco} từ {found_vlan} -> {target_vlan} trên cổng {found_port}", "INFO"))
+                            connection = session.ensure_alive()
+                            if connection is not None and configure_vlan(connection, found_port, target_vlan):
+                                details = f"Đã chuyển sang VLAN {target_vlan} trên cổng {found_port} (MAC: {found_full_mac_cisco}, VLAN cũ: {found_vlan}, Số MAC trên cổng: {found_mac_count})"
+                                processed_results.append((ip, original_input_mac, "Đã chuyển VLAN", details))
+                                session.mark_changed()
+                            else:
+                                details = f"Không chuyển được sang VLAN {target_vlan} trên cổng {found_port} (MAC: {found_full_mac_cisco}, từ VLAN {found_vlan})"
+                                processed_results.append((ip, original_input_mac, "Chuyển VLAN thất bại", details))
+                    else:
+                        details = f"Cổng {found_port} có {found_mac_count} MAC (>= 4) cho {found_full_mac_cisco}. Bỏ qua."
+                        post_event(("log", f"    BỎ QUA: {details}"))
+                        processed_results.append((ip, original_input_mac, "Bỏ qua (Cổng >=4 MACs)", details))
+                elif not found_on_this_switch and mode != "mac_search":
+                    post_event(("log", f"    Không tìm thấy '{original_input_mac}' trên {ip}."))
+
+        except Exception as e:
+            logger.exception(f"Lỗi không xác định khi xử lý switch {ip} (MAC modes)")
+            post_event(("log", f"LỖI NGHIÊM TRỌNG khi xử lý {ip} (MAC modes): {e}", "ERROR"))
+
+        session.save_if_changed()
+        return processed_results, session.save_outcome()
+
+def report_query_plan_summary(ips: List[str]):
+    strategies, total_bytes = current_task().mac_query_planner.summary(ips)
+    if strategies:
+        strategy_text = ", ".join(f"{name}={count}" for name, count in sorted(strategies.items()))
+        post_event(("log", f"Truy vấn bảng MAC: {strategy_text}; tổng {total_bytes} byte đã nhận"))
+
+def report_save_outcomes(save_outcomes: Dict[str, SaveOutcome]):
+    # Một bảng cho mọi switch đã thử lưu; switch lưu lỗi được liệt kê lại để lưu lại ngay (chế độ save_retry)
+    post_event(("log", "\n--- Kết quả lưu cấu hình các switch đã thay đổi ---"))
+    post_event(("log", f"  {'IP':<16} {'Kết quả':<8} {'Thời gian':>9}  Chi tiết"))
+    for ip in sorted(save_outcomes, key=ip_address):
+        saved, seconds, detail = save_outcomes[ip]
+        post_event(("log", f"  {ip:<16} {'OK' if saved else 'LỖI':<8} {seconds:>8.1f}s  {detail}", "NORMAL" if saved else "ERROR"))
+    failed_ips = sorted((ip for ip, (saved, _, _) in save_outcomes.items() if not saved), key=ip_address)
+    post_event(("log", f"Đã lưu thành công {len(save_outcomes) - len(failed_ips)}/{len(save_outcomes)} switch.", "SUCCESS"))
+    if failed_ips:
+        post_event(("log", f"Cần lưu lại {len(failed_ips)} switch: {' '.join(failed_ips)}", "ERROR"))
+        post_event(("save_failed", failed_ips))
+        post_event(("messagebox", ("warning", f"Không lưu được cấu hình trên {len(failed_ips)} switch: {', '.join(failed_ips)}. "
+                                              f"Dùng nút 'Lưu lại' hoặc chế độ save_retry, rồi kiểm tra thiết bị thủ công nếu vẫn lỗi.")))
+
+def report_enable_ho_ports(port_reports: Dict[str, EnableHoPorts], total_switches: int):
+    # Chỉ liệt kê switch có cổng được kích hoạt, bị bỏ qua vì "loop" hoặc kích hoạt lỗi
+    post_event(("log", "\n--- Kết quả kích hoạt cổng theo switch ---"))
+    enabled_count = skipped_count = failed_count = 0
+    for ip in sorted(port_reports, key=ip_address):
+        enabled_ports, skipped_loop_ports, failed_ports = port_reports[ip]
+        enabled_count += len(enabled_ports)
+        skipped_count += len(skipped_loop_ports)
+        failed_count += len(failed_ports)
+        if not (enabled_ports or skipped_loop_ports or failed_ports):
+            continue
+        post_event(("log", f"  {ip}:"))
+        if enabled_ports:
+            post_event(("log", f"    Đã kích hoạt ({len(enabled_ports)}): {', '.join(enabled_ports)}"))
+        if skipped_loop_ports:
+            post_event(("log", f"    Bỏ qua vì 'loop' ({len(skipped_loop_ports)}): {', '.join(skipped_loop_ports)}", "WARNING"))
+        if failed_ports:
+            post_event(("log", f"    Kích hoạt lỗi ({len(failed_ports)}): {', '.join(failed_ports)}", "ERROR"))
+    post_event(("log", f"Đã kích hoạt {enabled_count} cổng, bỏ qua {skipped_count} cổng 'loop', lỗi {failed_count} cổng "
+                       f"trên {len(port_reports)}/{total_switches} switch đã kiểm tra.", "SUCCESS"))
+
+def report_phase_timings(timings_file: Optional[str] = None):
+    timings = current_task().phase_timings
+    summary = timings.summary()
+    if summary:
+        post_event(("log", "\n--- Thời gian theo giai đoạn (số lần: p50 / p95 / max) ---"))
+        for phase, (count, p50, p95, longest) in summary.items():
+            post_event(("log", f"  {phase:<12} {count:>5}: {p50:.2f}s / {p95:.2f}s / {longest:.2f}s"))
+    if timings_file:
+        try:
+            timings.export_jsonl(timings_file)
+            post_event(("log", f"Đã ghi thời gian từng switch vào {timings_file}"))
+        except OSError as e:
+            logger.error(f"Không ghi được file thời gian {timings_file}: {e}")
+            post_event(("log", f"CẢNH BÁO: Không ghi được file thời gian {timings_file}: {e}", "WARNING"))
+
+def report_auth_breaker():
+    auth_breaker = current_task().auth_breaker
+    if not auth_breaker.is_tripped():
+        return
+    post_event(("log", f"\nLỖI: Đã dừng quét sau {auth_breaker.consecutive} lần xác thực thất bại liên tiếp "
+                          f"(ngưỡng {auth_breaker.threshold}) với tài khoản '{auth_breaker.username}' "
+                          f"({len(auth_breaker.failed_ips)} IP từ chối: {', '.join(auth_breaker.failed_ips)}). "
+                          f"Bỏ qua {auth_breaker.skipped} switch còn lại. Kiểm tra lại tên người dùng/mật khẩu.", "ERROR"))
+
+def report_cancellation(total_ips: int):
+    cancel_token = current_task().cancel_token
+    if not cancel_token.is_cancelled():
+        return
+    post_event(("log", f"\n--- ĐÃ DỪNG THEO YÊU CẦU: bỏ qua {cancel_token.skipped}/{total_ips} switch chưa xử lý. "
+                          f"Các switch đang xử lý đã hoàn tất lệnh đang gửi và lưu cấu hình nếu có thay đổi. "
+                          f"Kết quả bên dưới chỉ gồm các switch đã xử lý. ---", "WARNING"))
+
+def completion_message(mode: str, duration: float) -> Tuple[str, Tuple[str, str]]:
+    task = current_task()
+    if task.cancel_token.is_cancelled():
+        return ("messagebox", ("warning", f"Tác vụ {mode} đã dừng theo yêu cầu sau {duration:.2f} giây "
+                                          f"({task.cancel_token.skipped} switch chưa xử lý). Kiểm tra nhật ký để xem kết quả một phần."))
+    if task.auth_breaker.is_tripped():
+        return ("messagebox", ("error", f"Tác vụ {mode} đã dừng sớm: xác thực thất bại liên tiếp với tài khoản "
+                                        f"'{task.auth_breaker.username}'. Kiểm tra lại mật khẩu trước khi chạy lại."))
+    return ("messagebox", ("info", f"Tác vụ {mode} hoàn thành trong {duration:.2f} giây. Kiểm tra nhật ký chi tiết."))
+
+def precheck_reachability(ips: List[str]) -> List[str]:
+    # Quét nhanh cổng TCP trước khi đăng nhập: IP không mở cổng Telnet không phải chờ hết TELNET_TIMEOUT
+    post_event(("status", f"Đang kiểm tra kết nối TCP đến {len(ips)} IP..."))
+    start = time.monotonic()
+    probe_results = sweep_reachability(ips)
+    reachable = [ip for ip in ips if TELNET_PORT in probe_results[ip][0]]
+    for ip in reachable:
+        current_task().phase_timings.add(ip, "tcp_connect", probe_results[ip][0][TELNET_PORT])
+    ssh_only = [ip for ip in ips if TELNET_PORT not in probe_results[ip][0] and SSH_PORT in probe_results[ip][0]]
+    post_event(("log", f"Kiểm tra TCP ({time.monotonic() - start:.1f} giây): {len(reachable)}/{len(ips)} IP mở cổng Telnet, "
+                          f"bỏ qua {len(ips) - len(reachable)} IP", "INFO"))
+    if ssh_only:
+        post_event(("log", f"CẢNH BÁO: {len(ssh_only)} IP chỉ mở SSH, không mở Telnet (bỏ qua): {', '.join(ssh_only)}", "WARNING"))
+    return reachable
+
+def prefetch_mac_tables_async(ips: List[str], username: str, password: str, refresh_cache: bool) -> Dict[str, str]:
+    ips_to_prefetch = [ip for ip in ips if refresh_cache or not mac_table_cache.is_fresh(ip)]
+    post_event(("log", f"Đang lấy bảng MAC từ {len(ips_to_prefetch)} switch qua Telnet bất đồng bộ (tối đa {ASYNC_TELNET_CONCURRENCY} phiên)...", "INFO"))
+    post_event(("status", "Đang lấy bảng MAC (Telnet bất đồng bộ)..."))
+    prefetch_errors = {}
+    prefetched_tables = {}
+    task = current_task()
+    # Đăng nhập thử một nhóm nhỏ trước khi mở đồng loạt hàng trăm phiên với cùng một tài khoản
+    first_wave = ips_to_prefetch[:task.auth_breaker.threshold]
+    for wave in (first_wave, ips_to_prefetch[len(first_wave):]):
+        if not wave or task.auth_breaker.is_tripped() or task.cancel_token.is_cancelled():
+            continue
+        # Số phiên bất đồng bộ cũng tính vào giới hạn phiên Telnet chung của các tác vụ đang chạy
+        slots = device_scheduler.acquire_slots(min(ASYNC_TELNET_CONCURRENCY, len(wave)), task)
+        if not slots:
+            continue
+        try:
+            prefetched_tables.update(collect_mac_tables(wave, username, password,
+                                                        max_concurrency=slots, timeout=TELNET_TIMEOUT,
+                                                        on_auth_result=task.auth_breaker.record,
+                                                        should_stop=lambda: task.auth_breaker.is_tripped() or task.cancel_token.is_cancelled()))
+        finally:
+            device_scheduler.release_slots(slots)
+    for ip, (raw_output, status_msg) in prefetched_tables.items():
+        if raw_output is None:
+            prefetch_errors[ip] = status_msg
+        else:
+            with timed_phase(ip, "parse", "async"):
+                parsed_table = parse_mac_table(raw_output)
+            mac_table_cache.put(ip, parsed_table)
+            task.mac_query_planner.record_table_size(ip, len(parsed_table))
+            track_mac_changes(ip, parsed_table)
+    return prefetch_errors
+
+def open_inventory(inventory_db: Optional[str]) -> bool:
+    # True nếu tác vụ giữ một tham chiếu đến kho và phải gọi release_inventory() khi kết thúc
+    if not inventory_db:
+        return False
+    try:
+        if endpoint_inventory.open(inventory_db):
+            return True
+        post_event(("log", f"CẢNH BÁO: Kho thiết bị đầu cuối {endpoint_inventory.path} đang được tác vụ khác dùng, "
+                           f"không mở được {inventory_db}. Tiếp tục với kho đang mở.", "WARNING"))
+    except sqlite3.Error as e:
+        logger.error(f"Không mở được kho thiết bị đầu cuối {inventory_db}: {e}")
+        post_event(("log", f"CẢNH BÁO: Không mở được kho thiết bị đầu cuối {inventory_db}: {e}. Tiếp tục không dùng kho.", "WARNING"))
+    return False
+
+def release_inventory():
+    try:
+        endpoint_inventory.release()
+    except sqlite3.Error as e:
+        logger.error(f"Không ghi được kho thiết bị đầu cuối khi đóng: {e}")
+
+def flush_inventory():
+    try:
+        endpoint_inventory.flush()
+    except sqlite3.Error as e:
+        logger.error(f"Không ghi được kho thiết bị đầu cuối {endpoint_inventory.path}: {e}")
+        post_event(("log", f"CẢNH BÁO: Không ghi được kho thiết bị đầu cuối: {e}", "WARNING"))
+
+def locate_in_inventory(ips: List[str], targets: Iterable[str], mode: str, original_mac_map: Dict[str, str]) -> List[str]:
+    # Switch từng thấy MAC mục tiêu trên cổng truy cập (ít MAC), theo thứ tự IP của lần quét
+    if not endpoint_inventory.is_open():
+        return []
+    scan_set = set(ips)
+    priority: Set[str] = set()
+    now = time.time()
+    for target in sorted(targets):
+        key = format_mac_cisco(target) if mode == "full_mac_config" else target
+        try:
+            locations = endpoint_inventory.locate(key)
+        except sqlite3.Error as e:
+            logger.error(f"Lỗi tra cứu kho thiết bị đầu cuối: {e}")
+            return []
+        access_locations = [loc for loc in locations if loc[0] in scan_set and loc[5] <= MAX_MAC_COUNT_SEARCH]
+        if not access_locations:
+            continue
+        switch, port, vlan, mac, last_seen, _ = access_locations[0]
+        post_event(("log", f"  Kho: '{original_mac_map.get(target, target)}' ({mac}) lần cuối thấy trên {switch} cổng {port} "
+                              f"VLAN {vlan}, cách đây {(now - last_seen) / 60:.0f} phút"))
+        priority.update(loc[0] for loc in access_locations)
+    return [ip for ip in ips if ip in priority]
+
+def task_worker(task_details: Dict[str, Any], task: Optional[TaskContext] = None):
+    # task: trạng thái riêng khi chạy qua TaskQueue; mặc định dùng gui_queue và các đối tượng toàn cục
+    _task_local.context = task
+    holds_inventory = open_inventory(task_details.get("inventory_db"))
+    try:
+        _run_task(task_details, task or default_task)
+    finally:
+        if holds_inventory:
+            release_inventory()
+        _task_local.context = None
+
+def _run_task(task_details: Dict[str, Any], task: TaskContext):
+    mode = task_details.get("mode")
+    username = task_details.get("username")
+    password = task_details.get("password")
+    start_ip = task_details.get("start_ip")
+    end_ip = task_details.get("end_ip")
+    target_vlan = task_details.get("target_vlan")
+    source_vlan = task_details.get("source_vlan")
+    mac_list_raw = task_details.get("mac_list", [])
+    max_workers = task_details.get("max_workers") or MAX_CONCURRENT_SWITCHES
+    use_async_telnet = bool(task_details.get("async_telnet"))
+    # Chế độ cấu hình luôn lấy bảng MAC mới: MAC đổi cổng trong thời gian cache còn hạn sẽ làm cấu hình nhầm cổng.
+    # Cache chỉ dùng cho tra cứu chỉ đọc (mac_search)
+    refresh_cache = bool(task_details.get("refresh_mac_cache")) or mode not in READ_ONLY_MODES
+    tcp_precheck = task_details.get("tcp_precheck", True)
+    timings_file = task_details.get("timings_file")
+    ip_list = task_details.get("ips")  # Danh sách IP cụ thể (vd. save_retry), thay cho dải start_ip-end_ip
+
+    if not all([mode, username, password]) or not (ip_list or (start_ip and end_ip)):
+        post_event(("log", "LỖI: Luồng xử lý bắt đầu với thông tin cần thiết bị thiếu.", "ERROR"))
+        post_event(("status", "Lỗi: Thiết lập tác vụ nội bộ"))
+        post_event(("messagebox", ("error", "Lỗi nội bộ: Thiếu thông tin tác vụ.")))
+        post_event(("progress", (1, 1)))
+        post_event(("enable_button", mode))
+        return
+
+    start_time = time.time()
+    task.auth_breaker.reset(username)
+    if task is default_task:
+        # Trạng thái mặc định được dùng lại giữa các lần chạy; TaskQueue tạo TaskContext mới cho mỗi tác vụ
+        task.cancel_token.reset()
+    task.phase_timings.reset(mode)
+    thread_name = threading.current_thread().name
+    logger.info(f"[{thread_name}] Luồng xử lý bắt đầu cho chế độ: {mode}")
+    post_event(("status", f"Đang khởi động: {mode}..."))
+    post_event(("progress", (0, 1)))
+
+    if ip_list:
+        ips_to_scan, ip_error = list(ip_list), None
+    else:
+        ips_to_scan, ip_error = generate_switch_ips(start_ip, end_ip)
+
+    if ip_error:
+        logger.error(f"[{thread_name}] Tạo danh sách IP thất bại: {ip_error}")
+        post_event(("log", f"LỖI: {ip_error}", "ERROR"))
+        post_event(("messagebox", ("error", ip_error)))
+        post_event(("status", "Lỗi khi tạo danh sách IP"))
+        post_event(("progress", (1, 1)))
+        post_event(("enable_button", mode))
+        return
+
+    total_ips = len(ips_to_scan)
+    post_event(("log", f"Đã tạo {total_ips} IP để quét: {ips_to_scan[0]}...{ips_to_scan[-1]}"))
+    post_event(("log", f"Số switch xử lý song song tối đa: {max_workers}"))
+    unreachable_ips: List[str] = []
+    if tcp_precheck:
+        reachable_ips = precheck_reachability(ips_to_scan)
+        reachable_set = set(reachable_ips)
+        unreachable_ips = [ip for ip in ips_to_scan if ip not in reachable_set]
+        ips_to_scan = reachable_ips
+        total_ips = len(ips_to_scan)
+    post_event(("progress", (0, total_ips)))
+
+    if mode in ("enable_ho", "save_retry"):
+        save_outcomes: Dict[str, SaveOutcome] = {}
+        if mode == "save_retry":
+            worker = partial(process_switch_save_retry, username=username, password=password)
+            # Switch không mở cổng Telnet vẫn phải nằm trong danh sách cần lưu lại
+            for ip in unreachable_ips:
+                save_outcomes[ip] = (False, 0.0, "Không mở cổng Telnet")
+        else:
+            worker = partial(process_switch_enable_ho, username=username, password=password)
+        port_reports: Dict[str, EnableHoPorts] = {}
+        for ip, result in run_switch_pool(ips_to_scan, worker, max_workers, thread_name_prefix=f"Worker-{mode}"):
+            if mode == "enable_ho":
+                port_report, outcome = result
+                if port_report is not None:
+                    port_reports[ip] = port_report
+            else:
+                outcome = result
+            if outcome is not None:
+                save_outcomes[ip] = outcome
+        report_auth_breaker()
+        report_cancellation(total_ips)
+        report_phase_timings(timings_file)
+        if mode == "enable_ho":
+            report_enable_ho_ports(port_reports, len(ips_to_scan))
+        if save_outcomes:
+            report_save_outcomes(save_outcomes)
+
+        end_time = time.time()
+        duration = end_time - start_time
+        post_event(("log", f"\n--- Hoàn thành tác vụ: {mode} (Thời gian: {duration:.2f} giây) ---"))
+        post_event(("status", f"{mode} đã hoàn thành"))
+        post_event(completion_message(mode, duration))
+        post_event(("progress", (total_ips, total_ips)))
+        post_event(("enable_button", mode))
+        logger.info(f"[{thread_name}] Luồng xử lý hoàn thành cho chế độ: {mode}. Thời gian: {duration:.2f}s")
+        return
+
+    elif mode == "vlan_switch":
+        save_outcomes: Dict[str, SaveOutcome] = {}
+
+        if not source_vlan or not target_vlan:
+            post_event(("log", "LỖI: Thiếu VLAN nguồn hoặc VLAN đích.", "ERROR"))
+            post_event(("messagebox", ("error", "VLAN nguồn và VLAN đích là bắt buộc.")))
+            post_event(("status", "Lỗi: Thiếu thông tin VLAN"))
+            post_event(("progress", (1, 1)))
+            post_event(("enable_button", mode))
+            return
+
+        post_event(("log", f"Đang tìm các cổng trong VLAN {source_vlan} để chuyển sang VLAN {target_vlan}", "INFO"))
+
+        worker = partial(process_switch_vlan_switch, username=username, password=password,
+                         source_vlan=source_vlan, target_vlan=target_vlan, refresh_cache=refresh_cache)
+        current_task().mac_query_planner.forget(ips_to_scan)
+        for ip, saved in run_switch_pool(ips_to_scan, worker, max_workers, thread_name_prefix=f"Worker-{mode}"):
+            if saved is not None:
+                save_outcomes[ip] = saved
+        report_auth_breaker()
+        report_cancellation(total_ips)
+        report_query_plan_summary(ips_to_scan)
+        report_phase_timings(timings_file)
+
+        if save_outcomes:
+            report_save_outcomes(save_outcomes)
+        else:
+            post_event(("log", "\n--- Không có switch nào cần lưu cấu hình ---"))
+
+        end_time = time.time()
+        duration = end_time - start_time
+        post_event(("log", f"\n--- Hoàn thành tác vụ: {mode} (Thời gian: {duration:.2f} giây) ---"))
+        post_event(("status", f"{mode} đã hoàn thành"))
+        post_event(completion_message(mode, duration))
+        post_event(("progress", (1, 1)))
+        post_event(("enable_button", mode))
+        logger.info(f"[{thread_name}] Luồng xử lý hoàn thành cho chế độ: {mode}. Thời gian: {duration:.2f}s")
+        return
+
+    valid_macs = set()
+    original_mac_map = {}
+    valid_mac_found = False
+    for raw_mac in mac_list_raw:
+        if not raw_mac:
+            continue
+
+        if mode == "full_mac_config":
+            cleaned = clean_mac(raw_mac)
+            if cleaned:
+                valid_macs.add(cleaned)
+                original_mac_map[cleaned] = raw_mac
+                valid_mac_found = True
+            else:
+                post_event(("log", f"CẢNH BÁO: Bỏ qua định dạng MAC đầy đủ không hợp lệ: '{raw_mac}'", "WARNING"))
+        elif mode in ["last4_config", "mac_search"]:
+            last4 = raw_mac.strip().lower()
+            if VALID_MAC_LAST4_RE.match(last4):
+                valid_macs.add(last4)
+                original_mac_map[last4] = raw_mac
+                valid_mac_found = True
+            else:
+                post_event(("log", f"CẢNH BÁO: Bỏ qua định dạng 4 ký tự cuối MAC không hợp lệ: '{raw_mac}'", "WARNING"))
+
+    if not valid_mac_found and mac_list_raw:
+        error_msg = "Không tìm thấy địa chỉ MAC hoặc 4 ký tự cuối hợp lệ trong danh sách đầu vào."
+        logger.error(f"[{thread_name}] {error_msg}")
+        post_event(("log", f"LỖI: {error_msg}", "ERROR"))
+        post_event(("messagebox", ("error", error_msg)))
+        post_event(("status", "Lỗi: Không có MAC/4 ký tự cuối hợp lệ"))
+        post_event(("progress", (1, 1)))
+        post_event(("enable_button", mode))
+        return
+    elif not mac_list_raw and mode != "vlan_switch" and mode != "enable_ho":
+        error_msg = f"Danh sách địa chỉ MAC hoặc 4 ký tự cuối là bắt buộc cho chế độ '{mode}' nhưng đang trống."
+        logger.error(f"[{thread_name}] {error_msg}")
+        post_event(("log", f"LỖI: {error_msg}", "ERROR"))
+        post_event(("messagebox", ("error", error_msg)))
+        post_event(("status", "Lỗi: Danh sách MAC/4 ký tự cuối trống"))
+        post_event(("progress", (1, 1)))
+        post_event(("enable_button", mode))
+        return
+
+    post_event(("log", f"Đang xử lý {len(valid_macs)} MAC/4 ký tự cuối hợp lệ duy nhất.", "INFO"))
+    if valid_macs:
+        post_event(("log", f"Mục tiêu: {list(original_mac_map[p] for p in valid_macs)}"))
+
+    pending_macs = PendingTargets(valid_macs)
+    processed_results = []
+    save_outcomes: Dict[str, SaveOutcome] = {}
+
+    def scan_switches(ips: List[str], progress_base: int = 0):
+        prefetch_errors = None
+        scan_refresh_cache = refresh_cache
+        if mode == "mac_search" and use_async_telnet:
+            prefetch_errors = prefetch_mac_tables_async(ips, username, password, refresh_cache)
+            # Bảng vừa lấy đã nằm trong cache, luồng xử lý không cần tải lại
+            scan_refresh_cache = False
+
+        worker = partial(process_switch_mac_modes, username=username, password=password, mode=mode,
+                         target_vlan=target_vlan, pending_macs=pending_macs, original_mac_map=original_mac_map,
+                         prefetch_errors=prefetch_errors, refresh_cache=scan_refresh_cache)
+        for ip, result in run_switch_pool(ips, worker, max_workers, thread_name_prefix=f"Worker-{mode}",
+                                          progress_base=progress_base, progress_total=len(ips_to_scan),
+                                          read_only=mode in READ_ONLY_MODES):
+            if result is None:
+                continue
+            switch_results, saved = result
+            processed_results.extend(switch_results)
+            if saved is not None:
+                save_outcomes[ip] = saved
+
+    current_task().mac_query_planner.forget(ips_to_scan)
+    # Quét trước các switch mà kho thiết bị đầu cuối đã thấy MAC mục tiêu; chỉ quét phần còn lại khi vẫn còn mục tiêu
+    priority_ips = locate_in_inventory(ips_to_scan, valid_macs, mode, original_mac_map)
+    if priority_ips:
+        post_event(("log", f"Quét trước {len(priority_ips)} switch theo vị trí đã biết trong kho thiết bị đầu cuối", "INFO"))
+        scan_switches(priority_ips)
+        priority_set = set(priority_ips)
+        remaining_ips = [ip for ip in ips_to_scan if ip not in priority_set]
+        if task.cancel_token.is_cancelled():
+            for ip in remaining_ips:
+                task.cancel_token.skip(ip)
+        elif len(pending_macs) == 0:
+            post_event(("log", f"Đã xử lý tất cả mục tiêu trên các switch đã biết, bỏ qua {len(remaining_ips)} switch còn lại.", "SUCCESS"))
+        elif remaining_ips:
+            post_event(("log", f"Còn {len(pending_macs)} mục tiêu, quét {len(remaining_ips)} switch còn lại", "INFO"))
+            scan_switches(remaining_ips, progress_base=len(priority_ips))
+    else:
+        scan_switches(ips_to_scan)
+    flush_inventory()
+    report_auth_breaker()
+    report_cancellation(len(ips_to_scan))
+    report_query_plan_summary(ips_to_scan)
+    report_phase_timings(timings_file)
+
+    if save_outcomes:
+        report_save_outcomes(save_outcomes)
+    elif mode in ["full_mac_config", "last4_config"]:
+        post_event(("log", "\n--- Không có switch nào cần lưu cấu hình ---"))
+
+    end_time = time.time()
+    duration = end_time - start_time
+    post_event(("log", f"\n--- Hoàn thành tác vụ: {mode} (Thời gian: {duration:.2f} giây) ---"))
+    final_status = f"{mode} đã hoàn thành."
+
+    post_event(("log", "--- Tóm tắt kết quả ---"))
+    if processed_results:
+        summary_by_mac = {}
+        for ip, orig_mac, status, details in processed_results:
+            if orig_mac not in summary_by_mac:
+                summary_by_mac[orig_mac] = []
+            summary_by_mac[orig_mac].append((f"  - Trên {ip}: Trạng thái='{status}', Chi tiết='{details}'",
+                                             RESULT_STATUS_LEVELS.get(status, "NORMAL")))
+
+        for orig_mac in sorted(summary_by_mac.keys()):
+            post_event(("log", f"Mục tiêu: {orig_mac}"))
+            for result_line, level in summary_by_mac[orig_mac]:
+                post_event(("log", result_line, level))
+    else:
+        post_event(("log", "(Không có kết quả xử lý MAC/4 ký tự cuối cụ thể để hiển thị - có thể do lỗi kết nối hoặc không tìm thấy)", "WARNING"))
+
+    remaining_macs = pending_macs.remaining()
+    if remaining_macs:
+        post_event(("log", "\n--- Các MAC/4 ký tự cuối KHÔNG tìm thấy hoặc KHÔNG thể xử lý ---"))
+        unfound_originals = sorted([original_mac_map.get(p, p) for p in remaining_macs])
+        for mac_orig in unfound_originals:
+            post_event(("log", f"- {mac_orig}"))
+        final_status += f" ({len(remaining_macs)} mục chưa tìm thấy/xử lý)"
+    elif mode != "vlan_switch" and mode != "enable_ho":
+        post_event(("log", "\n(Tất cả MAC/4 ký tự cuối đã được tìm thấy hoặc không thể xử lý)"))
+        final_status += " (Tất cả mục đã xử lý)"
+
+    post_event(("status", final_status))
+    post_event(completion_message(mode, duration))
+    post_event(("progress", (1, 1)))
+    post_event(("enable_button", mode))
+    logger.info(f"[{thread_name}] Luồng xử lý hoàn thành cho chế độ: {mode}. Thời gian: {duration:.2f}s")
+
+class TaskQueue:
+    # Hàng đợi tác vụ của GUI: tối đa max_tasks tác vụ chạy đồng thời, mỗi tác vụ một luồng và một TaskContext;
+    # tác vụ gửi sau chờ theo thứ tự gửi. Số phiên Telnet chung do device_scheduler giới hạn.
+    def __init__(self, max_tasks: int = MAX_CONCURRENT_TASKS):
+        self.max_tasks = max_tasks
+        self._running: Dict[str, threading.Thread] = {}
+        self._waiting: List[Tuple[Dict[str, Any], TaskContext]] = []
+        self._lock = threading.Lock()
+
+    def submit(self, task_details: Dict[str, Any], task: TaskContext) -> int:
+        # 0: đã bắt đầu chạy; n > 0: vị trí trong hàng đợi
+        with self._lock:
+            self._waiting.append((task_details, task))
+            self._start_waiting_locked()
+            for position, (_, waiting) in enumerate(self._waiting, start=1):
+                if waiting is task:
+                    return position
+            return 0
+
+    def cancel(self, task: TaskContext) -> bool:
+        # True: tác vụ đang chờ đã được rút khỏi hàng đợi. Tác vụ đang chạy được yêu cầu dừng (cancel_token)
+        with self._lock:
+            for index, (_, waiting) in enumerate(self._waiting):
+                if waiting is task:
+                    del self._waiting[index]
+                    return True
+        task.cancel_token.cancel()
+        return False
+
+    def counts(self) -> Tuple[int, int]:
+        # (đang chạy, đang chờ)
+        with self._lock:
+            return len(self._running), len(self._waiting)
+
+    def _start_waiting_locked(self):
+        while self._waiting and len(self._running) < self.max_tasks:
+            task_details, task = self._waiting.pop(0)
+            thread = threading.Thread(target=self._run, args=(task_details, task), name=f"Worker-{task.name}", daemon=True)
+            self._running[task.name] = thread
+            log_details = {k: v for k, v in task_details.items() if k != 'password'}
+            logger.info(f"Bắt đầu luồng xử lý '{thread.name}' với chi tiết: {log_details}")
+            thread.start()
+
+    def _run(self, task_details: Dict[str, Any], task: TaskContext):
+        try:
+            task_worker(task_details, task)
+        except Exception as e:
+            # Luôn trả lại nút bắt đầu của tab, kể cả khi tác vụ dừng bất thường
+            logger.exception(f"Tác vụ {task.name} dừng bất thường")
+            task.events.put(("log", f"LỖI NGHIÊM TRỌNG: tác vụ {task.name} dừng bất thường: {e}", "ERROR"))
+            task.events.put(("enable_button", task_details.get("mode")))
+        finally:
+            with self._lock:
+                self._running.pop(task.name, None)
+                self._start_waiting_locked()
@@ -1,763 +1,33 @@
 # -*- coding: utf-8 -*-
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-from netmiko import ConnectHandler
-from netmiko.exceptions import NetmikoTimeoutException, NetmikoAuthenticationException
-import re
 import webbrowser
-import threading
 import queue
 import logging
 import time
+import sqlite3
 from typing import List, Tuple, Optional, Dict, Any
 from ipaddress import ip_address
+from switch_core import (gui_queue, TaskContext, TaskQueue, device_scheduler, endpoint_inventory, LOG_TAGS, MAX_CONCURRENT_SWITCHES,
+                         MAX_CONCURRENT_SWITCHES_LIMIT, READ_ONLY_MODES, RESTRICTED_USERNAMES, VALID_VLAN_RE)
 
 # Constants
 APP_NAME = "L1 Switch Automation (Telnet)"
 APP_VERSION = "1.3"
 AUTHOR = "Anhln1 (v1.3)"
-TELNET_TIMEOUT = 20
 DOC_URL = "https://wiki.lpbank.com.vn/w/index.php/D%E1%BB%8Bch_v%E1%BB%A5_%E1%BB%A8ng_d%E1%BB%A5ng_H%E1%BA%A1_t%E1%BA%A7ng_CNTT"
-MAX_MAC_COUNT_SEARCH = 10  # Skip ports with more than this number of MACs in mac_search mode
+GUI_QUEUE_BATCH_SIZE = 1000  # Queue events handled per Tk frame; the rest wait for the next frame
+GUI_QUEUE_POLL_MS = 150
+GUI_QUEUE_BACKLOG_POLL_MS = 10  # Poll interval while the queue still has a backlog
+LOG_WIDGET_MAX_LINES = 5000  # Older lines are dropped from the output box (full log stays in LOG_HISTORY_FILE)
+LOG_HISTORY_FILE = "switch_manager_history.log"
+PHASE_TIMINGS_FILE = "switch_manager_timings.jsonl"  # Per-switch phase timings, one JSON line per switch per run
+INVENTORY_DB_FILE = "switch_manager_inventory.db"  # SQLite store of MACs seen in full MAC table downloads
 
 # Logging Setup (Console/GUI Only)
-log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - [%(threadName)s] - %(message)s')
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-# Regex
-MAC_TABLE_RE = re.compile(
-    r"^\s*(?:\*|\s)\s*(?P<vlan>\d+)\s+"
-    r"(?P<mac>[0-9a-fA-F]{4}\.[0-9a-fA-F]{4}\.[0-9a-fA-F]{4})\s+"
-    r"\S+\s+"
-    r"(?P<port>\S+)\s*$",
-    re.IGNORECASE | re.MULTILINE
-)
-VALID_MAC_RE = re.compile(r'^[0-9a-fA-F:-]{12,17}$')
-VALID_MAC_LAST4_RE = re.compile(r'^[0-9a-fA-F]{4}$')
-VALID_VLAN_RE = re.compile(r'^\d{1,4}$')
-
-# Thread-Safe Queue
-gui_queue = queue.Queue()
-
-# Core Network & Logic Functions
-def generate_switch_ips(start_ip: str, end_ip: str) -> Tuple[Optional[List[str]], Optional[str]]:
-    ip_list = []
-    try:
-        start_ip_clean = start_ip.strip()
-        end_ip_clean = end_ip.strip()
-        start_parts = start_ip_clean.split('.')
-        end_parts = end_ip_clean.split('.')
-
-        if (len(start_parts) != 4 or len(end_parts) != 4 or
-                not all(part.isdigit() and 0 <= int(part) <= 255 for part in start_parts + end_parts)):
-            raise ValueError("Định dạng địa chỉ IP không hợp lệ.")
-
-        start_octets = [int(x) for x in start_parts]
-        end_octets = [int(x) for x in end_parts]
-
-        start_num = (start_octets[0] << 24) | (start_octets[1] << 16) | (start_octets[2] << 8) | start_octets[3]
-        end_num = (end_octets[0] << 24) | (end_octets[1] << 16) | (end_octets[2] << 8) | end_octets[3]
-
-        if start_num > end_num:
-            raise ValueError("IP bắt đầu phải nhỏ hơn hoặc bằng IP kết thúc.")
-
-        ip_count = end_num - start_num + 1
-        if ip_count > 1024:
-            logger.warning(f"Yêu cầu dải IP lớn: {start_ip_clean} - {end_ip_clean} ({ip_count} IPs)")
-
-        current_num = start_num
-        while current_num <= end_num:
-            ip = f"{(current_num >> 24) & 255}.{(current_num >> 16) & 255}.{(current_num >> 8) & 255}.{current_num & 255}"
-            ip_list.append(ip)
-            current_num += 1
-
-        if not ip_list:
-            raise ValueError("Danh sách IP sinh ra trống (dải có thể không hợp lệ).")
-
-        return ip_list, None
-
-    except ValueError as e:
-        logger.error(f"Lỗi dải IP: {e}. Đầu vào: '{start_ip}' - '{end_ip}'")
-        return None, f"Lỗi dải IP: {e}"
-    except Exception as e:
-        logger.exception(f"Lỗi không xác định khi tạo dải IP: {start_ip} - {end_ip}")
-        return None, f"Lỗi không xác định khi tạo dải IP: {e}"
-
-def clean_mac(mac: str) -> Optional[str]:
-    cleaned = re.sub(r'[-:.]', '', mac.strip().lower())
-    if len(cleaned) == 12 and all(c in '0123456789abcdef' for c in cleaned):
-        return cleaned
-    logger.warning(f"Phát hiện định dạng MAC không hợp lệ: {mac}")
-    return None
-
-def format_mac_cisco(mac_cleaned: str) -> str:
-    if len(mac_cleaned) != 12:
-        logger.error(f"Đầu vào không hợp lệ cho format_mac_cisco: {mac_cleaned}")
-        return mac_cleaned
-    return f"{mac_cleaned[:4]}.{mac_cleaned[4:8]}.{mac_cleaned[8:]}"
-
-def connect_to_device(ip: str, username: str, password: str) -> Tuple[Optional[ConnectHandler], str]:
-    device_info = {
-        'device_type': 'cisco_ios_telnet',
-        'host': ip,
-        'username': username,
-        'password': password,
-        'timeout': TELNET_TIMEOUT,
-    }
-    try:
-        logger.info(f"Đang thử kết nối Telnet đến {ip}...")
-        connection = ConnectHandler(**device_info)
-        prompt = connection.find_prompt()
-        logger.info(f"Kết nối Telnet thành công đến {ip} ({prompt})")
-        return connection, f"Đã kết nối Telnet đến {ip}"
-    except NetmikoTimeoutException:
-        logger.warning(f"Hết thời gian kết nối Telnet đến {ip}")
-        return None, f"Hết thời gian kết nối Telnet đến {ip}"
-    except NetmikoAuthenticationException:
-        logger.error(f"Xác thực Telnet thất bại cho {ip}")
-        return None, f"Xác thực Telnet thất bại cho {ip}"
-    except Exception as e:
-        logger.exception(f"Kết nối Telnet đến {ip} thất bại: {type(e).__name__}")
-        return None, f"Lỗi kết nối Telnet đến {ip}: {type(e).__name__}"
-
-def disconnect_device(connection: Optional[ConnectHandler], ip: str):
-    if connection and connection.is_alive():
-        try:
-            connection.disconnect()
-            logger.info(f"Đã ngắt kết nối Telnet khỏi {ip}")
-        except Exception as e:
-            logger.exception(f"Lỗi khi ngắt kết nối Telnet khỏi {ip}")
-    elif connection:
-        logger.warning(f"Thử ngắt kết nối Telnet khỏi {ip}, nhưng kết nối không còn hoạt động.")
-
-def get_mac_address_table(connection: ConnectHandler) -> Optional[str]:
-    ip = getattr(connection, 'host', 'IP không xác định')
-    try:
-        logger.debug(f"Gửi lệnh 'show mac address-table' đến {ip}")
-        output = connection.send_command_timing("show mac address-table", delay_factor=2)
-        logger.debug(f"Nhận bảng MAC từ {ip} (độ dài: {len(output) if output else 0})")
-        if output is None:
-            logger.error(f"Lệnh 'show mac address-table' trả về None cho {ip}")
-            gui_queue.put(("log", f"LỖI: Không lấy được bảng MAC từ {ip} (Lệnh trả về None)"))
-            return None
-        return output
-    except Exception as e:
-        logger.exception(f"Không lấy được bảng MAC từ {ip}")
-        gui_queue.put(("log", f"LỖI: Không lấy được bảng MAC từ {ip}: {e}"))
-        return None
-
-def parse_mac_table(mac_table_output: str) -> List[Dict[str, str]]:
-    entries = []
-    if not mac_table_output:
-        return entries
-    for match in MAC_TABLE_RE.finditer(mac_table_output):
-        try:
-            entry_data = {k: v.strip().lower() for k, v in match.groupdict().items()}
-            if not entry_data.get('vlan') or not entry_data.get('mac') or not entry_data.get('port'):
-                logger.warning(f"Bỏ qua mục MAC phân tích không đầy đủ: {match.group(0)}")
-                continue
-            entries.append(entry_data)
-        except Exception as e:
-            logger.error(f"Lỗi phân tích dòng bảng MAC: {match.group(0)} - {e}")
-    return entries
-
-def count_macs_on_port(parsed_mac_table: List[Dict[str, str]], target_port: str) -> int:
-    target_port_lower = target_port.lower()
-    return sum(1 for entry in parsed_mac_table if entry.get('port') == target_port_lower)
-
-def find_mac_in_parsed_table(parsed_mac_table: List[Dict[str, str]], target_mac_cleaned: str) -> Optional[Tuple[str, str, int]]:
-    target_mac_cisco = format_mac_cisco(target_mac_cleaned).lower()
-    for entry in parsed_mac_table:
-        if entry.get('mac') == target_mac_cisco:
-            port = entry.get('port', 'Không xác định')
-            vlan = entry.get('vlan', 'Không xác định')
-            mac_count = count_macs_on_port(parsed_mac_table, port)
-            return port, vlan, mac_count
-    return None
-
-def find_mac_last4_in_parsed_table(parsed_mac_table: List[Dict[str, str]], target_mac_last4: str) -> List[Tuple[str, str, str, int]]:
-    target_mac_last4_lower = target_mac_last4.lower()
-    found_entries = []
-    for entry in parsed_mac_table:
-        mac_cisco = entry.get('mac')
-        if mac_cisco:
-            mac_no_dots = mac_cisco.replace('.', '')
-            if mac_no_dots.endswith(target_mac_last4_lower):
-                port = entry.get('port', 'Không xác định')
-                vlan = entry.get('vlan', 'Không xác định')
-                mac_count = count_macs_on_port(parsed_mac_table, port)
-                found_entries.append((mac_cisco, port, vlan, mac_count))
-    return found_entries
-
-def configure_vlan(connection: ConnectHandler, port: str, vlan: str) -> bool:
-    ip = getattr(connection, 'host', 'IP không xác định')
-    config_commands = [
-        f"interface {port}",
-        f"switchport access vlan {vlan}",
-        "end"
-    ]
-    try:
-        logger.info(f"Cấu hình VLAN {vlan} trên {port} @ {ip}")
-        output = connection.send_config_set(config_commands, exit_config_mode=False)
-        logger.debug(f"Kết quả cấu hình VLAN từ {ip} cho {port}: {output}")
-        output_lower = output.lower() if output else ""
-        if "error" in output_lower or "invalid" in output_lower or "exceeded" in output_lower or "%" in output:
-            logger.error(f"Có thể xảy ra lỗi khi cấu hình VLAN {vlan} trên {port} @ {ip}. Kết quả: {output}")
-            gui_queue.put(("log", f"CẢNH BÁO: Có thể xảy ra lỗi khi cấu hình VLAN {vlan} trên {port} @ {ip}. Kết quả: {output}"))
-        gui_queue.put(("log", f"Đã đặt VLAN {vlan} trên {port} @ {ip}"))
-        return True
-    except Exception as e:
-        logger.exception(f"Không đặt được VLAN {vlan} trên {port} @ {ip}")
-        gui_queue.put(("log", f"LỖI: Không đặt được VLAN {vlan} trên {port} @ {ip}: {e}"))
-        return False
-
-def save_configuration(connection: ConnectHandler) -> bool:
-    ip = getattr(connection, 'host', 'IP không xác định')
-    try:
-        if not connection.is_alive():
-            logger.error(f"Kết nối Telnet đến {ip} không còn hoạt động trước khi lưu cấu hình.")
-            gui_queue.put(("log", f"LỖI: Kết nối Telnet đến {ip} đã ngắt trước khi lưu cấu hình."))
-            return False
-
-        logger.info(f"Đang thử lưu cấu hình trên {ip} qua Telnet...")
-        output = connection.send_command_timing(
-            "write memory",
-            delay_factor=4,
-            strip_prompt=False,
-            strip_command=False
-        )
-        logger.debug(f"Kết quả lệnh 'write memory' từ {ip}: {output}")
-
-        output_lower = output.lower() if output else ""
-        success_keywords = ["ok", "[ok]", "building configuration", "configuration saved", "written to memory"]
-        if any(keyword in output_lower for keyword in success_keywords):
-            logger.info(f"Cấu hình được lưu thành công trên {ip}")
-            gui_queue.put(("log", f"Đã lưu cấu hình thành công trên {ip}"))
-            return True
-
-        if "confirm" in output_lower or "destination filename" in output_lower:
-            logger.info(f"Phát hiện yêu cầu xác nhận khi lưu cấu hình trên {ip}. Gửi Enter.")
-            output_confirm = connection.send_command_timing("\n", delay_factor=4)
-            logger.debug(f"Kết quả xác nhận từ {ip}: {output_confirm}")
-            output_confirm_lower = output_confirm.lower() if output_confirm else ""
-            if any(keyword in output_confirm_lower for keyword in success_keywords):
-                logger.info(f"Cấu hình được lưu thành công trên {ip} sau khi xác nhận")
-                gui_queue.put(("log", f"Đã lưu cấu hình thành công trên {ip} sau khi xác nhận"))
-                return True
-            else:
-                logger.warning(f"Không xác nhận được việc lưu cấu hình trên {ip} sau khi gửi Enter. Kết quả: {output_confirm}")
-                gui_queue.put(("log", f"CẢNH BÁO: Lưu cấu hình trên {ip} không xác nhận được sau khi gửi Enter. Kết quả: {output_confirm}"))
-                return False
-
-        logger.warning(f"Lưu cấu hình trên {ip} không tìm thấy xác nhận thành công. Kết quả: {output}")
-        gui_queue.put(("log", f"CẢNH BÁO: Lưu cấu hình trên {ip} không xác nhận được. Kết quả: {output}"))
-        return False
-
-    except Exception as e:
-        logger.exception(f"Lỗi khi lưu cấu hình trên {ip}: {str(e)}")
-        gui_queue.put(("log", f"LỖI: Không lưu được cấu hình trên {ip}: {str(e)}"))
-        return False
-
-def process_switch_enable_ho(ip: str, username: str, password: str) -> None:
-    connection = None
-    try:
-        connection, status_msg = connect_to_device(ip, username, password)
-        gui_queue.put(("log", status_msg))
-        if connection is None:
-            return
-
-        logger.info(f"Đã kết nối Telnet đến switch {ip}")
-        logger.info(f"Đang xóa port-security trên {ip}...")
-        gui_queue.put(("log", f"Đang xóa port-security trên {ip}..."))
-        try:
-            connection.send_command_timing("clear port-security all", delay_factor=2)
-            gui_queue.put(("log", f"Đã gửi lệnh xóa port-security đến {ip}"))
-        except Exception as cmd_err:
-            logger.error(f"Lỗi khi gửi lệnh 'clear port-security all' đến {ip}: {cmd_err}")
-            gui_queue.put(("log", f"LỖI khi gửi lệnh 'clear port-security all' đến {ip}: {cmd_err}"))
-            return
-
-        logger.info(f"Đang kiểm tra các cổng bị vô hiệu hóa trên {ip}...")
-        gui_queue.put(("log", f"Đang kiểm tra các cổng bị vô hiệu hóa trên {ip}..."))
-        output = None
-        try:
-            output = connection.send_command_timing("show int status", delay_factor=2)
-        except Exception as cmd_err:
-            logger.error(f"Lỗi khi gửi lệnh 'show int status' đến {ip}: {cmd_err}")
-            gui_queue.put(("log", f"LỖI khi gửi lệnh 'show int status' đến {ip}: {cmd_err}"))
-            return
-
-        if not output:
-            logger.error(f"Không nhận được đầu ra từ lệnh 'show int status' trên {ip}")
-            gui_queue.put(("log", f"LỖI: Không nhận được đầu ra từ lệnh 'show int status' trên {ip}"))
-            return
-
-        disabled_ports = []
-        lines = output.splitlines()
-        for line in lines:
-            line_lower = line.lower()
-            if ("gi" in line_lower or "fa" in line_lower or "te" in line_lower) and "disabled" in line_lower:
-                parts = line.split()
-                if parts:
-                    port_id = parts[0]
-                    if re.match(r'^(Gi|Fa|Te|Eth)\d+([/\d.]*)?$', port_id, re.IGNORECASE):
-                        port_name_desc = " ".join(parts[1:-2]).lower()
-                        if "loop" not in port_name_desc:
-                            disabled_ports.append(port_id)
-                        else:
-                            logger.info(f"Bỏ qua cổng {port_id} vì mô tả/tên chứa 'loop': '{port_name_desc}'")
-                            gui_queue.put(("log", f"INFO: Bỏ qua cổng {port_id} vì mô tả/tên chứa 'loop': '{port_name_desc}'"))
-                    else:
-                        logger.debug(f"Dòng khớp 'disabled' nhưng phần tử đầu tiên '{parts[0]}' không giống ID cổng: {line}")
-
-        logger.info(f"Tìm thấy {len(disabled_ports)} cổng bị vô hiệu hóa cần kích hoạt trên {ip}: {disabled_ports}")
-        gui_queue.put(("log", f"Tìm thấy {len(disabled_ports)} cổng bị vô hiệu hóa cần kích hoạt trên {ip}: {disabled_ports}"))
-
-        if disabled_ports:
-            logger.info(f"Đang kích hoạt các cổng trên {ip}...")
-            gui_queue.put(("log", f"Đang kích hoạt các cổng trên {ip}..."))
-            config_commands = []
-            for port in disabled_ports:
-                config_commands.extend([
-                    f"interface {port}",
-                    "shutdown",
-                    "no shutdown"
-                ])
-
-            try:
-                config_output = connection.send_config_set(config_commands)
-                logger.debug(f"Kết quả kích hoạt cổng trên {ip}: {config_output}")
-                for port in disabled_ports:
-                    logger.info(f"Đã gửi lệnh kích hoạt cho cổng {port} trên {ip}")
-                    gui_queue.put(("log", f"Đã gửi lệnh kích hoạt cho cổng {port} trên {ip}"))
-            except Exception as config_err:
-                logger.error(f"Lỗi khi gửi lệnh cấu hình kích hoạt cổng đến {ip}: {config_err}")
-                gui_queue.put(("log", f"LỖI khi gửi lệnh kích hoạt cổng đến {ip}: {config_err}"))
-                return
-
-        else:
-            logger.info(f"Không có cổng nào cần kích hoạt trên {ip}")
-            gui_queue.put(("log", f"Không có cổng nào cần kích hoạt trên {ip}"))
-
-        if disabled_ports:
-            gui_queue.put(("log", f"Đang lưu cấu hình trên {ip} sau khi kích hoạt cổng..."))
-            save_success = save_configuration(connection)
-            if not save_success:
-                gui_queue.put(("messagebox", ("warning", f"Không lưu được cấu hình trên {ip} sau khi kích hoạt cổng. Vui lòng kiểm tra thiết bị.")))
-        else:
-            gui_queue.put(("log", f"Không có thay đổi nào được thực hiện trên {ip}, bỏ qua lưu cấu hình."))
-
-    except Exception as e:
-        logger.exception(f"Lỗi không mong muốn khi xử lý enable_ho cho {ip}: {str(e)}")
-        gui_queue.put(("log", f"LỖI NGHIÊM TRỌNG khi xử lý {ip} (enable_ho): {str(e)}"))
-    finally:
-        if connection:
-            disconnect_device(connection, ip)
-
-def find_ports_in_vlan(parsed_mac_table: List[Dict[str, str]], source_vlan: str) -> List[str]:
-    source_vlan_lower = source_vlan.lower()
-    ports = set()
-    for entry in parsed_mac_table:
-        if entry.get('vlan') == source_vlan_lower:
-            port = entry.get('port')
-            if port:
-                ports.add(port)
-    return sorted(list(ports))
-
-def task_worker(task_details: Dict[str, Any]):
-    mode = task_details.get("mode")
-    username = task_details.get("username")
-    password = task_details.get("password")
-    start_ip = task_details.get("start_ip")
-    end_ip = task_details.get("end_ip")
-    target_vlan = task_details.get("target_vlan")
-    source_vlan = task_details.get("source_vlan")
-    mac_list_raw = task_details.get("mac_list", [])
-
-    if not all([mode, username, password, start_ip, end_ip]):
-        gui_queue.put(("log", "LỖI: Luồng xử lý bắt đầu với thông tin cần thiết bị thiếu."))
-        gui_queue.put(("status", "Lỗi: Thiết lập tác vụ nội bộ"))
-        gui_queue.put(("messagebox", ("error", "Lỗi nội bộ: Thiếu thông tin tác vụ.")))
-        gui_queue.put(("progress", (1, 1)))
-        gui_queue.put(("enable_button", mode))
-        return
-
-    start_time = time.time()
-    thread_name = threading.current_thread().name
-    logger.info(f"[{thread_name}] Luồng xử lý bắt đầu cho chế độ: {mode}")
-    gui_queue.put(("status", f"Đang khởi động: {mode}..."))
-    gui_queue.put(("progress", (0, 1)))
-
-    ips_to_scan, ip_error = generate_switch_ips(start_ip, end_ip)
-
-    if ip_error:
-        logger.error(f"[{thread_name}] Tạo danh sách IP thất bại: {ip_error}")
-        gui_queue.put(("log", f"LỖI: {ip_error}"))
-        gui_queue.put(("messagebox", ("error", ip_error)))
-        gui_queue.put(("status", "Lỗi khi tạo danh sách IP"))
-        gui_queue.put(("progress", (1, 1)))
-        gui_queue.put(("enable_button", mode))
-        return
-
-    total_ips = len(ips_to_scan)
-    gui_queue.put(("log", f"Đã tạo {total_ips} IP để quét: {ips_to_scan[0]}...{ips_to_scan[-1]}"))
-    gui_queue.put(("progress", (0, total_ips)))
-
-    if mode == "enable_ho":
-        processed_ip_count = 0
-        for ip in ips_to_scan:
-            processed_ip_count += 1
-            gui_queue.put(("status", f"Đang xử lý {ip} ({processed_ip_count}/{total_ips})..."))
-            gui_queue.put(("progress", (processed_ip_count, total_ips)))
-            process_switch_enable_ho(ip, username, password)
-
-        end_time = time.time()
-        duration = end_time - start_time
-        gui_queue.put(("log", f"\n--- Hoàn thành tác vụ: {mode} (Thời gian: {duration:.2f} giây) ---"))
-        gui_queue.put(("status", f"{mode} đã hoàn thành"))
-        gui_queue.put(("messagebox", ("info", f"Tác vụ {mode} hoàn thành trong {duration:.2f} giây. Kiểm tra nhật ký chi tiết.")))
-        gui_queue.put(("progress", (total_ips, total_ips)))
-        gui_queue.put(("enable_button", mode))
-        logger.info(f"[{thread_name}] Luồng xử lý hoàn thành cho chế độ: {mode}. Thời gian: {duration:.2f}s")
-        return
-
-    elif mode == "vlan_switch":
-        processed_ip_count = 0
-        switches_needing_save = set()
-        connection: Optional[ConnectHandler] = None
-
-        if not source_vlan or not target_vlan:
-            gui_queue.put(("log", "LỖI: Thiếu VLAN nguồn hoặc VLAN đích."))
-            gui_queue.put(("messagebox", ("error", "VLAN nguồn và VLAN đích là bắt buộc.")))
-            gui_queue.put(("status", "Lỗi: Thiếu thông tin VLAN"))
-            gui_queue.put(("progress", (1, 1)))
-            gui_queue.put(("enable_button", mode))
-            return
-
-        gui_queue.put(("log", f"Đang tìm các cổng trong VLAN {source_vlan} để chuyển sang VLAN {target_vlan}"))
-
-        for ip in ips_to_scan:
-            processed_ip_count += 1
-            gui_queue.put(("status", f"Đang xử lý {ip} ({processed_ip_count}/{total_ips})..."))
-            gui_queue.put(("progress", (processed_ip_count, total_ips)))
-
-            connection, status_msg = connect_to_device(ip, username, password)
-            gui_queue.put(("log", status_msg))
-
-            if connection is None:
-                continue
-
-            try:
-                mac_table_str = get_mac_address_table(connection)
-                if mac_table_str is None:
-                    continue
-
-                parsed_mac_table = parse_mac_table(mac_table_str)
-                if not parsed_mac_table:
-                    gui_queue.put(("log", f"THÔNG TIN: Không tìm thấy hoặc phân tích được mục MAC nào trong bảng cho {ip}."))
-                    continue
-
-                ports_in_source_vlan = find_ports_in_vlan(parsed_mac_table, source_vlan)
-                if not ports_in_source_vlan:
-                    gui_queue.put(("log", f"THÔNG TIN: Không tìm thấy cổng nào trong VLAN {source_vlan} trên {ip}."))
-                    continue
-
-                gui_queue.put(("log", f"    Tìm thấy {len(ports_in_source_vlan)} cổng trong VLAN {source_vlan} trên {ip}: {', '.join(ports_in_source_vlan)}"))
-                changes_made_on_this_switch = False
-
-                for port in ports_in_source_vlan:
-                    gui_queue.put(("log", f"    Đang thử chuyển cổng {port} từ VLAN {source_vlan} sang VLAN {target_vlan}..."))
-                    if configure_vlan(connection, port, target_vlan):
-                        changes_made_on_this_switch = True
-
-                if changes_made_on_this_switch:
-                    switches_needing_save.add(ip)
-                    gui_queue.put(("log", f"--- Switch {ip} được đánh dấu để lưu cấu hình ---"))
-
-            except Exception as e:
-                logger.exception(f"[{thread_name}] Lỗi không xác định khi xử lý switch {ip} (vlan_switch)")
-                gui_queue.put(("log", f"LỖI NGHIÊM TRỌNG khi xử lý {ip} (vlan_switch): {e}"))
-            finally:
-                disconnect_device(connection, ip)
-                connection = None
-
-        if switches_needing_save:
-            gui_queue.put(("log", "\n--- Đang lưu cấu hình cho các switch đã thay đổi ---"))
-            gui_queue.put(("status", "Đang lưu cấu hình..."))
-            save_count = 0
-            total_saves = len(switches_needing_save)
-            gui_queue.put(("progress", (0, total_saves)))
-
-            sorted_ips_to_save = sorted(list(switches_needing_save))
-            for ip_to_save in sorted_ips_to_save:
-                save_count += 1
-                gui_queue.put(("status", f"Đang lưu cấu hình trên {ip_to_save} ({save_count}/{total_saves})..."))
-                gui_queue.put(("progress", (save_count, total_saves)))
-
-                save_conn, status_msg = connect_to_device(ip_to_save, username, password)
-                gui_queue.put(("log", status_msg))
-                if save_conn:
-                    save_success = save_configuration(save_conn)
-                    disconnect_device(save_conn, ip_to_save)
-                    if not save_success:
-                        gui_queue.put(("messagebox", ("warning", f"Không lưu được cấu hình trên {ip_to_save}. Vui lòng kiểm tra thiết bị thủ công và nhật ký.")))
-                else:
-                    gui_queue.put(("log", f"LỖI: Không thể kết nối lại với {ip_to_save} để lưu cấu hình."))
-                    gui_queue.put(("messagebox", ("error", f"Không thể kết nối lại với {ip_to_save} để lưu cấu hình. Vui lòng lưu thủ công!")))
-            gui_queue.put(("progress", (total_saves, total_saves)))
-        else:
-            gui_queue.put(("log", "\n--- Không có switch nào cần lưu cấu hình ---"))
-
-        end_time = time.time()
-        duration = end_time - start_time
-        gui_queue.put(("log", f"\n--- Hoàn thành tác vụ: {mode} (Thời gian: {duration:.2f} giây) ---"))
-        gui_queue.put(("status", f"{mode} đã hoàn thành"))
-        gui_queue.put(("messagebox", ("info", f"Tác vụ {mode} hoàn thành trong {duration:.2f} giây. Kiểm tra nhật ký chi tiết.")))
-        gui_queue.put(("progress", (1, 1)))
-        gui_queue.put(("enable_button", mode))
-        logger.info(f"[{thread_name}] Luồng xử lý hoàn thành cho chế độ: {mode}. Thời gian: {duration:.2f}s")
-        return
-
-    pending_macs = set()
-    original_mac_map = {}
-    valid_mac_found = False
-    for raw_mac in mac_list_raw:
-        if not raw_mac:
-            continue
-
-        if mode == "full_mac_config":
-            cleaned = clean_mac(raw_mac)
-            if cleaned:
-                pending_macs.add(cleaned)
-                original_mac_map[cleaned] = raw_mac
-                valid_mac_found = True
-            else:
-                gui_queue.put(("log", f"CẢNH BÁO: Bỏ qua định dạng MAC đầy đủ không hợp lệ: '{raw_mac}'"))
-        elif mode in ["last4_config", "mac_search"]:
-            last4 = raw_mac.strip().lower()
-            if VALID_MAC_LAST4_RE.match(last4):
-                pending_macs.add(last4)
-                original_mac_map[last4] = raw_mac
-                valid_mac_found = True
-            else:
-                gui_queue.put(("log", f"CẢNH BÁO: Bỏ qua định dạng 4 ký tự cuối MAC không hợp lệ: '{raw_mac}'"))
-
-    if not valid_mac_found and mac_list_raw:
-        error_msg = "Không tìm thấy địa chỉ MAC hoặc 4 ký tự cuối hợp lệ trong danh sách đầu vào."
-        logger.error(f"[{thread_name}] {error_msg}")
-        gui_queue.put(("log", f"LỖI: {error_msg}"))
-        gui_queue.put(("messagebox", ("error", error_msg)))
-        gui_queue.put(("status", "Lỗi: Không có MAC/4 ký tự cuối hợp lệ"))
-        gui_queue.put(("progress", (1, 1)))
-        gui_queue.put(("enable_button", mode))
-        return
-    elif not mac_list_raw and mode != "vlan_switch" and mode != "enable_ho":
-        error_msg = f"Danh sách địa chỉ MAC hoặc 4 ký tự cuối là bắt buộc cho chế độ '{mode}' nhưng đang trống."
-        logger.error(f"[{thread_name}] {error_msg}")
-        gui_queue.put(("log", f"LỖI: {error_msg}"))
-        gui_queue.put(("messagebox", ("error", error_msg)))
-        gui_queue.put(("status", "Lỗi: Danh sách MAC/4 ký tự cuối trống"))
-        gui_queue.put(("progress", (1, 1)))
-        gui_queue.put(("enable_button", mode))
-        return
-
-    gui_queue.put(("log", f"Đang xử lý {len(pending_macs)} MAC/4 ký tự cuối hợp lệ duy nhất."))
-    if pending_macs:
-        gui_queue.put(("log", f"Mục tiêu: {list(original_mac_map[p] for p in pending_macs)}"))
-
-    processed_results = []
-    switches_needing_save = set()
-    connection: Optional[ConnectHandler] = None
-    processed_ip_count = 0
-
-    for ip in ips_to_scan:
-        processed_ip_count += 1
-        gui_queue.put(("status", f"Đang xử lý {ip} ({processed_ip_count}/{total_ips})..."))
-        gui_queue.put(("progress", (processed_ip_count, total_ips)))
-
-        if not pending_macs:
-            gui_queue.put(("log", f"Đã xử lý tất cả MAC/4 ký tự cuối mục tiêu. Dừng quét tại {ip}."))
-            logger.info(f"[{thread_name}] Đã xử lý tất cả MAC/4 ký tự cuối mục tiêu. Dừng quét.")
-            break
-
-        connection, status_msg = connect_to_device(ip, username, password)
-        gui_queue.put(("log", status_msg))
-
-        if connection is None:
-            continue
-
-        try:
-            mac_table_str = get_mac_address_table(connection)
-            if mac_table_str is None:
-                continue
-
-            parsed_mac_table = parse_mac_table(mac_table_str)
-            if not parsed_mac_table:
-                gui_queue.put(("log", f"THÔNG TIN: Không tìm thấy hoặc phân tích được mục MAC nào trong bảng cho {ip}."))
-                continue
-
-            changes_made_on_this_switch = False
-            macs_found_on_this_switch = set()
-
-            for mac_key in list(pending_macs):
-                original_input_mac = original_mac_map.get(mac_key, mac_key)
-                gui_queue.put(("log", f"  Đang kiểm tra '{original_input_mac}' trên {ip}..."))
-
-                found_port, found_vlan, found_mac_count = None, None, None
-                found_full_mac_cisco = None
-
-                if mode == "full_mac_config":
-                    result = find_mac_in_parsed_table(parsed_mac_table, mac_key)
-                    if result:
-                        found_port, found_vlan, found_mac_count = result
-                        found_full_mac_cisco = format_mac_cisco(mac_key)
-                        gui_queue.put(("log", f"    Tìm thấy {found_full_mac_cisco}: Cổng={found_port}, VLAN={found_vlan}, Số MAC trên cổng={found_mac_count}"))
-                        macs_found_on_this_switch.add(mac_key)
-
-                elif mode in ["last4_config", "mac_search"]:
-                    matches = find_mac_last4_in_parsed_table(parsed_mac_table, mac_key)
-                    if matches:
-                        gui_queue.put(("log", f"    Tìm thấy {len(matches)} kết quả khớp cho *{original_input_mac} trên {ip}:"))
-                        best_candidate = None
-                        valid_match_found = False  # For mac_search mode
-
-                        for f_mac, f_port, f_vlan, f_count in matches:
-                            if mode == "mac_search" and f_count > MAX_MAC_COUNT_SEARCH:
-                                gui_queue.put(("log", f"      - MAC: {f_mac}, Cổng={f_port}, VLAN={f_vlan}, Số MAC trên cổng={f_count} (BỎ QUA: Quá nhiều MAC)"))
-                                continue
-
-                            gui_queue.put(("log", f"      - MAC: {f_mac}, Cổng={f_port}, VLAN={f_vlan}, Số MAC trên cổng={f_count}"))
-
-                            if mode == "mac_search":
-                                details = f"MAC={f_mac}, Cổng={f_port}, VLAN={f_vlan}, Số MAC trên cổng={f_count}"
-                                processed_results.append((ip, original_input_mac, "Đã tìm thấy", details))
-                                valid_match_found = True
-                            elif mode == "last4_config":
-                                if f_count < 4 and f_vlan.isdigit() and best_candidate is None:
-                                    best_candidate = (f_port, f_vlan, f_count, f_mac)
-                                    gui_queue.put(("log", f"      -> Chọn ứng viên: {f_mac} trên cổng {f_port} (Số MAC: {f_count}, VLAN: {f_vlan})"))
-                                elif best_candidate:
-                                    gui_queue.put(("log", f"      -> Bỏ qua ứng viên khác: {f_mac} (đã chọn ứng viên)"))
-
-                        if mode == "last4_config":
-                            if best_candidate:
-                                found_port, found_vlan, found_mac_count, found_full_mac_cisco = best_candidate
-                                macs_found_on_this_switch.add(mac_key)
-                            else:
-                                gui_queue.put(("log", f"    Không tìm thấy ứng viên phù hợp (ít hơn 4 MAC, VLAN số) cho *{original_input_mac} để cấu hình VLAN."))
-                                processed_results.append((ip, original_input_mac, "Không có ứng viên phù hợp", "Không có cổng nào có < 4 MAC và VLAN số"))
-                        elif mode == "mac_search" and valid_match_found:
-                            macs_found_on_this_switch.add(mac_key)
-
-                if mode in ["full_mac_config", "last4_config"] and found_port:
-                    if not target_vlan:
-                        gui_queue.put(("log", f"    LỖI NỘI BỘ: Thiếu VLAN đích khi cố gắng cấu hình cho {original_input_mac}"))
-                        continue
-
-                    if not found_vlan.isdigit():
-                        details = f"VLAN hiện tại không phải số ('{found_vlan}') trên cổng {found_port} cho MAC {found_full_mac_cisco}"
-                        gui_queue.put(("log", f"    BỎ QUA: {details}"))
-                        processed_results.append((ip, original_input_mac, "Bỏ qua (VLAN không hợp lệ)", details))
-                        continue
-
-                    if found_mac_count < 4:
-                        if found_vlan == target_vlan:
-                            details = f"Đã ở VLAN mục tiêu {target_vlan} trên cổng {found_port} (MAC: {found_full_mac_cisco}, Số MAC trên cổng: {found_mac_count})"
-                            gui_queue.put(("log", f"    THÔNG TIN: {details}"))
-                            processed_results.append((ip, original_input_mac, "Đã đúng VLAN", details))
-                        else:
-                            gui_queue.put(("log", f"    Đang thử chuyển VLAN: {found_full_mac_cisco} từ {found_vlan} -> {target_vlan} trên cổng {found_port}"))
-                            if configure_vlan(connection, found_port, target_vlan):
-                                details = f"Đã chuyển sang VLAN {target_vlan} trên cổng {found_port} (MAC: {found_full_mac_cisco}, VLAN cũ: {found_vlan}, Số MAC trên cổng: {found_mac_count})"
-                                processed_results.append((ip, original_input_mac, "Đã chuyển VLAN", details))
-                                changes_made_on_this_switch = True
-                            else:
-                                details = f"Không chuyển được sang VLAN {target_vlan} trên cổng {found_port} (MAC: {found_full_mac_cisco}, từ VLAN {found_vlan})"
-                                processed_results.append((ip, original_input_mac, "Chuyển VLAN thất bại", details))
-                    else:
-                        details = f"Cổng {found_port} có {found_mac_count} MAC (>= 4) cho {found_full_mac_cisco}. Bỏ qua."
-                        gui_queue.put(("log", f"    BỎ QUA: {details}"))
-                        processed_results.append((ip, original_input_mac, "Bỏ qua (Cổng >=4 MACs)", details))
-                elif mac_key not in macs_found_on_this_switch and mode != "mac_search":
-                    gui_queue.put(("log", f"    Không tìm thấy '{original_input_mac}' trên {ip}."))
-
-            pending_macs -= macs_found_on_this_switch
-
-            if changes_made_on_this_switch:
-                switches_needing_save.add(ip)
-                gui_queue.put(("log", f"--- Switch {ip} được đánh dấu để lưu cấu hình ---"))
-
-        except Exception as e:
-            logger.exception(f"[{thread_name}] Lỗi không xác định khi xử lý switch {ip} (MAC modes)")
-            gui_queue.put(("log", f"LỖI NGHIÊM TRỌNG khi xử lý {ip} (MAC modes): {e}"))
-        finally:
-            disconnect_device(connection, ip)
-            connection = None
-
-    if switches_needing_save:
-        gui_queue.put(("log", "\n--- Đang lưu cấu hình cho các switch đã thay đổi ---"))
-        gui_queue.put(("status", "Đang lưu cấu hình..."))
-        save_count = 0
-        total_saves = len(switches_needing_save)
-        gui_queue.put(("progress", (0, total_saves)))
-
-        sorted_ips_to_save = sorted(list(switches_needing_save))
-        for ip_to_save in sorted_ips_to_save:
-            save_count += 1
-            gui_queue.put(("status", f"Đang lưu cấu hình trên {ip_to_save} ({save_count}/{total_saves})..."))
-            gui_queue.put(("progress", (save_count, total_saves)))
-
-            save_conn, status_msg = connect_to_device(ip_to_save, username, password)
-            gui_queue.put(("log", status_msg))
-            if save_conn:
-                save_success = save_configuration(save_conn)
-                disconnect_device(save_conn, ip_to_save)
-                if not save_success:
-                    gui_queue.put(("messagebox", ("warning", f"Không lưu được cấu hình trên {ip_to_save}. Vui lòng kiểm tra thiết bị thủ công và nhật ký.")))
-            else:
-                gui_queue.put(("log", f"LỖI: Không thể kết nối lại với {ip_to_save} để lưu cấu hình."))
-                gui_queue.put(("messagebox", ("error", f"Không thể kết nối lại với {ip_to_save} để lưu cấu hình. Vui lòng lưu thủ công!")))
-        gui_queue.put(("progress", (total_saves, total_saves)))
-    elif mode in ["full_mac_config", "last4_config"]:
-        gui_queue.put(("log", "\n--- Không có switch nào cần lưu cấu hình ---"))
-
-    end_time = time.time()
-    duration = end_time - start_time
-    gui_queue.put(("log", f"\n--- Hoàn thành tác vụ: {mode} (Thời gian: {duration:.2f} giây) ---"))
-    final_status = f"{mode} đã hoàn thành."
-
-    gui_queue.put(("log", "--- Tóm tắt kết quả ---"))
-    if processed_results:
-        summary_by_mac = {}
-        for ip, orig_mac, status, details in processed_results:
-            if orig_mac not in summary_by_mac:
-                summary_by_mac[orig_mac] = []
-            summary_by_mac[orig_mac].append(f"  - Trên {ip}: Trạng thái='{status}', Chi tiết='{details}'")
-
-        for orig_mac in sorted(summary_by_mac.keys()):
-            gui_queue.put(("log", f"Mục tiêu: {orig_mac}"))
-            for result_line in summary_by_mac[orig_mac]:
-                gui_queue.put(("log", result_line))
-    else:
-        gui_queue.put(("log", "(Không có kết quả xử lý MAC/4 ký tự cuối cụ thể để hiển thị - có thể do lỗi kết nối hoặc không tìm thấy)"))
-
-    if pending_macs:
-        gui_queue.put(("log", "\n--- Các MAC/4 ký tự cuối KHÔNG tìm thấy hoặc KHÔNG thể xử lý ---"))
-        unfound_originals = sorted([original_mac_map.get(p, p) for p in pending_macs])
-        for mac_orig in unfound_originals:
-            gui_queue.put(("log", f"- {mac_orig}"))
-        final_status += f" ({len(pending_macs)} mục chưa tìm thấy/xử lý)"
-    elif mode != "vlan_switch" and mode != "enable_ho":
-        gui_queue.put(("log", "\n(Tất cả MAC/4 ký tự cuối đã được tìm thấy hoặc không thể xử lý)"))
-        final_status += " (Tất cả mục đã xử lý)"
-
-    gui_queue.put(("status", final_status))
-    gui_queue.put(("messagebox", ("info", f"Tác vụ {mode} hoàn thành trong {duration:.2f} giây. Kiểm tra nhật ký chi tiết.")))
-    gui_queue.put(("progress", (1, 1)))
-    gui_queue.put(("enable_button", mode))
-    logger.info(f"[{thread_name}] Luồng xử lý hoàn thành cho chế độ: {mode}. Thời gian: {duration:.2f}s")
-
 class SwitchManagerApp:
     def __init__(self, root: tk.Tk):
         self.root = root
@@ -766,8 +36,13 @@ class SwitchManagerApp:
         self.root.minsize(800, 650)
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
-        self.active_thread: Optional[threading.Thread] = None
+        self.task_queue = TaskQueue()
+        self.tasks: Dict[str, TaskContext] = {}  # mode -> tác vụ đang chạy hoặc đang chờ của tab đó
         self.buttons: Dict[str, tk.Widget] = {}
+        self.stop_buttons: Dict[str, tk.Button] = {}
+        self.retry_buttons: Dict[str, tk.Button] = {}
+        self.failed_saves: Dict[str, List[str]] = {}  # mode -> switch lưu cấu hình lỗi ở tác vụ gần nhất của tab
+        self.close_when_stopped = False
         self.current_output_widget: Optional[scrolledtext.ScrolledText] = None
         self.current_active_button_mode: Optional[str] = None
         self.tab_widgets: Dict[str, Dict[str, Any]] = {}
@@ -776,6 +51,8 @@ class SwitchManagerApp:
         self.entry_password: Optional[tk.Entry] = None
         self.entry_start_ip: Optional[tk.Entry] = None
         self.entry_end_ip: Optional[tk.Entry] = None
+        self.entry_max_workers: Optional[tk.Entry] = None
+        self.log_history_file = None
 
         self._configure_styles()
         self._create_widgets()
@@ -783,7 +60,7 @@ class SwitchManagerApp:
 
         logger.info(f"Ứng dụng đã khởi động: {APP_NAME} v{APP_VERSION}")
         gui_queue.put(("log", f"--- {APP_NAME} v{APP_VERSION} ---"))
-        gui_queue.put(("log", "Sẵn sàng nhận lệnh. Chọn tab và điền thông tin."))
+        gui_queue.put(("log", "Sẵn sàng nhận lệnh. Chọn tab và điền thông tin.", "INFO"))
 
     def _configure_styles(self):
         self.style = ttk.Style()
@@ -854,6 +131,8 @@ class SwitchManagerApp:
         self.entry_password = self._create_label_entry_grid(common_frame, "Mật khẩu:", 1, 0, is_password=True)
         self.entry_start_ip = self._create_label_entry_grid(common_frame, "IP bắt đầu:", 0, 2)
         self.entry_end_ip = self._create_label_entry_grid(common_frame, "IP kết thúc:", 1, 2)
+        self.entry_max_workers = self._create_label_entry_grid(common_frame, "Số switch song song:", 2, 0, width=6)
+        self.entry_max_workers.insert(0, str(MAX_CONCURRENT_SWITCHES))
 
         self.notebook = ttk.Notebook(self.root, style='TNotebook')
         self.notebook.pack(fill='both', expand=True, padx=10, pady=(0, 0))
@@ -871,8 +150,12 @@ class SwitchManagerApp:
         self.status_label = ttk.Label(status_bar_frame, textvariable=self.status_var, style='Status.TLabel', anchor='w', padding=(5,2))
         self.status_label.pack(side='left', fill='x', expand=True)
 
-        self.progress_bar = ttk.Progressbar(status_bar_frame, orient='horizontal', length=200, mode='determinate', style='Horizontal.TProgressbar')
-        self.progress_bar.pack(side='right', padx=5, pady=2)
+        self.cache_var = tk.StringVar(value="Cache MAC: 0 hit / 0 miss")
+        ttk.Label(status_bar_frame, textvariable=self.cache_var, style='Status.TLabel', anchor='e', padding=(5,2)).pack(side='right')
+
+        self.tasks_var = tk.StringVar()
+        ttk.Label(status_bar_frame, textvariable=self.tasks_var, style='Status.TLabel', anchor='e', padding=(5,2)).pack(side='right')
+        self.update_task_summary()
 
         self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_change)
 
@@ -942,6 +225,21 @@ class SwitchManagerApp:
                 widgets[widget_key] = self._create_mac_input(specific_input_frame, label_text, current_row, 0)
                 current_row += 1
 
+        if mode in READ_ONLY_MODES:
+            # Chế độ cấu hình luôn lấy bảng MAC mới nên chỉ tra cứu mới có lựa chọn này
+            refresh_var = tk.BooleanVar(value=False)
+            tk.Checkbutton(input_outer_frame, text="Làm mới bảng MAC\n(bỏ qua cache)", variable=refresh_var,
+                           bg=self.colors["light_bg"], fg=self.colors["text_dark"], activebackground=self.colors["light_bg"],
+                           font=('Arial', 9), justify='left').pack(side='left', padx=(0, 10))
+            widgets['refresh_mac_cache'] = refresh_var
+
+        if mode == "mac_search":
+            async_var = tk.BooleanVar(value=False)
+            tk.Checkbutton(input_outer_frame, text="Telnet bất đồng bộ\n(quét nhanh, chỉ đọc)", variable=async_var,
+                           bg=self.colors["light_bg"], fg=self.colors["text_dark"], activebackground=self.colors["light_bg"],
+                           font=('Arial', 9), justify='left').pack(side='left', padx=(0, 10))
+            widgets['async_telnet'] = async_var
+
         button_text_map = {
             "full_mac_config": "Chuyển VLAN",
             "last4_config": "Chuyển VLAN",
@@ -962,10 +260,38 @@ class SwitchManagerApp:
                            activebackground=self.colors["primary"], activeforeground=self.colors["text_light"],
                            relief="raised", borderwidth=2, state=tk.NORMAL,
                            disabledforeground=self.colors["disabled_fg"])
-        button.pack(pady=10)
+        button.pack(pady=(10, 4))
         self.buttons[mode] = button
         widgets['button'] = button
 
+        stop_button = tk.Button(button_container, text="Dừng",
+                                command=lambda m=mode: self.stop_task(m),
+                                bg=self.colors["error"], fg=self.colors["text_light"],
+                                font=('Arial', 9, 'bold'), padx=10, pady=2,
+                                relief="raised", borderwidth=1, state=tk.DISABLED,
+                                disabledforeground=self.colors["disabled_fg"])
+        stop_button.pack(pady=(0, 4))
+        self.stop_buttons[mode] = stop_button
+
+        retry_button = tk.Button(button_container, text="Lưu lại",
+                                 command=lambda m=mode: self.start_save_retry(m),
+                                 bg=self.colors["warning"], fg=self.colors["text_light"],
+                                 font=('Arial', 9, 'bold'), padx=10, pady=2,
+                                 relief="raised", borderwidth=1, state=tk.DISABLED,
+                                 disabledforeground=self.colors["disabled_fg"])
+        retry_button.pack(pady=(0, 10))
+        self.retry_buttons[mode] = retry_button
+
+        # Mỗi tab có trạng thái và tiến độ riêng vì nhiều tác vụ có thể chạy cùng lúc
+        progress_frame = ttk.Frame(tab_frame)
+        progress_frame.pack(fill='x', pady=(0, 5))
+        status_var = tk.StringVar(value="Sẵn sàng")
+        ttk.Label(progress_frame, textvariable=status_var, anchor='w').pack(side='left', fill='x', expand=True)
+        progress_bar = ttk.Progressbar(progress_frame, orient='horizontal', length=200, mode='determinate', style='Horizontal.TProgressbar')
+        progress_bar.pack(side='right', padx=5)
+        widgets['status_var'] = status_var
+        widgets['progress'] = progress_bar
+
         output_frame = ttk.LabelFrame(tab_frame, text="Nhật Ký Đầu Ra", padding=5)
         output_frame.pack(fill='both', expand=True)
         output_text = scrolledtext.ScrolledText(output_frame, width=90, height=15,
@@ -1025,6 +351,11 @@ class SwitchManagerApp:
             messagebox.showerror("Lỗi", f"Không thể mở trình duyệt: {e}", parent=self.root)
 
     def log_to_gui(self, message: str, widget: Optional[scrolledtext.ScrolledText] = None, clear_previous: bool = False, level: str = "NORMAL"):
+        self.render_logs([(message, level)], widget=widget, clear_previous=clear_previous)
+
+    def render_logs(self, records: List[Tuple[str, str]], widget: Optional[scrolledtext.ScrolledText] = None, clear_previous: bool = False):
+        # Ghi cả lô vào ô log bằng một lệnh insert; ô log chỉ giữ LOG_WIDGET_MAX_LINES dòng cuối
+        self._write_log_history(records)
         log_widget = widget if widget else self.current_output_widget
         if log_widget and isinstance(log_widget, scrolledtext.ScrolledText):
             try:
@@ -1032,23 +363,15 @@ class SwitchManagerApp:
                 if clear_previous:
                     log_widget.delete(1.0, tk.END)
 
-                tag_to_apply = None
-                message_upper = message.upper()
-                if level == "ERROR" or "LỖI" in message_upper or "FAIL" in message_upper or "THẤT BẠI" in message_upper:
-                    tag_to_apply = "ERROR"
-                elif level == "WARNING" or "CẢNH BÁO" in message_upper or "WARN" in message_upper:
-                    tag_to_apply = "WARNING"
-                elif level == "SUCCESS" or "THÀNH CÔNG" in message_upper or "ĐÃ LƯU" in message_upper or "ĐÃ CHUYỂN" in message_upper:
-                    tag_to_apply = "SUCCESS"
-                elif level == "INFO" or "THÔNG TIN" in message_upper or "ĐANG" in message_upper or "FOUND" in message_upper:
-                    tag_to_apply = "INFO"
-                elif message.strip().startswith(">>>") or message.strip().startswith("Gửi lệnh"):
-                    tag_to_apply = "CMD"
-
-                if tag_to_apply:
-                    log_widget.insert(tk.END, message + '\n', (tag_to_apply,))
-                else:
-                    log_widget.insert(tk.END, message + '\n')
+                insert_args = []
+                for message, level in records:
+                    insert_args.append(message + '\n')
+                    insert_args.append((level,) if level in LOG_TAGS else ())
+                log_widget.insert(tk.END, *insert_args)
+
+                line_count = int(log_widget.index('end-1c').split('.')[0])
+                if line_count > LOG_WIDGET_MAX_LINES:
+                    log_widget.delete(1.0, f"{line_count - LOG_WIDGET_MAX_LINES + 1}.0")
 
                 log_widget.see(tk.END)
                 log_widget.config(state=tk.DISABLED)
@@ -1057,15 +380,29 @@ class SwitchManagerApp:
             except Exception as e:
                 logger.exception(f"Lỗi không xác định khi ghi log vào GUI: {e}")
         else:
-            print(f"LOG (No GUI Widget): {message}")
-            logger.warning(f"log_to_gui được gọi nhưng widget không hợp lệ hoặc chưa sẵn sàng. Message: {message}")
+            for message, _ in records:
+                print(f"LOG (No GUI Widget): {message}")
+            logger.warning(f"render_logs được gọi nhưng widget không hợp lệ hoặc chưa sẵn sàng ({len(records)} dòng log)")
+
+    def _write_log_history(self, records: List[Tuple[str, str]]):
+        if self.log_history_file is False:
+            return
+        try:
+            if self.log_history_file is None:
+                self.log_history_file = open(LOG_HISTORY_FILE, 'a', encoding='utf-8')
+            timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+            self.log_history_file.write(''.join(f"{timestamp} [{level}] {message}\n" for message, level in records))
+            self.log_history_file.flush()
+        except OSError as e:
+            logger.error(f"Không ghi được lịch sử log vào {LOG_HISTORY_FILE}: {e}")
+            self.log_history_file = False
 
     def start_task(self, mode: str):
         logger.info(f"Đang thử bắt đầu tác vụ: {mode}")
 
-        if self.active_thread and self.active_thread.is_alive():
-            messagebox.showwarning("Đang bận", "Một tác vụ khác đang chạy. Vui lòng đợi.", parent=self.root)
-            logger.warning("Đã thử bắt đầu tác vụ trong khi tác vụ khác đang chạy.")
+        if mode in self.tasks:
+            messagebox.showwarning("Đang bận", "Tab này đang có tác vụ chạy hoặc đang chờ. Vui lòng đợi hoặc bấm Dừng.", parent=self.root)
+            logger.warning(f"Đã thử bắt đầu tác vụ {mode} trong khi tác vụ cùng tab đang chạy.")
             return
 
         current_widgets = self.tab_widgets.get(mode)
@@ -1101,16 +438,21 @@ class SwitchManagerApp:
                 messagebox.showerror("Lỗi Định Dạng IP", "Địa chỉ IP Bắt đầu hoặc Kết thúc không hợp lệ.", parent=self.root)
                 return
 
-            restricted_users = ["vietnd", "vietnd1"]
-            if username.lower() in restricted_users:
+            if username.lower() in RESTRICTED_USERNAMES:
                 messagebox.showerror("Lỗi Người Dùng", "Tên và mật khẩu không đúng.", parent=self.root)
                 logger.warning(f"user pass sai: {username}")
                 return
 
+            max_workers_raw = self.entry_max_workers.get().strip() or str(MAX_CONCURRENT_SWITCHES)
+            if not max_workers_raw.isdigit() or not (1 <= int(max_workers_raw) <= MAX_CONCURRENT_SWITCHES_LIMIT):
+                messagebox.showerror("Lỗi Số Luồng", f"Số switch song song phải là số từ 1-{MAX_CONCURRENT_SWITCHES_LIMIT}.", parent=self.root)
+                return
+
             task_details["username"] = username
             task_details["password"] = password
             task_details["start_ip"] = start_ip
             task_details["end_ip"] = end_ip
+            task_details["max_workers"] = int(max_workers_raw)
 
         except AttributeError as e:
             logger.critical(f"Các trường nhập liệu chung không được khởi tạo đúng cách: {e}")
@@ -1171,7 +513,52 @@ class SwitchManagerApp:
 
         task_details["mac_list"] = mac_list
 
-        start_log_msg = f"--- Bắt đầu tác vụ: {mode} ({time.strftime('%Y-%m-%d %H:%M:%S')}) ---"
+        async_var = current_widgets.get('async_telnet')
+        if async_var is not None:
+            task_details["async_telnet"] = bool(async_var.get())
+
+        refresh_var = current_widgets.get('refresh_mac_cache')
+        if refresh_var is not None:
+            task_details["refresh_mac_cache"] = bool(refresh_var.get())
+
+        task_details["timings_file"] = PHASE_TIMINGS_FILE
+        task_details["inventory_db"] = INVENTORY_DB_FILE
+
+        self._submit_task(mode, task_details)
+
+    def start_save_retry(self, mode: str):
+        # Lưu lại ngay các switch lưu cấu hình lỗi ở tác vụ trước của tab, dùng tài khoản đang nhập
+        failed_ips = self.failed_saves.get(mode)
+        if not failed_ips:
+            return
+        if mode in self.tasks:
+            messagebox.showwarning("Đang bận", "Tab này đang có tác vụ chạy hoặc đang chờ. Vui lòng đợi hoặc bấm Dừng.", parent=self.root)
+            return
+        username = self.entry_username.get().strip()
+        password = self.entry_password.get()
+        if not username or not password:
+            messagebox.showerror("Thiếu Thông Tin Chung", "Vui lòng nhập tên người dùng và mật khẩu.", parent=self.root)
+            return
+        if username.lower() in RESTRICTED_USERNAMES:
+            messagebox.showerror("Lỗi Người Dùng", "Tên và mật khẩu không đúng.", parent=self.root)
+            return
+        max_workers_raw = self.entry_max_workers.get().strip()
+        task_details = {
+            "mode": "save_retry",
+            "username": username,
+            "password": password,
+            "ips": list(failed_ips),
+            "max_workers": int(max_workers_raw) if max_workers_raw.isdigit() else MAX_CONCURRENT_SWITCHES,
+            "timings_file": PHASE_TIMINGS_FILE,
+            "inventory_db": INVENTORY_DB_FILE,
+        }
+        self._submit_task(mode, task_details)
+
+    def _submit_task(self, mode: str, task_details: Dict[str, Any]):
+        # mode: tab hiển thị tác vụ; task_details["mode"] có thể khác (save_retry chạy trên tab của tác vụ gốc)
+        current_widgets = self.tab_widgets[mode]
+        output_widget = current_widgets['output']
+        start_log_msg = f"--- Bắt đầu tác vụ: {task_details['mode']} ({time.strftime('%Y-%m-%d %H:%M:%S')}) ---"
         self.log_to_gui(start_log_msg, widget=output_widget, clear_previous=True, level="INFO")
         logger.info(start_log_msg)
 
@@ -1181,35 +568,62 @@ class SwitchManagerApp:
         else:
             logger.warning(f"Không tìm thấy hoặc không thể vô hiệu hóa nút cho chế độ {mode}")
 
-        self.status_var.set(f"{mode} đang khởi động...")
-        self.progress_bar['value'] = 0
-        self.progress_bar['maximum'] = 100
+        stop_button = self.stop_buttons.get(mode)
+        if stop_button:
+            stop_button.config(text="Dừng", state=tk.NORMAL)
+
+        self.failed_saves.pop(mode, None)
+        self.retry_buttons[mode].config(text="Lưu lại", state=tk.DISABLED)
 
-        gui_queue.put(("set_output_widget", output_widget))
-        self.current_active_button_mode = mode
+        current_widgets['status_var'].set(f"{task_details['mode']} đang khởi động...")
+        current_widgets['progress']['value'] = 0
+        current_widgets['progress']['maximum'] = 100
 
-        self.active_thread = threading.Thread(
-            target=task_worker,
-            args=(task_details,),
-            name=f"Worker-{mode}",
-            daemon=True
-        )
-        log_details = {k: v for k, v in task_details.items() if k != 'password'}
-        logger.info(f"Bắt đầu luồng xử lý '{self.active_thread.name}' với chi tiết: {log_details}")
-        self.active_thread.start()
+        task = TaskContext(mode)
+        self.tasks[mode] = task
+        position = self.task_queue.submit(task_details, task)
+        if position:
+            current_widgets['status_var'].set(f"Đang chờ trong hàng đợi (vị trí {position})...")
+            self.log_to_gui(f"Đã đủ {self.task_queue.max_tasks} tác vụ đang chạy, tác vụ này chờ ở vị trí {position} "
+                            f"trong hàng đợi.", widget=output_widget, level="INFO")
+        self.update_task_summary()
 
     def check_queue(self):
+        # Hàng đợi chung (thông báo của ứng dụng) và hàng đợi riêng của từng tác vụ; mỗi khung hình
+        # xử lý tối đa GUI_QUEUE_BATCH_SIZE sự kiện mỗi hàng đợi
+        handled = self._drain_queue(gui_queue, None)
+        for mode, task in list(self.tasks.items()):
+            handled = max(handled, self._drain_queue(task.events, mode))
+        self.update_task_summary()
+        self.root.after(GUI_QUEUE_BACKLOG_POLL_MS if handled >= GUI_QUEUE_BATCH_SIZE else GUI_QUEUE_POLL_MS, self.check_queue)
+
+    def _drain_queue(self, event_queue: queue.Queue, mode: Optional[str]) -> int:
+        # mode: tab của tác vụ sở hữu hàng đợi; None với hàng đợi chung. Các dòng log liên tiếp được ghi một lần
+        widgets = self.tab_widgets.get(mode, {}) if mode else {}
+        output_widget = widgets.get('output')
+        pending_logs: List[Tuple[str, str]] = []
+        handled = 0
         try:
-            while True:
-                message = gui_queue.get_nowait()
+            while handled < GUI_QUEUE_BATCH_SIZE:
+                message = event_queue.get_nowait()
+                handled += 1
                 msg_type = message[0]
                 msg_data = message[1]
 
                 if msg_type == "log":
-                    self.log_to_gui(msg_data)
+                    pending_logs.append((msg_data, message[2] if len(message) > 2 else "NORMAL"))
+                    continue
+
+                # Sự kiện khác có thể đổi ô log hoặc mở hộp thoại: ghi các dòng log trước đó trước
+                if pending_logs:
+                    self.render_logs(pending_logs, widget=output_widget)
+                    pending_logs = []
 
-                elif msg_type == "status":
-                    self.status_var.set(msg_data)
+                if msg_type == "status":
+                    if widgets:
+                        widgets['status_var'].set(msg_data)
+                    else:
+                        self.status_var.set(msg_data)
 
                 elif msg_type == "messagebox":
                     level, text = msg_data
@@ -1221,33 +635,27 @@ class SwitchManagerApp:
                         messagebox.showerror("Lỗi", text, parent=self.root)
 
                 elif msg_type == "progress":
+                    progress_bar = widgets.get('progress')
+                    if progress_bar is None:
+                        continue
                     current, total = msg_data
                     if total > 0 and current >= 0:
-                        self.progress_bar['maximum'] = total
-                        self.progress_bar['value'] = min(current, total)
-                    else:
-                        self.progress_bar['maximum'] = 1
-                        self.progress_bar['value'] = 1
-
-                elif msg_type == "set_output_widget":
-                    if isinstance(msg_data, scrolledtext.ScrolledText):
-                        self.current_output_widget = msg_data
+                        progress_bar['maximum'] = total
+                        progress_bar['value'] = min(current, total)
                     else:
-                        logger.warning(f"Queue yêu cầu đặt widget output không hợp lệ: {type(msg_data)}")
+                        progress_bar['maximum'] = 1
+                        progress_bar['value'] = 1
 
-                elif msg_type == "enable_button":
-                    button_mode = msg_data
-                    button_to_enable = self.buttons.get(button_mode)
+                elif msg_type == "cache_stats":
+                    hits, misses = msg_data
+                    self.cache_var.set(f"Cache MAC: {hits} hit / {misses} miss")
 
-                    if button_to_enable and isinstance(button_to_enable, tk.Button):
-                        original_text = self.original_button_texts.get(button_mode, 'Bắt Đầu')
-                        button_to_enable.config(text=original_text, state=tk.NORMAL, bg=self.colors["secondary"], fg=self.colors["text_light"])
-                    else:
-                        logger.warning(f"Yêu cầu kích hoạt nút cho chế độ '{button_mode}', nhưng nút không được tìm thấy hoặc không phải tk.Button.")
+                elif msg_type == "save_failed":
+                    if mode:
+                        self.failed_saves[mode] = list(msg_data)
 
-                    if self.current_active_button_mode == button_mode:
-                        self.active_thread = None
-                        self.current_active_button_mode = None
+                elif msg_type == "enable_button":
+                    self._finish_task(mode or msg_data)
 
         except queue.Empty:
             pass
@@ -1258,23 +666,98 @@ class SwitchManagerApp:
             except tk.TclError:
                 print(f"Lỗi GUI Queue (không thể cập nhật status bar): {e}")
 
-        self.root.after(150, self.check_queue)
+        if pending_logs:
+            self.render_logs(pending_logs, widget=output_widget)
+        return handled
+
+    def _finish_task(self, mode: str):
+        button_to_enable = self.buttons.get(mode)
+        if button_to_enable and isinstance(button_to_enable, tk.Button):
+            original_text = self.original_button_texts.get(mode, 'Bắt Đầu')
+            button_to_enable.config(text=original_text, state=tk.NORMAL, bg=self.colors["secondary"], fg=self.colors["text_light"])
+        else:
+            logger.warning(f"Yêu cầu kích hoạt nút cho chế độ '{mode}', nhưng nút không được tìm thấy hoặc không phải tk.Button.")
+
+        stop_button = self.stop_buttons.get(mode)
+        if stop_button:
+            stop_button.config(text="Dừng", state=tk.DISABLED)
+
+        failed_ips = self.failed_saves.get(mode)
+        if failed_ips:
+            self.retry_buttons[mode].config(text=f"Lưu lại {len(failed_ips)} switch lỗi", state=tk.NORMAL)
+
+        self.tasks.pop(mode, None)
+        self.update_task_summary()
+        if self.close_when_stopped and not self.tasks:
+            self.root.after(GUI_QUEUE_POLL_MS, self.on_closing)
+
+    def update_task_summary(self):
+        running, waiting = self.task_queue.counts()
+        in_use, max_connections, locked = device_scheduler.stats()
+        self.tasks_var.set(f"Tác vụ: {running} chạy / {waiting} chờ | Phiên Telnet: {in_use}/{max_connections} | "
+                           f"Switch đang khóa: {locked}")
+
+    def stop_task(self, mode: str):
+        task = self.tasks.get(mode)
+        if task is None:
+            return
+        widgets = self.tab_widgets[mode]
+        if self.task_queue.cancel(task):
+            # Tác vụ chưa bắt đầu: rút khỏi hàng đợi, không có switch nào bị chạm tới
+            self.log_to_gui("--- Đã hủy tác vụ đang chờ trong hàng đợi ---", widget=widgets['output'], level="WARNING")
+            widgets['status_var'].set(f"{mode} đã hủy")
+            self._finish_task(mode)
+            return
+        stop_button = self.stop_buttons.get(mode)
+        if stop_button:
+            stop_button.config(text="Đang dừng...", state=tk.DISABLED)
+        widgets['status_var'].set(f"Đang dừng {mode}: chờ các switch đang xử lý hoàn tất và lưu cấu hình...")
+        self.log_to_gui("--- Đã yêu cầu dừng: không mở thêm switch mới, các switch đang xử lý sẽ hoàn tất lệnh hiện tại, "
+                        "lưu cấu hình nếu cần và ngắt kết nối ---", widget=widgets['output'], level="WARNING")
+        logger.warning(f"Người dùng yêu cầu dừng tác vụ {mode}")
 
     def on_closing(self):
-        if self.active_thread and self.active_thread.is_alive():
-            if messagebox.askokcancel("Thoát Ứng Dụng",
-                                     "Một tác vụ mạng đang chạy.\n"
-                                     "Việc thoát ngay bây giờ có thể khiến cấu hình chưa hoàn tất hoặc chưa được lưu.\n\n"
-                                     "Bạn có chắc chắn muốn thoát?",
-                                     icon='warning', parent=self.root):
-                logger.warning("Ứng dụng bị đóng bởi người dùng trong khi tác vụ đang chạy.")
-                self.root.destroy()
-            else:
+        if self.tasks:
+            if self.close_when_stopped:
+                return
+            answer = messagebox.askyesnocancel("Thoát Ứng Dụng",
+                                               f"{len(self.tasks)} tác vụ mạng đang chạy hoặc đang chờ.\n\n"
+                                               "Có: Dừng các tác vụ an toàn (hoàn tất lệnh đang gửi, lưu cấu hình) rồi thoát.\n"
+                                               "Không: Thoát ngay - cấu hình có thể chưa hoàn tất hoặc chưa được lưu.\n"
+                                               "Hủy: Tiếp tục chạy.",
+                                               icon='warning', parent=self.root)
+            if answer is None:
                 return
+            if answer:
+                self.close_when_stopped = True
+                for mode in list(self.tasks):
+                    self.stop_task(mode)
+                return
+            logger.warning("Ứng dụng bị đóng bởi người dùng trong khi tác vụ đang chạy.")
+            self._close_log_history()
+            # Ghi nốt các MAC đang chờ trong bộ đệm của kho; luồng worker còn chạy sẽ bỏ qua kho đã đóng
+            self._close_inventory()
+            self.root.destroy()
         else:
             logger.info("Ứng dụng đóng bình thường.")
+            self._close_log_history()
+            self._close_inventory()
             self.root.destroy()
 
+    def _close_inventory(self):
+        try:
+            endpoint_inventory.close()
+        except sqlite3.Error as e:
+            logger.error(f"Không ghi được dữ liệu còn lại vào kho thiết bị đầu cuối khi thoát: {e}")
+
+    def _close_log_history(self):
+        if self.log_history_file:
+            try:
+                self.log_history_file.close()
+            except OSError:
+                pass
+        self.log_history_file = False
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = SwitchManagerApp(root)